@@ -1,17 +1,42 @@
 # backend/app.py
 import os
+import asyncio
 import logging
-from io import BytesIO
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
-from fastapi.staticfiles import StaticFiles
-from PIL import Image
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import text
 
-from .database import Base, engine
+from . import config, metrics
+from .database import SessionLocal, engine as db_engine, init_db
+from .services.media_index import RepairJob, index as media_index
+from .services.compositor import layer_cache
+from .services.response_cache import cache as response_cache
+from .services.similarity import index as similarity_index
+from .services.importer import shutdown_executor as shutdown_import_pool
+from .services import atlas, changes, jobs, pipeline  # noqa: F401  (pipeline registrerer jobbtypene)
+from .services.response_cache import bump_clothes, bump_looks
+from .services.uploads import MaxBodySizeMiddleware, UploadTooLarge, spool_upload
+from .static_files import FrontendFiles, MediaFiles, precompress
 from .routers import clothes as clothes_router
 from .routers import looks as looks_router
+from .routers import search as search_router
+from .routers import jobs as jobs_router
+from .routers import archive as archive_router
+from .routers import changes as changes_router
+from .services.rembg_service import (
+    QueueFullError,
+    cached_result as rembg_cached_result,
+    engine as rembg_engine,
+    init_rembg,
+    model_state as rembg_model_state,
+    start_warmup as start_rembg_warmup,
+    wait_ready as rembg_wait_ready,
+    remove_bg_upload,
+    result_cache as rembg_result_cache,
+    remove_bg_pil,  # noqa: F401  (brukes av skript som importerer fra app)
+)
 
 
 # -----------------------------
@@ -23,10 +48,19 @@ logging.basicConfig(level=logging.INFO)
 # -----------------------------
 # DB-tabeller
 # -----------------------------
-Base.metadata.create_all(bind=engine)
+init_db()
 
 app = FastAPI(title="Looksy API")
 
+# Stopp for store forespørsler før multipart-parseren skriver dem til disk
+# (lagt til før CORS, så CORS-headerne også kommer med på 413-svaret)
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    max_bytes=config.UPLOAD_MAX_REQUEST_BYTES,
+    overrides={"/api/clothes/batch": config.IMPORT_MAX_REQUEST_BYTES,
+               "/api/import": config.ARCHIVE_MAX_BYTES},
+)
+
 # -----------------------------
 # CORS (åpent for testing)
 # -----------------------------
@@ -38,6 +72,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -----------------------------
+# Metrikker (/metrics) – ytterst, så hele forespørselen måles
+# -----------------------------
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(db_engine)
+
 # -----------------------------
 # Statisk: media + frontend
 # -----------------------------
@@ -49,101 +90,281 @@ BASE_DIR = os.path.dirname(__file__)
 PROJECT_ROOT = os.path.dirname(BASE_DIR)
 
 # 1) /media for opplastede bilder
-MEDIA_DIR = os.path.join(BASE_DIR, "media")
+MEDIA_DIR = config.MEDIA_DIR
 os.makedirs(MEDIA_DIR, exist_ok=True)
-app.mount("/media", StaticFiles(directory=MEDIA_DIR), name="media")
+app.mount("/media", MediaFiles(directory=MEDIA_DIR), name="media")
+
+# Minneindeks over MEDIA_DIR + bakgrunnsreparasjon av look.image_url
+_media_repair = RepairJob(SessionLocal)
+
+
+@app.on_event("startup")
+def _start_media_index():
+    media_index.scan()
+    logger.info(f"Media-indeks: {len(media_index)} filer.")
+    media_index.start(on_change=_media_repair.schedule)
+    _media_repair.schedule()
+
+
+@app.on_event("shutdown")
+def _stop_media_index():
+    media_index.stop()
+    _media_repair.cancel()
+
+
+# Likhetsindeksen (plagg som ligner): last fra disk, synk mot databasen i bakgrunnen
+@app.on_event("startup")
+def _load_similarity_index():
+    if similarity_index.load():
+        logger.info(f"Likhetsindeks: {len(similarity_index)} plagg fra disk.")
+    similarity_index.sync_in_background(SessionLocal)
+
+
+@app.on_event("shutdown")
+def _save_similarity_index():
+    similarity_index.flush()
 
 # 2) Frontend (alle statiske filer under /static)
-HOME_DIR    = os.path.join(PROJECT_ROOT, "frontend", "show_home")
-UPLOAD_DIR  = os.path.join(PROJECT_ROOT, "frontend", "show_upload")
-CLOTHES_DIR = os.path.join(PROJECT_ROOT, "frontend", "show_clothes")
-LAGLOOKS_DIR = os.path.join(PROJECT_ROOT, "frontend", "show_lag_looks") 
+FRONTEND_DIR = os.path.join(PROJECT_ROOT, "frontend")
+HOME_DIR    = os.path.join(FRONTEND_DIR, "show_home")
+UPLOAD_DIR  = os.path.join(FRONTEND_DIR, "show_upload")
+CLOTHES_DIR = os.path.join(FRONTEND_DIR, "show_clothes")
+LAGLOOKS_DIR = os.path.join(FRONTEND_DIR, "show_lag_looks")
+
+frontend_files = FrontendFiles(
+    directory=FRONTEND_DIR,
+    precompressed_dir=config.STATIC_CACHE_DIR if config.STATIC_PRECOMPRESS else None,
+)
+app.mount("/static", frontend_files, name="static")
+
+
+@app.on_event("startup")
+def _prepare_frontend():
+    if config.STATIC_PRECOMPRESS:
+        n = precompress(FRONTEND_DIR, config.STATIC_CACHE_DIR)
+        if n:
+            logger.info(f"Frontend: {n} gzip/brotli-varianter oppdatert.")
+    frontend_files.warm()
 
-app.mount("/static", StaticFiles(directory=os.path.join(PROJECT_ROOT, "frontend")), name="static")
+
+async def _page(page_dir: str, request: Request) -> Response:
+    """Sidene serveres som /static, med samme ETag/304 og komprimering."""
+    rel = os.path.relpath(os.path.join(page_dir, "index.html"), FRONTEND_DIR)
+    return await frontend_files.get_response(rel, request.scope)
 
 @app.get("/", include_in_schema=False)
-def home_page():
-    return FileResponse(os.path.join(HOME_DIR, "index.html"))
+async def home_page(request: Request):
+    return await _page(HOME_DIR, request)
 
 @app.get("/upload", include_in_schema=False)
-def upload_page():
-    return FileResponse(os.path.join(UPLOAD_DIR, "index.html"))
+async def upload_page(request: Request):
+    return await _page(UPLOAD_DIR, request)
 
 @app.get("/clothes", include_in_schema=False)
-def clothes_page():
-    return FileResponse(os.path.join(CLOTHES_DIR, "index.html"))
+async def clothes_page(request: Request):
+    return await _page(CLOTHES_DIR, request)
 
 @app.get("/lag-looks", include_in_schema=False)
-def lag_looks_page():
-    return FileResponse(os.path.join(LAGLOOKS_DIR, "index.html"))
+async def lag_looks_page(request: Request):
+    return await _page(LAGLOOKS_DIR, request)
 
 @app.get("/looks", include_in_schema=False)
-def looks_page_alias():
-    return FileResponse(os.path.join(LAGLOOKS_DIR, "index.html"))
+async def looks_page_alias(request: Request):
+    return await _page(LAGLOOKS_DIR, request)
 # -----------------------------
 # Bakgrunnsfjerner (rembg)
 # -----------------------------
-try:
-    from rembg import remove, new_session  # type: ignore
-
-    _rembg_session = None
-    _rembg_model = None
-    for _model in ("u2net", "u2netp", "u2net_human_seg", "isnet-general"):
-        try:
-            _rembg_session = new_session(_model)
-            _rembg_model = _model
-            break
-        except Exception:
-            continue
-
-    if _rembg_session is None:
-        raise RuntimeError("Ingen støttet rembg-modell funket")
-
-    REMBG_OK = True
-    logger.info(f"REMBG: OK – session initialised ({_rembg_model}).")
-except Exception as e:
-    REMBG_OK = False
-    logger.warning(f"REMBG: NOT OK – falling back. Error: {e}")
-
-def remove_bg_pil(pil_image: Image.Image) -> Image.Image:
-    """Fjern bakgrunn hvis rembg finnes, ellers bare konverter til RGBA."""
-    try:
-        pil_image = pil_image.convert("RGB")
-        pil_image.thumbnail((2048, 2048))
-    except Exception:
-        pass
+# Modellen lastes ikke her (det gjorde oppstart og --reload trege), men i
+# bakgrunnen etter oppstart – eller nå, hvis den skal deles av forkede workere.
+if config.REMBG_LOAD == "preload":
+    init_rembg(single_threaded=True)
+
 
-    if REMBG_OK:
-        buf_in = BytesIO()
-        pil_image.save(buf_in, format="PNG")
-        out_bytes = remove(buf_in.getvalue(), session=_rembg_session)
-        out_img = Image.open(BytesIO(out_bytes)).convert("RGBA")
-        return out_img
+@app.on_event("startup")
+def _warm_rembg():
+    if config.REMBG_LOAD == "startup":
+        start_rembg_warmup()
+
+
+@app.on_event("shutdown")
+def _stop_rembg_engine():
+    rembg_engine.stop()
 
-    logger.warning("Fallback i bruk – bakgrunn fjernes ikke.")
-    return pil_image.convert("RGBA")
 
 @app.post("/remove-bg", response_class=Response, tags=["utils"])
 async def remove_bg_endpoint(file: UploadFile = File(...)):
     try:
-        content = await file.read()
-        img = Image.open(BytesIO(content))
-    except Exception:
+        upload = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not upload.size:
+        upload.close()
+        raise HTTPException(status_code=400, detail="Ugyldig bilde")
+
+    # samme bilde før: svar fra cachen uten å vente på at modellen er lastet
+    cached = await rembg_cached_result(upload)
+    if cached is not None:
+        upload.close()
+        return Response(content=cached, media_type="image/png")
+
+    if not await rembg_wait_ready(config.REMBG_LOAD_WAIT_S):
+        upload.close()
+        raise HTTPException(
+            status_code=503,
+            detail="Bakgrunnsfjerneren starter – prøv igjen straks.",
+            headers={"Retry-After": str(config.REMBG_RETRY_AFTER_S)},
+        )
+
+    try:
+        png = await remove_bg_upload(upload)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Bakgrunnsfjerneren er opptatt – prøv igjen straks.",
+            headers={"Retry-After": str(config.REMBG_RETRY_AFTER_S)},
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Bakgrunnsfjerning tok for lang tid")
+    except ValueError:
         raise HTTPException(status_code=400, detail="Ugyldig bilde")
+    finally:
+        upload.close()
+    return Response(content=png, media_type="image/png")
 
-    out = remove_bg_pil(img)
-    buf = BytesIO()
-    out.save(buf, format="PNG")
-    buf.seek(0)
-    return Response(content=buf.read(), media_type="image/png")
+
+@app.get("/remove-bg/stats", tags=["utils"])
+def remove_bg_stats():
+    return {**rembg_engine.stats(), "model_state": rembg_model_state(), "cache": rembg_result_cache.stats()}
 
 # -----------------------------
 # API-ruter
 # -----------------------------
 app.include_router(clothes_router.router, prefix="/api")
 app.include_router(looks_router.router,   prefix="/api")
+app.include_router(search_router.router,  prefix="/api")
+app.include_router(jobs_router.router,    prefix="/api")
+app.include_router(archive_router.router, prefix="/api")
+app.include_router(changes_router.router, prefix="/api")
+
+
+@app.on_event("shutdown")
+def _stop_import_pool():
+    shutdown_import_pool()
+
+
+# -----------------------------
+# Jobbkø (services/jobs.py)
+# -----------------------------
+def _jobs_changed(target_types: set) -> None:
+    """Jobber har endret status på plagg/looks – svar i cachen er utdaterte."""
+    if "cloth" in target_types:
+        bump_clothes()          # bumper looks også
+    elif "look" in target_types:
+        bump_looks()
+
+
+job_workers = jobs.Workers(SessionLocal, config.JOBS_WORKERS, on_change=_jobs_changed)
+
+
+@app.on_event("startup")
+def _start_job_workers():
+    job_workers.start()
+
+
+@app.on_event("shutdown")
+def _stop_job_workers():
+    job_workers.stop()
+
+
+# -----------------------------
+# Endringslogg (services/changes.py): vekker SSE-strømmene
+# -----------------------------
+@app.on_event("startup")
+async def _start_change_feed():
+    # likhetsindeksen i denne prosessen følger plagg endret i andre prosesser
+    changes.feed.on_change(lambda: similarity_index.follow_changes(SessionLocal))
+    await changes.feed.start(SessionLocal)
+
+
+@app.on_event("shutdown")
+async def _stop_change_feed():
+    await changes.feed.stop()
+
+
+@app.get("/cache/stats", tags=["utils"])
+def response_cache_stats():
+    return response_cache.stats()
+
+
+def _collect_runtime_metrics():
+    rembg = rembg_engine.stats()
+    model = rembg["model"] or "fallback"
+    lines = metrics.sample_lines("looksy_rembg_queue_depth", "Bilder som venter på bakgrunnsfjerning.",
+                                 {(): rembg["queue_depth"]})
+    lines += metrics.sample_lines("looksy_rembg_queue_size", "Maks kølengde før 503.", {(): rembg["queue_size"]})
+    lines += metrics.sample_lines("looksy_rembg_model_info", "Aktiv rembg-modell.", {(model,): 1}, ("model",))
+    state = rembg_model_state()["state"]
+    lines += metrics.sample_lines("looksy_rembg_model_ready", "1 når rembg-modellen er lastet.",
+                                  {(): 1 if state == "ready" else 0})
+    lines += metrics.sample_lines(
+        "looksy_rembg_images_total", "Bilder behandlet av bakgrunnsfjerneren siden oppstart.",
+        {("processed",): rembg["processed"], ("failed",): rembg["failed"], ("rejected",): rembg["rejected"]},
+        ("result",), kind="counter",
+    )
+    rc = response_cache.stats()
+    lines += metrics.sample_lines("looksy_response_cache_lookups_total", "Oppslag i svar-cachen.",
+                                  {("hit",): rc["hits"], ("miss",): rc["misses"]}, ("result",), kind="counter")
+    lines += metrics.sample_lines("looksy_response_cache_bytes", "Bytes i svar-cachen.", {(): rc["bytes"]})
+    ac = atlas.stats()
+    lines += metrics.sample_lines("looksy_atlas_cache_bytes", "Bytes i diskcachen for sprite-atlas.", {(): ac["bytes"]})
+    lines += metrics.sample_lines("looksy_atlas_tiles_total", "Atlas-ruter bygget siden oppstart.",
+                                  {("reused",): ac["tiles_reused"], ("decoded",): ac["tiles_decoded"]},
+                                  ("source",), kind="counter")
+    lc = layer_cache.stats()
+    lines += metrics.sample_lines("looksy_compositor_cache_bytes", "Bytes i plagglag-cachen.", {(): lc["bytes"]})
+    lines += metrics.sample_lines("looksy_media_files", "Filer i media-indeksen.", {(): len(media_index)})
+    lines += metrics.sample_lines("looksy_similarity_index_items", "Plagg i likhetsindeksen.",
+                                  {(): len(similarity_index)})
+    with SessionLocal() as db:
+        job_counts = jobs.counts(db)
+    lines += metrics.sample_lines("looksy_jobs", "Jobber i køen per type og status.", job_counts, ("kind", "status"))
+    lines += metrics.sample_lines("looksy_job_workers_alive", "Arbeiderprosesser som kjører.",
+                                  {(): job_workers.alive()})
+    lines += metrics.sample_lines("looksy_change_stream_clients", "Åpne SSE-strømmer mot /api/changes/stream.",
+                                  {(): changes.feed.listeners})
+    return lines
+
+
+metrics.add_collector(_collect_runtime_metrics)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not found")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/healthz", tags=["utils"])
 def healthz():
     return {"ok": True}
+
+
+@app.get("/readyz", tags=["utils"])
+def readyz():
+    """
+    Klar for trafikk? 503 mens rembg-modellen laster (eller venter på å
+    starte) eller databasen ikke svarer. En modell som feilet eller er
+    slått av gir fortsatt 200 – da brukes fallback.
+    """
+    model = rembg_model_state()
+    db_ok = True
+    try:
+        with db_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception:
+        db_ok = False
+    waiting = model["state"] == "loading" or (model["state"] == "idle" and config.REMBG_LOAD == "startup")
+    ready = db_ok and not waiting
+    body = {"ready": ready, "database": db_ok, "rembg": model}
+    return JSONResponse(body, status_code=200 if ready else 503)
@@ -0,0 +1,58 @@
+# backend/backfill_renditions.py
+"""
+Lag manglende WebP-renditions for eksisterende bilder i backend/media
+(også i undermappene).
+
+    python -m backend.backfill_renditions          # bare det som mangler
+    python -m backend.backfill_renditions --force  # lag alt på nytt
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import config
+from .services import renditions
+
+MEDIA_DIR = config.MEDIA_DIR
+
+
+def is_master(filename: str) -> bool:
+    return filename.endswith(renditions.MASTER_EXTS) and not filename.startswith(".")
+
+
+def _backfill_one(args):
+    path, force = args
+    try:
+        return path, len(renditions.generate_for_file(path, overwrite=force)), None
+    except Exception as e:  # ødelagte filer skal ikke stoppe hele kjøringen
+        return path, 0, str(e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lag WebP-renditions for media-filer.")
+    parser.add_argument("--force", action="store_true", help="overskriv eksisterende renditions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    files = []
+    for root, dirs, names in os.walk(MEDIA_DIR):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        files.extend(os.path.join(root, f) for f in names if is_master(f))
+    files.sort()
+    if not files:
+        print("Ingen bildefiler i backend/media – ingenting å gjøre.")
+        return
+
+    written = failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        for path, count, err in pool.map(_backfill_one, [(p, args.force) for p in files], chunksize=8):
+            if err:
+                failed += 1
+                print(f"Hoppet over {os.path.basename(path)}: {err}")
+            written += count
+
+    print(f"Backfill ferdig. Skrev {written} renditions for {len(files)} filer ({failed} feilet).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# backend/benchmarks/__init__.py
+"""
+Benchmarks for Looksy.
+
+    python -m backend.benchmarks.dataset --out /tmp/looksy-bench --clothes 500 --looks 100
+    python -m backend.benchmarks.micro   --out /tmp/looksy-bench
+    python -m backend.benchmarks.load    --out /tmp/looksy-bench --serve --concurrency 16
+
+Alt kjøres mot en egen scratch-mappe (database, media og cache), aldri
+mot backend/media eller app.db. Resultatene skrives som JSON, så kjøringer
+kan sammenlignes over tid.
+
+NB: use_scratch() må kalles før noe fra backend (config) importeres,
+siden stiene leses fra miljøet ved import.
+"""
+from __future__ import annotations
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, Optional, Sequence
+
+
+def scratch_env(out_dir: str) -> Dict[str, str]:
+    out_dir = os.path.abspath(out_dir)
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(out_dir, 'bench.db')}",
+        "LOOKSY_MEDIA_DIR": os.path.join(out_dir, "media"),
+        "LOOKSY_CACHE_DIR": os.path.join(out_dir, "cache"),
+        "MEDIA_WATCH": "0",
+    }
+
+
+def use_scratch(out_dir: str) -> None:
+    if "backend.config" in sys.modules:
+        raise RuntimeError("use_scratch() må kalles før backend.config importeres")
+    os.makedirs(out_dir, exist_ok=True)
+    os.environ.update(scratch_env(out_dir))
+
+
+def percentiles(samples_ms: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99 (nærmeste rang), min, maks og snitt i millisekunder."""
+    if not samples_ms:
+        return {"n": 0}
+    s = sorted(samples_ms)
+
+    def pct(p: float) -> float:
+        idx = min(len(s) - 1, max(0, int(round(p / 100 * len(s) + 0.5)) - 1))
+        return round(s[idx], 3)
+
+    return {
+        "n": len(s),
+        "min": round(s[0], 3),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": round(s[-1], 3),
+        "mean": round(sum(s) / len(s), 3),
+    }
+
+
+def run_info() -> Dict[str, Optional[str]]:
+    """Metadata som gjør det mulig å sammenligne rapporter fra ulike commits."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def write_report(report: dict, path: Optional[str]) -> None:
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if path:
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    print(text)
@@ -0,0 +1,139 @@
+# backend/benchmarks/dataset.py
+"""
+Syntetisk garderobe: N plagg og M looks med ekte PNG-er i en scratch-mappe.
+
+    python -m backend.benchmarks.dataset --out /tmp/looksy-bench --clothes 500 --looks 100 --seed 1
+
+Samme --seed gir samme bilder, navn, kategorier og looks. Plaggene går
+gjennom vanlig import (normalisering + renditions), og looks tegnes av
+compositoren, så media og databasen ser ut som i drift.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from io import BytesIO
+from typing import Dict, List
+
+from PIL import Image, ImageDraw
+
+from . import use_scratch
+
+CATEGORIES = ("topp", "underdel", "sko", "tilbehør")
+WORDS = {
+    "topp": ("genser", "t-skjorte", "bluse", "hettegenser", "skjorte"),
+    "underdel": ("jeans", "bukse", "skjørt", "shorts"),
+    "sko": ("sneakers", "boots", "sandaler", "sko"),
+    "tilbehør": ("belte", "caps", "veske", "skjerf", "lue"),
+}
+
+
+def garment_png(rng: random.Random, category: str, size: int) -> bytes:
+    """Et plagg-aktig RGBA-bilde med gjennomsiktig bakgrunn og litt støy."""
+    w, h = size, int(size * 1.25)
+    img = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    color = tuple(rng.randrange(256) for _ in range(3)) + (255,)
+    if category == "topp":
+        draw.polygon([(w * .2, h * .1), (w * .8, h * .1), (w, h * .35), (w * .85, h * .45),
+                      (w * .8, h * .9), (w * .2, h * .9), (w * .15, h * .45), (0, h * .35)], fill=color)
+    elif category == "underdel":
+        draw.polygon([(w * .25, h * .05), (w * .75, h * .05), (w * .85, h * .95), (w * .55, h * .95),
+                      (w * .5, h * .4), (w * .45, h * .95), (w * .15, h * .95)], fill=color)
+    elif category == "sko":
+        draw.rounded_rectangle([w * .05, h * .55, w * .95, h * .8], radius=int(w * .1), fill=color)
+    else:
+        draw.ellipse([w * .2, h * .2, w * .8, h * .7], fill=color)
+    # litt mønster, så PNG-ene ikke er trivielle å komprimere
+    for _ in range(40):
+        x, y = rng.randrange(w), rng.randrange(h)
+        r = rng.randrange(4, max(5, size // 20))
+        shade = tuple(max(0, min(255, c + rng.randint(-60, 60))) for c in color[:3]) + (255,)
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=shade)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def random_layout(rng: random.Random, cloth_ids: List[int]) -> Dict:
+    items = [
+        {
+            "cloth_id": cid,
+            "x": round(rng.uniform(0.0, 0.6), 3),
+            "y": round(rng.uniform(0.0, 0.6), 3),
+            "scale": round(rng.uniform(0.25, 0.45), 3),
+            "z": z,
+        }
+        for z, cid in enumerate(cloth_ids)
+    ]
+    return {"width": 1080, "height": 1350, "background": "#ffffff", "items": items}
+
+
+def generate(clothes: int, looks: int, *, seed: int = 1, image_size: int = 800,
+             items_per_look: int = 4) -> Dict[str, float]:
+    from ..database import SessionLocal, init_db
+    from ..models import Cloth, Look
+    from ..services import compositor, importer
+
+    rng = random.Random(seed)
+    init_db()
+    db = SessionLocal()
+    timings: Dict[str, float] = {}
+    try:
+        t0 = time.perf_counter()
+        items = []
+        for i in range(clothes):
+            cat = CATEGORIES[i % len(CATEGORIES)]
+            name = f"{rng.choice(WORDS[cat])} {i:05d}"
+            items.append(importer.ImportItem(name=name, source=garment_png(rng, cat, image_size), category=cat))
+        timings["generate_png_s"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        res = importer.run_import(db, items)
+        timings["import_s"] = time.perf_counter() - t0
+        if res.failed:
+            raise RuntimeError(f"{len(res.failed)} plagg feilet: {res.failed[:3]}")
+
+        by_cat: Dict[str, List[int]] = {c: [] for c in CATEGORIES}
+        for cid, cat in db.query(Cloth.id, Cloth.category):
+            by_cat[getattr(cat, "value", cat)].append(cid)
+        pool = [c for c in CATEGORIES if by_cat[c]]
+
+        t0 = time.perf_counter()
+        for i in range(looks):
+            cats = pool[:items_per_look] if len(pool) >= items_per_look else pool
+            ids = list(dict.fromkeys(rng.choice(by_cat[c]) for c in cats))
+            layout = random_layout(rng, ids)
+            clothes_by_id = {c.id: c for c in db.query(Cloth).filter(Cloth.id.in_(ids))}
+            look = Look(title=f"Look {i:05d}", layout=layout)
+            look.clothes = list(clothes_by_id.values())
+            db.add(look)
+            compositor.render_look(db, look, force=True, clothes=clothes_by_id)
+            if i % 50 == 49:
+                db.commit()
+        db.commit()
+        timings["looks_s"] = time.perf_counter() - t0
+    finally:
+        db.close()
+        importer.shutdown_executor()
+    return {k: round(v, 3) for k, v in timings.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lag et syntetisk datasett for benchmarks.")
+    parser.add_argument("--out", required=True, help="scratch-mappe (database, media, cache)")
+    parser.add_argument("--clothes", type=int, default=500)
+    parser.add_argument("--looks", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--image-size", type=int, default=800, help="bredde på plaggbildene (px)")
+    args = parser.parse_args(argv)
+
+    use_scratch(args.out)
+    timings = generate(args.clothes, args.looks, seed=args.seed, image_size=args.image_size)
+    print(f"Laget {args.clothes} plagg og {args.looks} looks i {args.out}: {timings}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
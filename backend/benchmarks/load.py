@@ -0,0 +1,190 @@
+# backend/benchmarks/load.py
+"""
+Lokal lasttest av API-et over HTTP.
+
+    # start appen mot scratch-datasettet og kjør 30 s med 16 samtidige klienter
+    python -m backend.benchmarks.load --out /tmp/looksy-bench --serve --concurrency 16 --duration 30
+
+    # eller mot en server som allerede kjører
+    python -m backend.benchmarks.load --url http://127.0.0.1:8000 --concurrency 8 --requests 2000
+
+Rapporten (JSON) har p50/p95/p99, snitt og gjennomstrømning totalt og per
+endepunkt. Krever httpx (og uvicorn for --serve).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from . import percentiles, run_info, scratch_env, write_report
+
+# (navn, sti-mal, vekt). {cloth}/{look}/{thumb} fylles inn fra datasettet.
+SCENARIO: Sequence[Tuple[str, str, int]] = (
+    ("clothes_page", "/api/clothes/?limit=50", 30),
+    ("clothes_fields", "/api/clothes/?limit=100&fields=id,name,thumbnail", 15),
+    ("cloth_detail", "/api/clothes/{cloth}", 15),
+    ("looks_summary", "/api/looks/summary?limit=50", 20),
+    ("look_detail", "/api/looks/{look}", 10),
+    ("looks_suggest", "/api/looks/suggest?limit=50", 5),
+    ("media_thumb", "{thumb}", 10),
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(out_dir: str, port: int, workers: int) -> subprocess.Popen:
+    env = {**os.environ, **scratch_env(out_dir)}
+    cmd = [sys.executable, "-m", "uvicorn", "backend.app:app", "--host", "127.0.0.1",
+           "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, env=env)
+
+
+async def _wait_ready(client, timeout_s: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/healthz")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("Serveren svarte ikke på /healthz")
+
+
+async def _targets(client) -> Dict[str, List[str]]:
+    clothes = (await client.get("/api/clothes/?limit=200&fields=id,thumbnail")).json()
+    looks = (await client.get("/api/looks/?limit=200&fields=id")).json()
+    if not clothes or not looks:
+        raise SystemExit("Tomt datasett – kjør backend.benchmarks.dataset først.")
+    return {
+        "cloth": [str(c["id"]) for c in clothes],
+        "look": [str(lk["id"]) for lk in looks],
+        "thumb": [c["thumbnail"] for c in clothes],
+    }
+
+
+async def run(url: str, concurrency: int, duration_s: Optional[float], total: Optional[int],
+              warmup_s: float, seed: int) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0,
+                                 headers={"Accept": "image/webp,*/*"}) as client:
+        await _wait_ready(client)
+        targets = await _targets(client)
+        names = [n for n, _p, _w in SCENARIO]
+        paths = {n: p for n, p, _w in SCENARIO}
+        weights = [w for _n, _p, w in SCENARIO]
+
+        samples: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        state = {"sent": 0, "measuring": warmup_s <= 0}
+
+        async def worker(wid: int, stop_at: float):
+            rng = random.Random(seed * 1000 + wid)
+            while time.monotonic() < stop_at:
+                if total is not None and state["measuring"]:
+                    if state["sent"] >= total:
+                        return
+                    state["sent"] += 1
+                name = rng.choices(names, weights)[0]
+                path = paths[name].format(**{k: rng.choice(v) for k, v in targets.items()})
+                t0 = time.perf_counter()
+                try:
+                    r = await client.get(path)
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = (time.perf_counter() - t0) * 1000
+                if not state["measuring"]:
+                    continue
+                samples[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+        if warmup_s > 0:
+            await asyncio.gather(*(worker(i, time.monotonic() + warmup_s) for i in range(concurrency)))
+            state["measuring"] = True
+
+        stop_at = time.monotonic() + (duration_s if duration_s else 3600 * 24)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(i, stop_at) for i in range(concurrency)))
+        wall = time.perf_counter() - t0
+
+    all_samples = [s for v in samples.values() for s in v]
+    return {
+        "wall_s": round(wall, 3),
+        "requests": len(all_samples),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(all_samples) / wall, 1) if wall else 0.0,
+        "latency_ms": percentiles(all_samples),
+        "endpoints": {
+            name: {**percentiles(samples[name]), "errors": errors[name]}
+            for name in names if samples[name]
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lasttest av Looksy-API-et over HTTP.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="server som allerede kjører, f.eks. http://127.0.0.1:8000")
+    target.add_argument("--serve", action="store_true", help="start uvicorn mot --out selv")
+    parser.add_argument("--out", help="scratch-mappen fra backend.benchmarks.dataset (med --serve)")
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=None, help="sekunder (standard 20 uten --requests)")
+    parser.add_argument("--requests", type=int, default=None, help="stopp etter så mange forespørsler")
+    parser.add_argument("--warmup", type=float, default=2.0, help="sekunder før målingen starter")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="skriv rapporten hit i tillegg til stdout")
+    args = parser.parse_args(argv)
+    if args.serve and not args.out:
+        parser.error("--serve krever --out")
+    duration = args.duration if args.duration or args.requests else 20.0
+
+    proc = None
+    url = args.url
+    if args.serve:
+        port = _free_port()
+        proc = start_server(args.out, port, args.server_workers)
+        url = f"http://127.0.0.1:{port}"
+    try:
+        results = asyncio.run(run(url, args.concurrency, duration, args.requests, args.warmup, args.seed))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    report = {
+        "kind": "load",
+        "run": run_info(),
+        "params": {
+            "url": None if args.serve else url,
+            "server_workers": args.server_workers if args.serve else None,
+            "concurrency": args.concurrency,
+            "duration_s": duration,
+            "requests": args.requests,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+            "scenario": [{"name": n, "path": p, "weight": w} for n, p, w in SCENARIO],
+        },
+        "results": results,
+    }
+    write_report(report, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# backend/benchmarks/micro.py
+"""
+Mikrobenchmarks for bilde- og serialiseringsstien.
+
+    python -m backend.benchmarks.micro --out /tmp/looksy-bench [--repeat 50] [--json rapport.json]
+
+Krever et datasett i --out (se backend.benchmarks.dataset). Hver måling
+kjøres --repeat ganger etter én oppvarming; tidene rapporteres i ms.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import time
+from io import BytesIO
+from typing import Callable, Dict, List
+
+from PIL import Image
+
+from . import percentiles, run_info, use_scratch, write_report
+
+
+def bench(fn: Callable[[int], object], repeat: int) -> Dict[str, float]:
+    fn(-1)  # oppvarming (imports, cacher, første dekoding)
+    samples: List[float] = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentiles(samples)
+
+
+def run(repeat: int, image_size: int) -> Dict[str, Dict[str, float]]:
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
+    from ..database import SessionLocal
+    from ..models import Look
+    from ..routers.looks import _fix_and_get_image_url
+    from ..schemas import LookOut, to_jsonable
+    from ..services import outfits, rembg_service, serialize
+    from ..services.clothes_service import ClothesService
+    from ..services.media_index import index as media_index
+    from ..services.similarity import index as similarity_index
+    from .dataset import garment_png
+
+    # fallback-stien logger en advarsel per bilde
+    logging.getLogger("looksy").setLevel(logging.ERROR)
+    media_index.scan()
+    rng = random.Random(7)
+    results: Dict[str, Dict[str, float]] = {}
+
+    db = SessionLocal()
+    try:
+        looks = db.query(Look).options(selectinload(Look.clothes)).limit(50).all()
+        if not looks:
+            raise SystemExit("Fant ingen looks – kjør backend.benchmarks.dataset først.")
+
+        # --- _save_png: nytt bilde hver gang (dekod + PNG + renditions), og duplikat ---
+        svc = ClothesService(db)
+        fresh = [garment_png(rng, "topp", image_size) for _ in range(repeat + 1)]
+        results["save_png_new"] = bench(lambda i: svc._save_png(fresh[i]), repeat)
+        results["save_png_duplicate"] = bench(lambda i: svc._save_png(fresh[0]), repeat)
+        db.rollback()  # ingen refcount-endringer igjen i scratch-databasen
+
+        # --- remove_bg_pil, med og uten rembg ---
+        photo = Image.open(BytesIO(garment_png(rng, "underdel", image_size))).convert("RGB")
+        rembg_service.init_rembg()
+        if rembg_service.REMBG_OK:
+            results["remove_bg_pil_rembg"] = bench(lambda i: rembg_service.remove_bg_pil(photo.copy()), repeat)
+        was_ok = rembg_service.REMBG_OK
+        rembg_service.REMBG_OK = False
+        try:
+            results["remove_bg_pil_fallback"] = bench(lambda i: rembg_service.remove_bg_pil(photo.copy()), repeat)
+        finally:
+            rembg_service.REMBG_OK = was_ok
+
+        # --- _fix_and_get_image_url: riktig URL og URL med feil filendelse ---
+        ok_url = looks[0].image_url
+        broken_url = ok_url.rsplit(".", 1)[0] + ".png"
+
+        class _Row:
+            image_url = ok_url
+
+        row = _Row()
+
+        def heal(url):
+            row.image_url = url
+            return _fix_and_get_image_url(row)
+
+        results["fix_image_url_ok"] = bench(lambda i: [heal(ok_url) for _ in range(1000)], repeat)
+        results["fix_image_url_healed"] = bench(lambda i: [heal(broken_url) for _ in range(1000)], repeat)
+
+        # --- serialisering av LookOut (50 looks med plagg) ---
+        results["lookout_serialize_50"] = bench(lambda i: [to_jsonable(LookOut, lk) for lk in looks], repeat)
+
+        # --- hele listen: ORM + skjema + json mot kolonner + serialize (FAST_JSON) ---
+        problem = serialize.check_contract(db)
+        if problem:
+            raise SystemExit(f"Den raske veien avviker fra skjemaene: {problem}")
+        ids = [lk.id for lk in looks]
+
+        def slow_list(i):
+            rows = db.query(Look).options(selectinload(Look.clothes)).filter(Look.id.in_(ids)).all()
+            return serialize._stdlib([to_jsonable(LookOut, lk) for lk in rows])
+
+        def fast_list(i):
+            rows = db.execute(select(*serialize.LOOK_COLUMNS).where(Look.id.in_(ids)))
+            return serialize.dumps(serialize.look_dicts(db, rows))
+
+        results["looks_list_schema_50"] = bench(slow_list, repeat)
+        results["looks_list_fast_50"] = bench(fast_list, repeat)
+
+        # --- antrekksforslag: topp 50 (parmatrisene er cachet etter oppvarmingen) ---
+        similarity_index.sync(db)
+        results["suggest_top50"] = bench(lambda i: outfits.suggest(50), repeat)
+    finally:
+        db.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mikrobenchmarks (ms per kall).")
+    parser.add_argument("--out", required=True, help="scratch-mappen fra backend.benchmarks.dataset")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--image-size", type=int, default=800)
+    parser.add_argument("--json", help="skriv rapporten hit i tillegg til stdout")
+    args = parser.parse_args(argv)
+
+    use_scratch(args.out)
+    report = {
+        "kind": "micro",
+        "run": run_info(),
+        "params": {"repeat": args.repeat, "image_size": args.image_size},
+        "note": "fix_image_url_* måler 1000 kall per gjentakelse",
+        "results": run(args.repeat, args.image_size),
+    }
+    write_report(report, args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# backend/build_similarity_index.py
+"""
+Bygg likhetsindeksen (farger + perseptuell hash) for alle plagg.
+
+    python -m backend.build_similarity_index          # bare det som mangler
+    python -m backend.build_similarity_index --force  # bygg alt på nytt
+
+Appen synker indeksen selv ved oppstart; dette er for store garderober
+eller etter at HIST_BINS/egenskapene er endret.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .database import SessionLocal, init_db
+from .services.similarity import index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bygg likhetsindeksen for plaggene.")
+    parser.add_argument("--force", action="store_true", help="beregn alle egenskaper på nytt")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    init_db()
+    if not args.force:
+        index.load()
+    t0 = time.perf_counter()
+    db = SessionLocal()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            added, removed = index.sync(db, executor=pool)
+    finally:
+        db.close()
+    index.save()
+    print(f"Likhetsindeks ferdig på {time.perf_counter() - t0:.1f} s: "
+          f"+{added} / -{removed} plagg, {len(index)} totalt ({index.path}).")
+
+
+if __name__ == "__main__":
+    main()
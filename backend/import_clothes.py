@@ -0,0 +1,65 @@
+# backend/import_clothes.py
+"""
+Bulk-import av plagg fra en mappe eller en zip-fil.
+
+    python -m backend.import_clothes ~/Bilder/garderobe
+    python -m backend.import_clothes garderobe.zip --category sko
+
+Navn hentes fra filnavnet, kategori gjettes fra navnet hvis ikke
+--category er gitt. Bilder som allerede finnes hoppes over.
+"""
+import argparse
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from . import config
+from .database import SessionLocal, init_db
+from .models import ClothCategory
+from .services import importer
+
+
+def _progress(stage: str, done: int, total: int) -> None:
+    label = {"normalize": "Bilder", "insert": "Rader"}.get(stage, stage)
+    sys.stdout.write(f"\r{label}: {done}/{total}")
+    sys.stdout.flush()
+    if done == total:
+        sys.stdout.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importer plagg fra en mappe eller zip.")
+    parser.add_argument("source", help="mappe eller .zip med JPG/PNG")
+    parser.add_argument("--category", choices=[c.value for c in ClothCategory],
+                        help="bruk denne kategorien for alle (ellers gjettes den)")
+    parser.add_argument("--workers", type=int, default=config.IMPORT_WORKERS)
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        items = importer.items_from_dir(args.source)
+    elif zipfile.is_zipfile(args.source):
+        items = importer.items_from_zip(args.source)
+    else:
+        parser.error(f"{args.source} er verken en mappe eller en zip-fil")
+
+    total = len(items)
+    if args.category:
+        items = (importer.ImportItem(it.name, it.source, args.category) for it in items)
+
+    init_db()
+    started = time.perf_counter()
+    with SessionLocal() as db, ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        res = importer.run_import(db, items, executor=pool, progress=_progress, total=total)
+
+    for f in res.failed:
+        print(f"Hoppet over {f['name']}: {f['error']}")
+    print(
+        f"Import ferdig på {time.perf_counter() - started:.1f}s. "
+        f"La til {res.created}, {res.skipped} fantes fra før, {len(res.failed)} feilet."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# backend/job_worker.py
+"""
+Kjør arbeidere for jobbkøen (services/jobs.py) uten appen, f.eks. når
+appen kjøres med flere web-workere og JOBS_WORKERS=0:
+
+    JOBS_WORKERS=0 gunicorn -w 4 -k uvicorn.workers.UvicornWorker backend.app:app
+    python -m backend.job_worker --processes 2
+
+Jobbtyper med local=True (likhetsindeksen) kjøres fortsatt av appen.
+Ctrl+C stopper etter jobben som kjører nå.
+"""
+import argparse
+import logging
+import multiprocessing
+
+from .database import init_db
+from .services import jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kjør arbeidere for jobbkøen.")
+    parser.add_argument("--processes", type=int, default=1, help="antall arbeiderprosesser")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    procs = [ctx.Process(target=jobs._process_main, args=(stop,), name=f"job-worker-{i}")
+             for i in range(max(1, args.processes))]
+    for p in procs:
+        p.start()
+    print(f"{len(procs)} arbeidere kjører – Ctrl+C for å stoppe.")
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
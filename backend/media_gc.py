@@ -0,0 +1,42 @@
+# backend/media_gc.py
+"""
+Slett media-filer som ingen plagg eller looks peker på lenger (se
+services/media_gc.py), og rapporter hvor mye plass som ble frigjort.
+
+    python -m backend.media_gc                     # slett (grace: MEDIA_GC_GRACE_S)
+    python -m backend.media_gc --dry-run           # bare tell
+    python -m backend.media_gc --grace-hours 1     # også filer eldre enn 1 time
+
+Trygt å kjøre mens serveren går: filer yngre enn grace-perioden røres
+ikke, og serverens medieindeks fanger opp slettingene ved neste rescan.
+"""
+import argparse
+from typing import Optional
+
+from . import config
+from .database import SessionLocal, init_db
+from .services import media_gc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Slett media-filer uten eier og rapporter frigjort plass.")
+    parser.add_argument("--dry-run", action="store_true", help="bare tell, ikke slett")
+    parser.add_argument("--grace-hours", type=float, default=None,
+                        help=f"rør bare filer eldre enn dette (standard {config.MEDIA_GC_GRACE_S / 3600:g})")
+    args = parser.parse_args(argv)
+
+    grace_s: Optional[float] = None if args.grace_hours is None else max(0.0, args.grace_hours * 3600)
+    init_db()
+    with SessionLocal() as db:
+        report = media_gc.collect(db, grace_s=grace_s, dry_run=args.dry_run)
+
+    verb = "Ville slettet" if args.dry_run else "Slettet"
+    print(f"Gikk gjennom {report['scanned_files']} filer: {report['orphans']} uten eier "
+          f"({report['recent_skipped']} for nye til å slettes, "
+          f"{report['changed_skipped']} tatt i bruk underveis).")
+    print(f"{verb} {report['deleted_files']} filer og frigjort "
+          f"{report['freed_bytes'] / 1_000_000:.1f} MB på {report['seconds']:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# backend/metrics.py
+"""
+Enkle metrikker i Prometheus-tekstformat (GET /metrics), uten avhengigheter.
+
+- MetricsMiddleware: latens-histogram per rute-mal/metode/status og
+  antall forespørsler under behandling.
+- instrument_engine(): SQLAlchemy-hendelser på engine teller SQL-setninger
+  og tid – totalt og per forespørsel (via en contextvar som følger
+  forespørselen inn i trådpoolen).
+- stage("decode"): tidtaker for stegene i bildebehandlingen.
+- add_collector(): verdier som leses først når /metrics hentes
+  (rembg-kø, modellnavn, cache-statistikk).
+
+Alt er tellere i minnet bak én lås per metrikk, så det kan stå på hele tiden.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LabelValues = Tuple[str, ...]
+
+# Sekunder: fra raske JSON-oppslag til tung bildebehandling
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per etikett: [antall per bøtte (+Inf sist), sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _num(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# ---------- register ----------
+
+_registry: List[_Metric] = []
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def add_collector(fn: Callable[[], Iterable[str]]) -> None:
+    """fn returnerer ferdige linjer i tekstformatet; kalles ved hver /metrics."""
+    _collectors.append(fn)
+
+
+def sample_lines(name: str, help: str, values: Dict[LabelValues, float],
+                 labelnames: Sequence[str] = (), kind: str = "gauge") -> List[str]:
+    """Hjelper for collectors: én metrikk (gauge/counter) med gitte verdier."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labelnames, k)} {_num(v)}" for k, v in values.items()]
+    return lines
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines += metric.render()
+    for fn in _collectors:
+        try:
+            lines += list(fn())
+        except Exception:  # en feilende collector skal ikke ta ned /metrics
+            continue
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_LATENCY = _register(Histogram(
+    "looksy_http_request_duration_seconds", "Tid per HTTP-forespørsel.",
+    ("method", "route", "status"),
+))
+HTTP_IN_FLIGHT = _register(Gauge(
+    "looksy_http_requests_in_flight", "Forespørsler under behandling nå.",
+))
+DB_STATEMENTS = _register(Counter(
+    "looksy_db_statements_total", "SQL-setninger kjørt.",
+))
+DB_TIME = _register(Counter(
+    "looksy_db_statement_seconds_total", "Samlet tid i SQL-setninger.",
+))
+DB_PER_REQUEST = _register(Histogram(
+    "looksy_db_statements_per_request", "SQL-setninger per HTTP-forespørsel.",
+    ("route",), QUERY_COUNT_BUCKETS,
+))
+DB_TIME_PER_REQUEST = _register(Histogram(
+    "looksy_db_seconds_per_request", "Tid i SQL per HTTP-forespørsel.",
+    ("route",), STAGE_BUCKETS,
+))
+IMAGE_STAGE = _register(Histogram(
+    "looksy_image_stage_seconds",
+    "Tid per steg i bildebehandlingen (decode, thumbnail, rembg, png_encode, renditions, compose, jpeg_encode, disk_write, features).",
+    ("stage",), STAGE_BUCKETS,
+))
+
+
+# ---------- bildesteg ----------
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        IMAGE_STAGE.observe(time.perf_counter() - t0, stage=name)
+
+
+# ---------- SQL ----------
+
+class _RequestDB:
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+_request_db: ContextVar[Optional[_RequestDB]] = ContextVar("looksy_request_db", default=None)
+
+
+def instrument_engine(engine) -> None:
+    """Tell SQL-setninger og -tid på en (synkron) SQLAlchemy-engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._looksy_t0 = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - getattr(context, "_looksy_t0", time.perf_counter())
+        DB_STATEMENTS.inc()
+        DB_TIME.inc(elapsed)
+        current = _request_db.get()
+        if current is not None:
+            current.statements += 1
+            current.seconds += elapsed
+
+
+# ---------- HTTP ----------
+
+def _route_label(scope: Scope) -> str:
+    """Rute-malen (f.eks. /api/clothes/{cloth_id}), ikke selve stien."""
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    regex = getattr(route, "path_regex", None)
+    if template and regex is not None:
+        # Ruter fra include_router(prefix=...) kjenner ikke prefikset selv –
+        # finn den delen av stien som står foran malen.
+        path = scope["path"]
+        if regex.match(path):
+            return template
+        for i, ch in enumerate(path):
+            if ch == "/" and i and regex.match(path[i:]):
+                return path[:i] + template
+        return template
+    if scope.get("endpoint") is not None and scope.get("root_path"):
+        return scope["root_path"]          # Mount, f.eks. /media og /static
+    # Ukjente stier samles i én etikett, så 404-skanning ikke gir nye serier
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        db_stats = _RequestDB()
+        token = _request_db.set(db_stats)
+        HTTP_IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            HTTP_IN_FLIGHT.dec()
+            _request_db.reset(token)
+            route = _route_label(scope)
+            HTTP_LATENCY.observe(elapsed, method=scope["method"], route=route, status=str(status["code"]))
+            DB_PER_REQUEST.observe(db_stats.statements, route=route)
+            DB_TIME_PER_REQUEST.observe(db_stats.seconds, route=route)
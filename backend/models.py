@@ -2,11 +2,12 @@
 from enum import Enum
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey, Index, JSON, Text, func
 from sqlalchemy import Enum as SAEnum
 from sqlalchemy.orm import relationship
 
 from .database import Base
+from .services.renditions import rendition_urls
 
 
 class ClothCategory(str, Enum):
@@ -26,6 +27,14 @@ look_clothes = Table(
 
 class Cloth(Base):
     __tablename__ = "clothes"
+    __table_args__ = (
+        # keyset-paginering per bruker: WHERE user_id = ? [AND category = ?]
+        # ORDER BY created_at DESC, id DESC
+        Index("ix_clothes_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_clothes_user_category_created_id", "user_id", "category", "created_at", "id"),
+        # media_gc: peker noen rader på denne filen?
+        Index("ix_clothes_image_url", "image_url"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=True)
@@ -33,19 +42,109 @@ class Cloth(Base):
     image_url = Column(String, nullable=False)
     category = Column(SAEnum(ClothCategory, native_enum=False), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # "processing" mens bildet behandles i jobbkøen (job_id), så "ready" eller "failed"
+    status = Column(String, nullable=False, default="ready", server_default="ready")
+    job_id = Column(Integer, nullable=True)
+    # sist endret (NULL for rader fra før kolonnen fantes); hva som er endret står i `changes`
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def renditions(self) -> dict:
+        return rendition_urls(self.image_url)
 
 
 class Look(Base):
     __tablename__ = "looks"
+    __table_args__ = (
+        Index("ix_looks_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_looks_image_url", "image_url"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=True)
     title = Column(String, nullable=True)
     image_url = Column(String, nullable=True)     # collage stored under /media/...
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Plassering av plaggene (se schemas.LookLayout) – lar serveren tegne looken på nytt
+    layout = Column(JSON, nullable=True)
+    # Hash av layout + plaggenes bilder da image_url sist ble tegnet
+    render_key = Column(String, nullable=True)
+    # "processing" mens looken tegnes i jobbkøen (job_id), så "ready" eller "failed"
+    status = Column(String, nullable=False, default="ready", server_default="ready")
+    job_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Lastes per spørring (selectinload i lister/detalj) – ikke joinet
+    # inn i hver Look-spørring, som ga én rad per look×plagg.
     clothes = relationship(
         "Cloth",
         secondary=look_clothes,
-        lazy="joined",
+        lazy="select",
+    )
+
+    @property
+    def renditions(self) -> dict:
+        return rendition_urls(self.image_url)
+
+
+class MediaRef(Base):
+    """Referansetelling for innholdsadresserte filer i MEDIA_DIR."""
+    __tablename__ = "media_refs"
+
+    filename = Column(String, primary_key=True)
+    refcount = Column(Integer, nullable=False, default=0)
+
+
+class Job(Base):
+    """Én jobb i køen (se services/jobs.py)."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # neste ledige jobb: WHERE status = 'queued' AND kind = ? AND run_after <= ? ORDER BY id
+        Index("ix_jobs_status_kind_run_after", "status", "kind", "run_after", "id"),
+        # endringer siden sist (svar-cachen i appen)
+        Index("ix_jobs_updated_at", "updated_at"),
     )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")   # queued | running | done | failed
+    # idempotensnøkkel: samme nøkkel to ganger gir samme jobb
+    key = Column(String, nullable=True, unique=True)
+    user_id = Column(Integer, nullable=True)
+    # raden jobben gjelder ("cloth"/"look" + id), som får status "failed" hvis jobben gir opp
+    target_type = Column(String, nullable=True)
+    target_id = Column(Integer, nullable=True)
+    payload = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    progress_done = Column(Integer, nullable=False, default=0)
+    progress_total = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class Change(Base):
+    """
+    Én endring på et plagg eller en look (se services/changes.py). Skrives
+    av triggere på clothes/looks/look_clothes, så alle skriveveier kommer med.
+    id er markøren klientene synker fra.
+    """
+    __tablename__ = "changes"
+    __table_args__ = (
+        # endringer for én bruker etter en markør: WHERE user_id = ? AND id > ?
+        Index("ix_changes_user_id", "user_id", "id"),
+        Index("ix_changes_at", "at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)          # cloth | look
+    target_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    op = Column(String, nullable=False)            # upsert | delete
+    at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
@@ -0,0 +1,69 @@
+# backend/routers/archive.py
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..database import SessionLocal, engine, get_db
+from ..services import archive
+from ..services.response_cache import bump_clothes
+from ..services.similarity import index as similarity_index
+from ..services.uploads import UploadTooLarge, spool_upload
+from ..services.users import current_user_id
+
+router = APIRouter(tags=["archive"])
+
+
+@router.get("/export")
+def export_wardrobe(
+    format: str = Query("zip", description="zip | tar"),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Hele garderoben (plagg, looks, koblinger og bildene) som ett arkiv,
+    strømmet mens det lages. Et konsistent øyeblikksbilde av databasen.
+    """
+    if format not in archive.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Ugyldig format. Gyldige: {', '.join(archive.FORMATS)}")
+    filename = f"looksy-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        archive.export_archive(engine, user_id=user_id, fmt=format),
+        media_type=archive.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+
+def _import(db: Session, fp, user_id: Optional[int]) -> dict:
+    result = archive.import_archive(db, fp, user_id=user_id)
+    for cloth_id in result.pop("changed_clothes"):
+        similarity_index.remove(cloth_id)
+    bump_clothes()
+    similarity_index.sync_in_background(SessionLocal)
+    return result
+
+
+@router.post("/import")
+async def import_wardrobe(
+    file: UploadFile = File(..., description="arkiv fra GET /api/export (zip eller tar)"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Les inn et arkiv fra /api/export: bilder som finnes fra før hoppes
+    over, radene upsertes på id. Kan kjøres flere ganger.
+    """
+    try:
+        upload = await spool_upload(file, max_bytes=config.ARCHIVE_MAX_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    with upload:
+        try:
+            return await run_in_threadpool(_import, db, upload.file, user_id)
+        except archive.ArchiveError as e:
+            raise HTTPException(status_code=400, detail=str(e))
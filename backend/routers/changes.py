@@ -0,0 +1,106 @@
+# backend/routers/changes.py
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..database import SessionLocal, get_db
+from ..services import changes, serialize
+from ..services.changes import CursorGone, feed
+from ..services.pagination import MAX_LIMIT
+from ..services.users import current_user_id
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+
+def _cursor(value: Optional[str]) -> Optional[int]:
+    try:
+        return changes.parse_cursor(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("")
+def get_changes(
+    since: Optional[str] = Query(None, description="markøren fra forrige svar (uten: bare dagens markør)"),
+    limit: int = Query(config.CHANGES_PAGE_SIZE, ge=1, le=MAX_LIMIT),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Plagg og looks som er endret eller slettet etter markøren. Hent
+    markøren (uten since) før listene, og spør så med den. 410 betyr at
+    markøren er for gammel – hent listene på nytt.
+    """
+    cursor = _cursor(since)
+    if cursor is None:
+        out = {"cursor": str(changes.latest(db)), "has_more": False,
+               "clothes": {"upserted": [], "deleted": []}, "looks": {"upserted": [], "deleted": []}}
+    else:
+        try:
+            out = changes.delta(db, cursor, user_id, limit)
+        except CursorGone as e:
+            raise HTTPException(status_code=410, detail=str(e))
+    return Response(serialize.dumps(out), media_type="application/json", headers={"Cache-Control": "no-store"})
+
+
+def _delta(cursor: int, user_id: Optional[int]) -> dict:
+    with SessionLocal() as db:
+        return changes.delta(db, cursor, user_id)
+
+
+def _latest() -> int:
+    with SessionLocal() as db:
+        return changes.latest(db)
+
+
+def _event(name: str, data: bytes, event_id: Optional[str] = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {name}\n".encode() + b"data: " + data + b"\n\n"
+
+
+@router.get("/stream")
+async def stream_changes(
+    request: Request,
+    since: Optional[str] = Query(None, description="markør å starte fra (uten: nå)"),
+    last_event_id: Optional[str] = Header(None, description="settes av EventSource ved gjenoppkobling"),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Server-sent events: én "changes"-hendelse (samme innhold som
+    GET /api/changes) hver gang noe er committet, med markøren som id.
+    "reset" betyr at markøren er for gammel – hent listene på nytt.
+    """
+    cursor = _cursor(last_event_id or since)
+    if cursor is None:
+        cursor = await run_in_threadpool(_latest)
+
+    async def events():
+        nonlocal cursor
+        feed.listeners += 1
+        try:
+            yield f"retry: 3000\nid: {cursor}\nevent: ready\ndata: {{}}\n\n".encode()
+            while not await request.is_disconnected():
+                head = await feed.wait(cursor, config.CHANGES_HEARTBEAT_S)
+                if head <= cursor:
+                    yield b": ping\n\n"
+                    continue
+                try:
+                    out = await run_in_threadpool(_delta, cursor, user_id)
+                except CursorGone:
+                    cursor = head
+                    yield _event("reset", b"{}", str(cursor))
+                    continue
+                cursor = int(out["cursor"])
+                if not changes.is_empty(out):
+                    yield _event("changes", serialize.dumps(out), out["cursor"])
+        finally:
+            feed.listeners -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
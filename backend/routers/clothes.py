@@ -1,56 +1,221 @@
 # backend/routers/clothes.py
 from __future__ import annotations
 
-from typing import Optional
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, Response, Query
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..schemas import ClothOut
-from ..services.clothes_service import ClothesService
+from .. import config
+from ..schemas import BulkResult, ClothesBulk, ClothOut, ImportSummary, to_jsonable
+from ..services import atlas, importer, serialize
+from ..services.response_cache import CLOTHES, bump_clothes, cached_json
+from ..services.similarity import index as similarity_index
+from ..services.clothes_service import LIST_FIELDS, ClothesService, DuplicateCloth
+from ..services.pagination import MAX_LIMIT, page_headers, parse_fields
+from ..services.uploads import UploadTooLarge, spool_upload
+from ..services.users import current_user_id, owned_by
 from ..models import Cloth, ClothCategory  # ✅ used only for the PUT handler
 
 router = APIRouter(prefix="/clothes", tags=["clothes"])
 
 
 # Dependency som gir oss en service med aktiv DB-session
-def svc(db: Session = Depends(get_db)) -> ClothesService:
-    return ClothesService(db)
+def svc(db: Session = Depends(get_db), user_id: Optional[int] = Depends(current_user_id)) -> ClothesService:
+    return ClothesService(db, user_id)
 
 
 @router.get("/", response_model=list[ClothOut])
 def list_clothes(
+    request: Request,
     category: Optional[str] = Query(None, description="topp | underdel | sko | tilbehør"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="antall per side (uten: alle)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor fra forrige side"),
+    fields: Optional[str] = Query(None, description="f.eks. id,name,thumbnail"),
     s: ClothesService = Depends(svc),
 ):
-    try:
-        return s.list(category)
-    except ValueError as e:
-        # Valideringsfeil fra service -> 400
-        raise HTTPException(status_code=400, detail=str(e))
+    def build():
+        try:
+            field_list = parse_fields(fields, LIST_FIELDS)
+            page = s.page(category, limit=limit, cursor=cursor, fields=field_list, as_dicts=config.FAST_JSON)
+        except ValueError as e:
+            # Valideringsfeil fra service -> 400
+            raise HTTPException(status_code=400, detail=str(e))
+
+        headers = page_headers(request.url, page.next_cursor)
+        if field_list is not None:
+            # delvise objekter passer ikke ClothOut – send dem som de er
+            return jsonable_encoder(page.items), headers
+        if config.FAST_JSON:
+            # allerede på ClothOut-formen; kodes direkte av svar-cachen
+            return page.items, headers
+        return [to_jsonable(ClothOut, c) for c in page.items], headers
+
+    return cached_json(request, (CLOTHES,), build)
+
+
+@router.get("/atlas")
+def clothes_atlas(
+    request: Request,
+    category: Optional[str] = Query(None, description="topp | underdel | sko | tilbehør"),
+    page: int = Query(0, ge=0, description="sidenummer (0 = nyeste)"),
+    tile: Optional[int] = Query(None, description="rutestørrelse i px"),
+    s: ClothesService = Depends(svc),
+):
+    """
+    Én side med plagg som sprite-atlas: ett WebP-bilde med alle
+    miniatyrene og et kart over hvor hvert plagg ligger i det.
+    """
+    def build():
+        try:
+            out = s.atlas(category, page=page, tile=tile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        key = out.pop("key")
+        return {"image": f"{request.url.path}/{key}.webp" if key else None, **out}, {}
+
+    return cached_json(request, (CLOTHES,), build)
+
+
+@router.get("/atlas/{name}")
+def clothes_atlas_image(name: str, request: Request):
+    """Atlas-bildet. Navnet er innholdets hash, så det kan caches for alltid."""
+    key, ext = os.path.splitext(name)
+    if ext != ".webp" or not atlas.valid_key(key):
+        raise HTTPException(status_code=404, detail="Not found")
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={config.MEDIA_MAX_AGE_S}, immutable"}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    data = atlas.image(key)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return Response(data, media_type="image/webp", headers=headers)
 
 
 @router.get("/{cloth_id}", response_model=ClothOut)
-def get_cloth(cloth_id: int, s: ClothesService = Depends(svc)):
-    cloth = s.get(cloth_id)
-    if not cloth:
-        raise HTTPException(status_code=404, detail="Not found")
-    return cloth
+def get_cloth(cloth_id: int, request: Request, s: ClothesService = Depends(svc)):
+    def build():
+        cloth = s.get(cloth_id)
+        if not cloth:
+            raise HTTPException(status_code=404, detail="Not found")
+        return to_jsonable(ClothOut, cloth), {}
+
+    return cached_json(request, (CLOTHES,), build)
+
+
+@router.get("/{cloth_id}/similar")
+def similar_clothes(
+    cloth_id: int,
+    request: Request,
+    limit: int = Query(20, ge=1, le=MAX_LIMIT),
+    category: Optional[str] = Query(None, description="bare denne kategorien"),
+    s: ClothesService = Depends(svc),
+):
+    """Plagg som ligner (farger + form), best først, med score 0..1."""
+    def build():
+        try:
+            hits = s.similar(cloth_id, limit=limit, category=category)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if hits is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        by_id = serialize.clothes_by_id(s.db, [h["id"] for h in hits])
+        return [
+            {**by_id[h["id"]],
+             "score": h["score"], "color": h["color"], "hamming": h["hamming"]}
+            for h in hits if h["id"] in by_id
+        ], {}
+
+    return cached_json(request, (CLOTHES,), build)
 
 
 @router.post("/", response_model=ClothOut)
 async def create_cloth(
+    response: Response,
     name: str = Form(...),
     category: str = Form(...),
     file: UploadFile = File(...),
+    reject_duplicates: bool = Query(False, description="409 i stedet for å lagre et nesten likt plagg"),
     s: ClothesService = Depends(svc),
 ):
-    content = await file.read()
     try:
-        return s.create(name=name, category=category, image_content=content)
+        upload = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    with upload:
+        try:
+            # dekoding, PNG-koding og commit er blokkerende – kjør i trådpoolen
+            cloth = await run_in_threadpool(
+                s.create,
+                name=name,
+                category=category,
+                image_content=upload.file,
+                content_hash=upload.sha256,
+                reject_duplicates=reject_duplicates,
+            )
+        except DuplicateCloth as e:
+            raise HTTPException(status_code=409, detail={"message": str(e), "duplicates": e.ids})
+        except ValueError as e:
+            # Ugyldig kategori eller ugyldig bildefil
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if cloth.possible_duplicates:
+        response.headers["X-Possible-Duplicates"] = ",".join(map(str, cloth.possible_duplicates))
+    return cloth
+
+
+@router.post("/batch", response_model=ImportSummary)
+async def create_clothes_batch(
+    files: List[UploadFile] = File(...),
+    category: Optional[str] = Form(None, description="samme kategori for alle (ellers gjettes den fra filnavnet)"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """Last opp mange plagg i én forespørsel. Navn = filnavn uten endelse."""
+    if len(files) > config.IMPORT_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Maks {config.IMPORT_MAX_FILES} filer per forespørsel")
+    if category and category not in {c.value for c in ClothCategory}:
+        raise HTTPException(status_code=400, detail=f"Ugyldig kategori: {category}")
+
+    uploads, items = [], []
+    try:
+        for f in files:
+            try:
+                up = await spool_upload(f)
+            except UploadTooLarge as e:
+                raise HTTPException(status_code=413, detail=f"{f.filename}: {e}")
+            uploads.append(up)
+            name = os.path.splitext(os.path.basename(f.filename or ""))[0] or "plagg"
+            items.append(importer.ImportItem(name=name, source=up.file, category=category or None))
+        try:
+            res = await run_in_threadpool(importer.run_import, db, items, user_id=user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        for up in uploads:
+            up.close()
+    return res
+
+
+@router.post("/bulk", response_model=BulkResult)
+def bulk_clothes(payload: ClothesBulk, s: ClothesService = Depends(svc)):
+    """
+    Endre navn/kategori på og slette mange plagg i én transaksjon.
+    Filer som ikke lenger har eier slettes av python -m backend.media_gc.
+    """
+    if len(payload.update) + len(payload.delete) > config.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maks {config.BULK_MAX_ITEMS} endringer per forespørsel")
+    try:
+        res = s.bulk([{"id": u.id, **u.changes()} for u in payload.update], payload.delete)
     except ValueError as e:
-        # Ugyldig kategori eller ugyldig bildefil
         raise HTTPException(status_code=400, detail=str(e))
+    return {"updated": len(res.updated), "deleted": len(res.deleted), "missing": res.missing,
+            "orphaned_files": len(res.orphaned)}
 
 
 # ✅ Oppdater navn + kategori via FormData uten å endre service-laget
@@ -60,13 +225,14 @@ def update_cloth(
     name: str = Form(...),
     category: str = Form(...),
     db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
 ):
     # valider kategori
     valid = {c.value for c in ClothCategory}
     if category not in valid:
         raise HTTPException(status_code=400, detail="Ugyldig kategori")
 
-    cloth = db.query(Cloth).filter(Cloth.id == cloth_id).first()
+    cloth = db.query(Cloth).filter(Cloth.id == cloth_id, owned_by(Cloth.user_id, user_id)).first()
     if not cloth:
         raise HTTPException(status_code=404, detail="Not found")
 
@@ -74,6 +240,8 @@ def update_cloth(
     cloth.category = category
 
     db.commit()
+    similarity_index.set_category(cloth_id, category)
+    bump_clothes()
     db.refresh(cloth)
     return cloth
 
@@ -0,0 +1,68 @@
+# backend/routers/jobs.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+from ..database import SessionLocal
+from ..models import Job
+from ..services import jobs
+from ..services.users import current_user_id, owned_by
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+MAX_WAIT_S = 30.0
+
+
+def _job_out(db, job: Job) -> dict:
+    steps = jobs.chain(db, job)
+    current = next((j for j in steps if j.status != jobs.DONE), steps[-1])
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "progress": {"done": job.progress_done, "total": job.progress_total},
+        "error": job.error,
+        "result": job.result,
+        "target": {"type": job.target_type, "id": job.target_id} if job.target_type else None,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+        # hele kjeden (cloth.process -> cloth.index ...): ferdig først når siste steg er det
+        "pipeline": {"status": current.status, "stage": current.kind, "job_id": current.id,
+                     "error": current.error, "steps": [j.kind for j in steps]},
+    }
+
+
+def _load(job_id: int, user_id: Optional[int]) -> Optional[dict]:
+    with SessionLocal() as db:
+        job = db.query(Job).filter(Job.id == job_id, owned_by(Job.user_id, user_id)).first()
+        return jsonable_encoder(_job_out(db, job)) if job else None
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: int,
+    wait: float = Query(0, ge=0, le=MAX_WAIT_S, description="vent inntil så mange sekunder på at kjeden blir ferdig"),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Status og fremdrift for en jobb. Caches ikke. Med wait svarer vi når
+    pipelinen er done/failed eller tiden er ute (long-poll).
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        out = await run_in_threadpool(_load, job_id, user_id)
+        if out is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        left = deadline - time.monotonic()
+        if out["pipeline"]["status"] in (jobs.DONE, jobs.FAILED) or left <= 0:
+            return out
+        await asyncio.sleep(min(0.25, left))
@@ -2,81 +2,262 @@
 from __future__ import annotations
 
 import json
+import logging
 import os
-import uuid
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete
+from sqlalchemy.orm import Session, selectinload
 
+from .. import config
 from ..database import get_db
-from ..models import Look, Cloth
-from ..schemas import LookOut
+from ..models import Look, Cloth, look_clothes
+from ..schemas import BulkResult, ClothOut, LookCompose, LookLayout, LookOut, LooksBulk, LookSummary, to_jsonable
+from ..services import compositor, jobs, media_store, outfits, pagination, pipeline, renditions, serialize
+from ..services.bulk import apply_bulk
+from ..services.media_index import index as media_index
+from ..services.pagination import MAX_LIMIT, page_headers, parse_fields
+from ..services.response_cache import CLOTHES, LOOKS, NDJSON, bump_looks, cached_json
+from ..services.uploads import SpooledUpload, UploadTooLarge, open_image, spool_upload
+from ..services.users import current_user_id, owned_by
 
-# ▶ Make MEDIA_DIR absolute (resolves .../routers/../media → /abs/path/backend/media)
-MEDIA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "media"))
-os.makedirs(MEDIA_DIR, exist_ok=True)
+logger = logging.getLogger("looksy")
+
+MEDIA_DIR = media_store.MEDIA_DIR
 
 router = APIRouter(prefix="/looks", tags=["looks"])
 
+# felt som kan velges med ?fields=
+LIST_FIELDS = ("id", "title", "image_url", "created_at", "renditions", "thumbnail", "status", "updated_at")
+
+# looks viser plaggene sine, så svarene avhenger av begge tabellene
+_TAGS = (LOOKS, CLOTHES)
+
 
 def _fix_and_get_image_url(look: Look) -> str:
     """
     Ensure look.image_url points to a real file in MEDIA_DIR.
     If the exact filename doesn't exist, try swapping extension
-    between .png/.jpg/.jpeg using the same stem. Persist the fix.
+    between .png/.jpg/.jpeg using the same stem. Answered from the
+    in-memory media index; the caller decides whether to persist.
     """
     url = (look.image_url or "").strip()
-    if not url:
-        return url
-
-    fname = os.path.basename(url)
-    if not fname:
-        return url
-
-    # 1) If the exact file exists -> ok
-    p = os.path.join(MEDIA_DIR, fname)
-    if os.path.exists(p):
-        return url
-
-    # 2) Try other common extensions with same stem
-    stem, _ext = os.path.splitext(fname)
-    for ext in (".png", ".jpg", ".jpeg", ".JPG", ".JPEG", ".PNG"):
-        cand = stem + ext
-        cand_path = os.path.join(MEDIA_DIR, cand)
-        if os.path.exists(cand_path):
-            fixed_url = f"/media/{cand}"
-            # Persist the healed URL so the client doesn't need workarounds
-            look.image_url = fixed_url
-            return fixed_url
-
-    # 3) Nothing found; leave as-is (client may still show a broken icon)
+    healed = media_index.heal_url(url)
+    if healed:
+        look.image_url = healed
+        return healed
     return url
 
 
 @router.get("/", response_model=list[LookOut])
-def list_looks(db: Session = Depends(get_db)):
-    looks = db.query(Look).order_by(Look.created_at.desc()).all()
-    changed = False
-    for look in looks:
-        fixed = _fix_and_get_image_url(look)
-        if fixed != (look.image_url or ""):
-            changed = True
-    if changed:
-        db.commit()  # persist any healed image_url values
-    return looks
+def list_looks(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="antall per side (uten: alle)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor fra forrige side"),
+    fields: Optional[str] = Query(None, description="f.eks. id,title,thumbnail"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    def build():
+        try:
+            field_list = parse_fields(fields, LIST_FIELDS)
+            if field_list:
+                q = db.query(*pagination.columns_for(Look, field_list))
+            elif config.FAST_JSON:
+                q = db.query(*serialize.LOOK_COLUMNS)
+            else:
+                q = db.query(Look).options(selectinload(Look.clothes))
+            q = q.filter(owned_by(Look.user_id, user_id))
+            q = pagination.apply_keyset(q, Look.created_at, Look.id, cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page = pagination.finish_page(q.all(), limit)
+        headers = page_headers(request.url, page.next_cursor)
+
+        if field_list is not None:
+            return jsonable_encoder(pagination.project(page.items, field_list)), headers
+        if config.FAST_JSON:
+            # rader + én spørring for plaggene, rett på LookOut-formen
+            return serialize.look_dicts(db, page.items), headers
+        # image_url-er som peker på manglende filer repareres av media-indeksens
+        # bakgrunnsjobb, ikke her – en GET skal verken stat-e filer eller skrive.
+        return [to_jsonable(LookOut, look) for look in page.items], headers
+
+    return cached_json(request, _TAGS, build)
+
+
+@router.get("/summary", response_model=list[LookSummary])
+def list_looks_summary(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description="antall per side (uten: alle)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor fra forrige side"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """Som GET /looks, men med plagg-id-er og miniatyrer i stedet for hele ClothOut."""
+    def build():
+        try:
+            q = db.query(Look.id, Look.title, Look.image_url, Look.created_at)
+            q = q.filter(owned_by(Look.user_id, user_id))
+            q = pagination.apply_keyset(q, Look.created_at, Look.id, cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page = pagination.finish_page(q.all(), limit)
+        headers = page_headers(request.url, page.next_cursor)
+
+        members = {row.id: ([], []) for row in page.items}
+        if members:
+            links = (
+                db.query(look_clothes.c.look_id, Cloth.id, Cloth.image_url)
+                .join(Cloth, Cloth.id == look_clothes.c.cloth_id)
+                .filter(look_clothes.c.look_id.in_(list(members)))
+                .order_by(look_clothes.c.look_id, Cloth.id)
+            )
+            for look_id, cloth_id, image_url in links:
+                ids, thumbs = members[look_id]
+                ids.append(cloth_id)
+                thumbs.append(renditions.rendition_urls(image_url).get("128") or image_url)
+
+        items = [
+            {
+                "id": row.id,
+                "title": row.title,
+                "image_url": row.image_url,
+                "renditions": renditions.rendition_urls(row.image_url),
+                "created_at": row.created_at,
+                "cloth_ids": members[row.id][0],
+                "thumbnails": members[row.id][1],
+            }
+            for row in page.items
+        ]
+        return jsonable_encoder(items), headers
+
+    return cached_json(request, _TAGS, build)
+
+
+# ---------- forslag ----------
+
+@router.get("/suggest")
+def suggest_looks(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200, description="antall antrekk"),
+    max_per_item: int = Query(3, ge=0, le=200, description="maks antrekk per plagg (0 = ingen grense)"),
+    cloth_id: Optional[int] = Query(None, description="bare antrekk med dette plagget"),
+    accessories: bool = Query(True, description="foreslå tilbehør"),
+    format: Optional[str] = Query(None, description="json | ndjson (eller Accept: application/x-ndjson)"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Foreslåtte antrekk (topp + underdel + sko, evt. tilbehør), best først.
+    Scores på farger fra likhetsindeksen; se services/outfits.py.
+    """
+    ndjson = format == "ndjson" or (format is None and NDJSON in request.headers.get("accept", ""))
+
+    def build():
+        try:
+            found = outfits.suggest(limit, max_per_item=max_per_item, with_id=cloth_id, accessories=accessories,
+                                    user_id=user_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Plagget finnes ikke (eller er ikke indeksert ennå)")
+        ids = {cid for o in found for cid in o.items.values()}
+        clothes = serialize.clothes_by_id(db, ids)
+        attrs = outfits.attributes()
+        out = {}
+        for cid, c in clothes.items():
+            out[cid] = {**c, "dominant_color": attrs.dominant_color(cid)}
+        return [
+            {"score": o.score, "items": o.items, "clothes": [out[cid] for cid in o.items.values()]}
+            for o in found if all(cid in out for cid in o.items.values())
+        ], {}
+
+    return cached_json(request, (CLOTHES,), build, ndjson=ndjson)
+
+
+# ---------- server-side tegning ----------
+
+def _layout_clothes(db: Session, layout: dict, user_id: Optional[int]) -> dict:
+    ids = compositor.layout_cloth_ids(layout)
+    if not ids:
+        raise HTTPException(status_code=400, detail="Layouten må ha minst ett plagg")
+    clothes = {c.id: c for c in db.query(Cloth).filter(Cloth.id.in_(ids), owned_by(Cloth.user_id, user_id))}
+    missing = [i for i in ids if i not in clothes]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Ugyldige cloth_ids: {missing}")
+    return clothes
+
+
+def _owned_look(db: Session, look_id: int, user_id: Optional[int]) -> Optional[Look]:
+    return db.query(Look).filter(Look.id == look_id, owned_by(Look.user_id, user_id)).first()
+
+
+def _load_look(db: Session, look_id: int) -> Look:
+    return db.query(Look).options(selectinload(Look.clothes)).filter(Look.id == look_id).one()
+
+
+@router.post("/compose", response_model=LookOut)
+def compose_look(
+    payload: LookCompose,
+    defer: bool = Query(False, description="svar straks med status processing og tegn i jobbkøen"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """Lag en look fra plagg + layout; bildet tegnes av serveren."""
+    layout = payload.layout.as_dict()
+    clothes = _layout_clothes(db, layout, user_id)
+    look = Look(title=payload.title, layout=layout, user_id=user_id)
+    look.clothes = list(clothes.values())
+    db.add(look)
+    if defer:
+        look.status = pipeline.PROCESSING
+        db.flush()
+        job = jobs.enqueue(db, "look.render", {"look_id": look.id, "force": True},
+                           key=f"look.render:{look.id}", target=("look", look.id), user_id=user_id)
+        look.job_id = job.id
+    else:
+        compositor.render_look(db, look, force=True, clothes=clothes)
+    db.commit()
+    bump_looks()
+    return _load_look(db, look.id)
+
+
+@router.post("/render")
+def render_stale_looks(
+    limit: int = Query(100, ge=1, le=MAX_LIMIT, description="maks antall looks per kall"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """Tegn på nytt looks der layout eller plaggbilder er endret siden forrige tegning."""
+    looks = db.query(Look).filter(Look.layout.isnot(None), owned_by(Look.user_id, user_id)).all()
+    stale = compositor.stale_looks(db, looks)[:limit]
+    for look, clothes in stale:
+        compositor.render_look(db, look, clothes=clothes)
+    db.commit()
+    if stale:
+        bump_looks()
+    return {"rendered": [look.id for look, _ in stale], "layer_cache": compositor.layer_cache.stats()}
 
 
 @router.get("/{look_id}", response_model=LookOut)
-def get_look(look_id: int, db: Session = Depends(get_db)):
-    look = db.query(Look).get(look_id)
-    if not look:
-        raise HTTPException(status_code=404, detail="Not found")
-    # heal on single get as well
-    fixed = _fix_and_get_image_url(look)
-    if fixed != (look.image_url or ""):
-        db.commit()
-    return look
+def get_look(
+    look_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    def build():
+        look = (
+            db.query(Look).options(selectinload(Look.clothes))
+            .filter(Look.id == look_id, owned_by(Look.user_id, user_id)).first()
+        )
+        if not look:
+            raise HTTPException(status_code=404, detail="Not found")
+        return to_jsonable(LookOut, look), {}
+
+    return cached_json(request, _TAGS, build)
 
 
 @router.post("/", response_model=LookOut)
@@ -84,7 +265,9 @@ async def create_look(
     file: UploadFile = File(...),
     cloth_ids: str = Form(...),
     title: Optional[str] = Form(None),
+    layout: Optional[str] = Form(None, description="LookLayout som JSON (valgfritt)"),
     db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
 ):
     # parse cloth_ids
     try:
@@ -98,64 +281,167 @@ async def create_look(
     if not ids:
         raise HTTPException(status_code=400, detail="cloth_ids kan ikke være tom")
 
-    # validate clothes exist
-    clothes = db.query(Cloth).filter(Cloth.id.in_(ids)).all()
+    layout_dict = None
+    if layout:
+        try:
+            layout_dict = LookLayout.from_json(layout).as_dict()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="layout må være gyldig JSON (se LookLayout)")
+
+    try:
+        upload = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    ext = ".png"
+    if file.filename and file.filename.lower().endswith((".jpg", ".jpeg")):
+        ext = ".jpg"
+    # DB-kall og bildearbeid er blokkerende – hold dem unna event-loopen
+    with upload:
+        return await run_in_threadpool(_store_look, db, ids, title, upload, ext, layout_dict, user_id)
+
+
+def _store_look(db: Session, ids: List[int], title: Optional[str], upload: SpooledUpload, ext: str,
+                layout: Optional[dict] = None, user_id: Optional[int] = None) -> Look:
+    # validate clothes exist (og tilhører brukeren)
+    clothes = db.query(Cloth).filter(Cloth.id.in_(ids), owned_by(Cloth.user_id, user_id)).all()
     if len(clothes) != len(set(ids)):
         found = {c.id for c in clothes}
         missing = [i for i in ids if i not in found]
         raise HTTPException(status_code=400, detail=f"Ugyldige cloth_ids: {missing}")
 
     # write image
-    content = await file.read()
-    if not content:
+    if not upload.size:
         raise HTTPException(status_code=400, detail="Tom bildefil")
 
-    ext = ".png"
-    if file.filename and file.filename.lower().endswith((".jpg", ".jpeg")):
-        ext = ".jpg"
-    filename = f"look_{uuid.uuid4().hex}{ext}"
-    path = os.path.join(MEDIA_DIR, filename)
-    with open(path, "wb") as fh:
-        fh.write(content)
+    # innholdsadressert: samme collage lagres bare én gang
+    filename = f"look_{upload.sha256}{ext}"
+    if not media_store.exists(filename):
+        media_store.write_atomic(filename, upload.file)
+        try:
+            upload.file.seek(0)
+            img = open_image(upload.file, max(renditions.SIZES))
+            renditions.generate(img, media_store.path_for(filename))
+        except ValueError as e:
+            # collagen lagres uansett; klienten faller tilbake til masteren
+            logger.warning(f"Kunne ikke lage renditions for {filename}: {e}")
+    media_store.acquire(db, filename)
 
-    image_url = f"/media/{filename}"
+    image_url = media_store.url_for(filename)
 
-    look = Look(title=title, image_url=image_url)
+    look = Look(title=title, image_url=image_url, user_id=user_id)
     look.clothes = clothes
+    if layout:
+        # det opplastede bildet gjelder til layouten eller et plaggbilde endres
+        look.layout = layout
+        by_id = {c.id: c for c in clothes}
+        look.render_key = compositor.render_key(
+            layout, {i: by_id[i] for i in compositor.layout_cloth_ids(layout) if i in by_id}
+        )
     db.add(look)
     db.commit()
-    db.refresh(look)
-    return look
+    bump_looks()
+    # last plaggene her, så serialiseringen ikke gjør DB-kall i event-loopen
+    return db.query(Look).options(selectinload(Look.clothes)).filter(Look.id == look.id).one()
+
+
+@router.post("/{look_id}/render", response_model=LookOut)
+def render_look(
+    look_id: int,
+    force: bool = Query(False, description="tegn selv om ingenting er endret"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    look = _owned_look(db, look_id, user_id)
+    if not look:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not look.layout:
+        raise HTTPException(status_code=409, detail="Looken har ingen layout å tegne fra")
+    compositor.render_look(db, look, force=force)
+    db.commit()
+    bump_looks()
+    return _load_look(db, look_id)
+
+
+@router.put("/{look_id}/layout", response_model=LookOut)
+def update_look_layout(
+    look_id: int,
+    payload: LookLayout,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """Bytt layout (og dermed plagg) og tegn looken på nytt."""
+    look = _owned_look(db, look_id, user_id)
+    if not look:
+        raise HTTPException(status_code=404, detail="Not found")
+    layout = payload.as_dict()
+    clothes = _layout_clothes(db, layout, user_id)
+    look.layout = layout
+    look.clothes = list(clothes.values())
+    compositor.render_look(db, look, clothes=clothes)
+    db.commit()
+    bump_looks()
+    return _load_look(db, look_id)
+
+
+@router.post("/bulk", response_model=BulkResult)
+def bulk_looks(
+    payload: LooksBulk,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """
+    Endre tittel på og slette mange looks i én transaksjon.
+    Filer som ikke lenger har eier slettes av python -m backend.media_gc.
+    """
+    if len(payload.update) + len(payload.delete) > config.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maks {config.BULK_MAX_ITEMS} endringer per forespørsel")
+    res = apply_bulk(
+        db, Look, user_id,
+        {u.id: u.changes() for u in payload.update},
+        payload.delete,
+        before_delete=lambda ids: db.execute(delete(look_clothes).where(look_clothes.c.look_id.in_(ids))),
+    )
+    db.commit()
+    if res.updated or res.deleted:
+        bump_looks()
+    return {"updated": len(res.updated), "deleted": len(res.deleted), "missing": res.missing,
+            "orphaned_files": len(res.orphaned)}
+
+
 @router.put("/{look_id}", response_model=LookOut)
 def update_look(
     look_id: int,
     title: Optional[str] = Form(None),
     db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
 ):
-    look = db.query(Look).get(look_id)
+    # plaggene lastes først når svaret serialiseres (én enkel SELECT)
+    look = _owned_look(db, look_id, user_id)
     if not look:
         raise HTTPException(status_code=404, detail="Not found")
     look.title = title
     db.commit()
+    bump_looks()
     db.refresh(look)
     return look
 
 
 @router.delete("/{look_id}", status_code=204)
-def delete_look(look_id: int, db: Session = Depends(get_db)):
-    look = db.query(Look).get(look_id)
-    if not look:
+def delete_look(
+    look_id: int,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    # Bare kolonnene vi trenger – ingen Look-objekt, ingen plagg
+    row = db.query(Look.id, Look.image_url).filter(Look.id == look_id, owned_by(Look.user_id, user_id)).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Not found")
 
-    try:
-        if look.image_url and look.image_url.startswith("/media/"):
-            fname = os.path.basename(look.image_url)
-            p = os.path.join(MEDIA_DIR, fname)
-            if os.path.exists(p):
-                os.remove(p)
-    except Exception:
-        pass
-
-    db.delete(look)
+    # filen ryddes av media_gc hvis ingen andre bruker den
+    media_store.release(db, row.image_url)
+    db.execute(delete(look_clothes).where(look_clothes.c.look_id == look_id))
+    db.execute(delete(Look).where(Look.id == look_id))
     db.commit()
+    bump_looks()
     return Response(status_code=204)
@@ -0,0 +1,66 @@
+# backend/routers/search.py
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..models import Cloth, Look
+from ..services import search as search_service
+from ..services.pagination import MAX_LIMIT, page_headers
+from ..services.renditions import rendition_urls
+from ..services.response_cache import CLOTHES, LOOKS, cached_json
+from ..services.users import current_user_id
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+_KINDS = {"clothes": ("clothes",), "looks": ("looks",), "all": ("clothes", "looks")}
+
+
+@router.get("")
+def search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200, description="søketekst (prefiks og skrivefeil går fint)"),
+    kind: str = Query("all", description="clothes | looks | all"),
+    limit: int = Query(20, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor fra forrige side"),
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(current_user_id),
+):
+    """Rangerte treff i plaggnavn og look-titler, best først."""
+    if kind not in _KINDS:
+        raise HTTPException(status_code=400, detail=f"Ugyldig kind. Gyldige: {', '.join(_KINDS)}")
+
+    def build():
+        try:
+            hits, next_cursor = search_service.search(db, q, kinds=_KINDS[kind], limit=limit, cursor=cursor,
+                                                      user_id=user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        ids = search_service.by_kind(hits)
+        clothes = {c.id: c for c in db.query(Cloth).filter(Cloth.id.in_(ids.get("cloth", [])))} \
+            if ids.get("cloth") else {}
+        looks = {row.id: row for row in db.query(Look.id, Look.image_url).filter(Look.id.in_(ids.get("look", [])))} \
+            if ids.get("look") else {}
+
+        items = []
+        for h in hits:
+            if h.kind == "cloth" and h.id in clothes:
+                c = clothes[h.id]
+                items.append({
+                    "kind": h.kind, "id": h.id, "score": h.score, "name": c.name,
+                    "category": getattr(c.category, "value", c.category),
+                    "image_url": c.image_url, "renditions": c.renditions,
+                })
+            elif h.kind == "look" and h.id in looks:
+                urls = rendition_urls(looks[h.id].image_url)
+                items.append({
+                    "kind": h.kind, "id": h.id, "score": h.score, "title": h.text,
+                    "image_url": looks[h.id].image_url, "renditions": urls,
+                })
+        return items, page_headers(request.url, next_cursor)
+
+    return cached_json(request, (CLOTHES, LOOKS), build)
@@ -1,7 +1,7 @@
 # backend/schemas.py
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 # Detect Pydantic v2 (so we can set from_attributes=True)
 try:
@@ -20,6 +20,10 @@ class ClothOut(ClothBase):
     id: int
     image_url: Optional[str]
     created_at: datetime
+    renditions: Dict[str, str] = {}   # størrelse (px) -> /media/<stem>_<size>
+    status: str = "ready"             # processing | ready | failed (se GET /api/jobs/{job_id})
+    job_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
 
     if _V2:
         model_config = ConfigDict(from_attributes=True)
@@ -28,6 +32,34 @@ class ClothOut(ClothBase):
             orm_mode = True
 
 
+class LayoutItem(BaseModel):
+    cloth_id: int
+    x: float                          # venstre kant, andel av lerretsbredden (0–1)
+    y: float                          # øvre kant, andel av lerretshøyden (0–1)
+    scale: float = Field(0.3, gt=0, le=4)  # plaggets bredde som andel av lerretsbredden (tegnes maks 1)
+    z: int = 0                        # tegnerekkefølge, lavest først
+
+
+class LookLayout(BaseModel):
+    width: int = Field(1080, ge=16, le=4096)
+    height: int = Field(1350, ge=16, le=4096)
+    background: str = "#ffffff"
+    items: List[LayoutItem]
+
+    @classmethod
+    def from_json(cls, raw: str) -> "LookLayout":
+        return cls.model_validate_json(raw) if _V2 else cls.parse_raw(raw)
+
+    def as_dict(self) -> dict:
+        """Ren dict for JSON-kolonnen Look.layout."""
+        return self.model_dump() if _V2 else self.dict()
+
+
+class LookCompose(BaseModel):
+    title: Optional[str] = None
+    layout: LookLayout
+
+
 class LookCreate(BaseModel):
     title: Optional[str] = None
     cloth_ids: List[int]
@@ -37,7 +69,12 @@ class LookOut(BaseModel):
     id: int
     title: Optional[str]
     image_url: Optional[str]          # <-- include collage URL in responses
+    renditions: Dict[str, str] = {}
     created_at: datetime
+    layout: Optional[LookLayout] = None
+    status: str = "ready"
+    job_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
     clothes: List[ClothOut]
 
     if _V2:
@@ -45,3 +82,73 @@ class LookOut(BaseModel):
     else:
         class Config:
             orm_mode = True
+
+
+class LookSummary(BaseModel):
+    """Kompakt look for lister: bare plagg-id-er og miniatyr-URL-er."""
+    id: int
+    title: Optional[str]
+    image_url: Optional[str]
+    renditions: Dict[str, str] = {}
+    created_at: datetime
+    cloth_ids: List[int]
+    thumbnails: List[str]             # samme rekkefølge som cloth_ids
+
+
+class _Patch(BaseModel):
+    """
+    Én rad i en bulk-endring. Felt som mangler er uendret; et felt som
+    sendes som null settes til null (der kolonnen tillater det).
+    """
+    id: int
+
+    def changes(self) -> dict:
+        """Feltene klienten faktisk sendte (uten id)."""
+        sent = self.model_fields_set if _V2 else self.__fields_set__
+        return {k: getattr(self, k) for k in sent if k != "id"}
+
+
+class ClothPatch(_Patch):
+    name: Optional[str] = None        # name/category kan ikke være null
+    category: Optional[str] = None
+
+
+class ClothesBulk(BaseModel):
+    update: List[ClothPatch] = []
+    delete: List[int] = []
+
+
+class LookPatch(_Patch):
+    title: Optional[str] = None       # null fjerner tittelen
+
+
+class LooksBulk(BaseModel):
+    update: List[LookPatch] = []
+    delete: List[int] = []
+
+
+class BulkResult(BaseModel):
+    updated: int
+    deleted: int
+    missing: List[int] = []           # id-er som ikke finnes (eller tilhører en annen bruker)
+    orphaned_files: int = 0           # filer uten eier nå – slettes av python -m backend.media_gc
+
+
+class ImportFailure(BaseModel):
+    name: str
+    error: str
+
+
+class ImportSummary(BaseModel):
+    total: int
+    created: int
+    skipped: int                      # fantes fra før (samme bilde)
+    failed: List[ImportFailure]
+
+
+def to_jsonable(schema, obj):
+    """ORM-objekt -> JSON-klar dict via schema (som FastAPIs response_model)."""
+    if _V2:
+        return schema.model_validate(obj).model_dump(mode="json")
+    from fastapi.encoders import jsonable_encoder
+    return jsonable_encoder(schema.from_orm(obj))
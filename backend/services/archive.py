@@ -0,0 +1,642 @@
+# backend/services/archive.py
+"""
+Eksport og import av en hel garderobe som ett arkiv (zip eller tar).
+
+    manifest.json                  format og versjon (først)
+    media/<ab/cd/navn>             masterne og renditions radene peker på
+    clothes/00000.ndjson …         én rad per linje, ARCHIVE_CHUNK_ROWS per del
+    looks/00000.ndjson …
+    look_clothes/00000.ndjson …
+    summary.json                   antall (sist)
+
+Eksporten er en generator: radene leses i biter (keyset på id) inne i én
+lesetransaksjon, så arkivet er et konsistent øyeblikksbilde mens appen
+skriver videre, og filene strømmes i biter rett fra disk. Minnebruken
+avhenger ikke av størrelsen på garderoben.
+
+Importen leser arkivet del for del i samme rekkefølge: filer som
+allerede finnes (samme innhold) hoppes over, filer som ikke er bilder
+avvises, og radene upsertes på id i én transaksjon per del. Rader med
+samme id som tilhører en annen bruker røres ikke (telles som konflikter),
+og en rad kan bare peke på filer fra arkivet eller filer brukeren
+allerede har.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, literal_column, select, union
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..models import Cloth, ClothCategory, Look, look_clothes
+from . import media_paths, media_store, renditions
+from .media_index import index as media_index
+from .uploads import probe_image
+from .users import owned_by
+
+FORMAT = "looksy-export"
+VERSION = 1
+FORMATS = {"zip": "application/zip", "tar": "application/x-tar"}
+
+FILE_CHUNK = 1024 * 1024
+# SQLite: maks bundne parametre per setning
+SQL_CHUNK = 900
+
+CLOTH_FIELDS = ("id", "name", "category", "image_url", "created_at", "status")
+LOOK_FIELDS = ("id", "title", "image_url", "created_at", "layout", "render_key", "status")
+
+# endelse -> formatet filen må ha (Pillow sitt navn)
+_IMAGE_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP"}
+
+
+class ArchiveError(ValueError):
+    """Arkivet kan ikke leses (feil format, versjon eller innhold)."""
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return getattr(obj, "value", str(obj))
+
+
+# ---------- arkivformatene (skriving) ----------
+
+class _Sink(io.RawIOBase):
+    """Uspolbar strøm som samler det zipfile skriver, så generatoren kan gi det videre."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+class _TarWriter:
+    """Tar skrevet for hånd: header, så filens biter rett fra disk, så padding."""
+
+    def entry(self, name: str, size: int, mtime: float, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+        written = 0
+        for chunk in chunks:
+            chunk = chunk[:size - written]
+            written += len(chunk)
+            yield chunk
+            if written >= size:
+                break
+        if written < size:            # filen krympet underveis – hold tar-strukturen gyldig
+            yield b"\0" * (size - written)
+        if size % tarfile.BLOCKSIZE:
+            yield b"\0" * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+
+    def close(self) -> Iterator[bytes]:
+        yield b"\0" * (tarfile.BLOCKSIZE * 2)
+
+
+class _ZipWriter:
+    """zipfile mot en uspolbar strøm (data descriptors), tømt etter hver bit."""
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", allowZip64=True)
+
+    def entry(self, name: str, size: int, mtime: float, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+        # bildene er komprimert fra før; NDJSON komprimeres
+        info.compress_type = zipfile.ZIP_DEFLATED if name.endswith((".ndjson", ".json")) else zipfile.ZIP_STORED
+        with self._zip.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+            for chunk in chunks:
+                dst.write(chunk)
+                out = self._sink.drain()
+                if out:
+                    yield out
+        yield self._sink.drain()
+
+    def close(self) -> Iterator[bytes]:
+        self._zip.close()
+        yield self._sink.drain()
+
+
+def _file_chunks(fh: BinaryIO) -> Iterator[bytes]:
+    while True:
+        chunk = fh.read(FILE_CHUNK)
+        if not chunk:
+            return
+        yield chunk
+
+
+# ---------- eksport ----------
+
+@contextmanager
+def snapshot(engine: Engine) -> Iterator[Connection]:
+    """Én lesetransaksjon for hele eksporten (WAL: skrivere blokkeres ikke)."""
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            # pysqlite starter ikke transaksjoner for SELECT selv
+            conn.exec_driver_sql("BEGIN")
+        else:
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            conn.begin()
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+
+def _batches(conn: Connection, columns, where, key, chunk: int) -> Iterator[list]:
+    """Rader i biter på key (keyset), så ingen spørring holder hele tabellen."""
+    last = None
+    while True:
+        stmt = select(*columns).where(where).order_by(key).limit(chunk)
+        if last is not None:
+            stmt = stmt.where(key > last)
+        rows = conn.execute(stmt).all()
+        if not rows:
+            return
+        yield rows
+        last = getattr(rows[-1], key.key)
+
+
+def _media_names(conn: Connection, user_id: Optional[int], chunk: int) -> Iterator[str]:
+    """Filnavnene radene peker på, sortert og uten duplikater, i biter."""
+    urls = union(
+        select(Cloth.image_url.label("url")).where(owned_by(Cloth.user_id, user_id), Cloth.image_url.isnot(None)),
+        select(Look.image_url.label("url")).where(owned_by(Look.user_id, user_id), Look.image_url.isnot(None)),
+    ).subquery()
+    url = literal_column("url")
+    last = None
+    while True:
+        stmt = select(url).select_from(urls).order_by(url).limit(chunk)
+        if last is not None:
+            stmt = stmt.where(url > last)
+        rows = conn.execute(stmt).scalars().all()
+        if not rows:
+            return
+        for u in rows:
+            name = media_store.filename_from_url(u)
+            if name:
+                yield name
+        last = rows[-1]
+
+
+def _media_files(name: str) -> Iterator[Tuple[str, str]]:
+    """(arkivnavn, sti) for masteren og renditions som finnes på disk."""
+    names = [name] + ([] if renditions.is_rendition(name) else
+                      [renditions.rendition_filename(name, size) for size in renditions.SIZES])
+    for n in names:
+        rel = media_store.relpath(n)
+        path = os.path.join(media_store.MEDIA_DIR, *rel.split("/"))
+        if os.path.isfile(path):
+            yield f"media/{rel}", path
+
+
+def export_archive(engine: Engine, *, user_id: Optional[int] = None, fmt: str = "zip",
+                   chunk: Optional[int] = None) -> Iterator[bytes]:
+    """Generator med arkivets bytes. Til StreamingResponse eller en fil."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Ugyldig format. Gyldige: {', '.join(FORMATS)}")
+    chunk = max(1, chunk or config.ARCHIVE_CHUNK_ROWS)
+    writer = _ZipWriter() if fmt == "zip" else _TarWriter()
+    now = time.time()
+    counts = {"clothes": 0, "looks": 0, "look_clothes": 0, "media": 0, "media_bytes": 0}
+
+    def blob(name: str, data: bytes) -> Iterator[bytes]:
+        return writer.entry(name, len(data), now, iter([data]))
+
+    yield from blob("manifest.json", _dumps({
+        "format": FORMAT, "version": VERSION,
+        "created_at": datetime.utcnow(), "user_id": user_id,
+        "shard_depth": config.MEDIA_SHARD_DEPTH,
+    }))
+
+    with snapshot(engine) as conn:
+        # filene først, så importen kjenner dem før radene som peker på dem
+        for name in _media_names(conn, user_id, chunk):
+            for arcname, path in _media_files(name):
+                try:
+                    fh = open(path, "rb")
+                except OSError:
+                    continue
+                with fh:
+                    st = os.fstat(fh.fileno())
+                    counts["media"] += 1
+                    counts["media_bytes"] += st.st_size
+                    yield from writer.entry(arcname, st.st_size, st.st_mtime, _file_chunks(fh))
+
+        parts = (
+            ("clothes", [getattr(Cloth, f) for f in CLOTH_FIELDS], owned_by(Cloth.user_id, user_id), Cloth.id),
+            ("looks", [getattr(Look, f) for f in LOOK_FIELDS], owned_by(Look.user_id, user_id), Look.id),
+        )
+        for label, columns, where, key in parts:
+            for i, rows in enumerate(_batches(conn, columns, where, key, chunk)):
+                counts[label] += len(rows)
+                body = b"".join(_dumps(dict(r._mapping)) + b"\n" for r in rows)
+                yield from blob(f"{label}/{i:05d}.ndjson", body)
+
+        # koblingene for brukerens looks, i biter på look_id
+        lc = look_clothes.c
+        owned_looks = select(Look.id).where(owned_by(Look.user_id, user_id))
+        last = None
+        i = 0
+        while True:
+            stmt = (
+                select(lc.look_id, lc.cloth_id).where(lc.look_id.in_(owned_looks))
+                .order_by(lc.look_id, lc.cloth_id).limit(chunk)
+            )
+            if last is not None:
+                stmt = stmt.where((lc.look_id > last[0]) | ((lc.look_id == last[0]) & (lc.cloth_id > last[1])))
+            rows = conn.execute(stmt).all()
+            if not rows:
+                break
+            counts["look_clothes"] += len(rows)
+            body = b"".join(_dumps({"look_id": r.look_id, "cloth_id": r.cloth_id}) + b"\n" for r in rows)
+            yield from blob(f"look_clothes/{i:05d}.ndjson", body)
+            last = (rows[-1].look_id, rows[-1].cloth_id)
+            i += 1
+
+    yield from blob("summary.json", _dumps(counts))
+    yield from writer.close()
+
+
+# ---------- arkivformatene (lesing) ----------
+
+def _entries(fp: BinaryIO) -> Iterator[Tuple[str, BinaryIO]]:
+    """(navn, strøm) for hver fil i arkivet, i rekkefølge. Zip krever polbar fp."""
+    head = fp.read(4)
+    fp.seek(0)
+    if head.startswith(b"PK"):
+        try:
+            zf = zipfile.ZipFile(fp)
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(f"Ugyldig zip: {e}")
+        with zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    with zf.open(info) as src:
+                        yield info.filename, src
+        return
+    try:
+        tf = tarfile.open(fileobj=fp, mode="r|*")
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Ukjent arkivformat (zip eller tar): {e}")
+    with tf:
+        for member in tf:
+            if member.isfile():
+                yield member.name, tf.extractfile(member)
+
+
+def _ndjson(src: BinaryIO) -> Iterator[dict]:
+    # readline i stedet for TextIOWrapper: tar-medlemmer i strømmemodus kan ikke spørres om seek
+    for n, line in enumerate(iter(src.readline, b""), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ArchiveError(f"Ugyldig JSON på linje {n}")
+        if not isinstance(row, dict):
+            raise ArchiveError(f"Linje {n} er ikke et objekt")
+        yield row
+
+
+# ---------- import ----------
+
+class _Importer:
+    def __init__(self, db: Session, user_id: Optional[int]):
+        self.db = db
+        self.user_id = user_id
+        self.renamed: Dict[str, str] = {}        # filnavn i arkivet -> navn her (sha256-navnet)
+        self.masters: Dict[str, Optional[str]] = {}  # stamme i arkivet -> master skrevet her (None: fantes)
+        self.files: Set[str] = set()             # mastere arkivet har levert (navn her)
+        self.orphans = 0                         # filer uten eier etter importen (ryddes av media_gc)
+        self.changed_clothes: List[int] = []     # plagg med nytt bilde (likhetsindeksen)
+        self.stats = {
+            "clothes": {"created": 0, "updated": 0, "conflicts": 0, "invalid": 0, "no_image": 0},
+            "looks": {"created": 0, "updated": 0, "conflicts": 0, "invalid": 0, "no_image": 0},
+            "look_clothes": 0,
+            "media": {"written": 0, "skipped": 0, "renamed": 0, "rejected": 0, "bytes": 0},
+        }
+
+    # ----- filer -----
+
+    def media(self, arcname: str, src: BinaryIO) -> None:
+        """
+        Én fil fra media/. Bare mastere og renditions av mastere som ble
+        skrevet fra dette arkivet tas inn, og bare hvis headeren kan leses
+        og formatet stemmer med endelsen. En master beholder navnet sitt
+        bare når navnet er sha256 av innholdet, eller en identisk fil
+        ligger der fra før; ellers lagres den under sha256-navnet og radene
+        pekes dit. Et arkiv kan altså aldri lage et navn som dedupe ved
+        opplasting stoler på med annet innhold enn navnet sier.
+        """
+        name = os.path.basename(arcname)
+        if not name or name.startswith(".") or name != arcname.rsplit("/", 1)[-1]:
+            return
+        stats = self.stats["media"]
+        stem, ext = os.path.splitext(name)
+        if ext in renditions.MASTER_EXTS:
+            rendition_of = None
+        elif renditions.is_rendition(name):
+            rendition_of = renditions.parse_rendition(stem)
+            if rendition_of not in self.masters:
+                stats["rejected"] += 1
+                return
+        else:
+            stats["rejected"] += 1
+            return
+
+        fd, tmp = tempfile.mkstemp(dir=media_store.MEDIA_DIR, prefix=".tmp-")
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "w+b") as fh:
+                for chunk in _file_chunks(src):
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    fh.write(chunk)
+                fh.seek(0)
+                try:
+                    fmt = probe_image(fh)
+                except ValueError:
+                    fmt = None
+            digest = hasher.hexdigest()
+            if fmt != _IMAGE_FORMATS.get(ext.lower()):
+                stats["rejected"] += 1
+                os.remove(tmp)
+                return
+
+            if rendition_of is not None:
+                master = self.masters[rendition_of]
+                # masteren fantes fra før: den har (eller får) sine egne renditions
+                target_name = master and renditions.rendition_filename(master, int(stem.rsplit("_", 1)[1]))
+            else:
+                prefix = "look_" if stem.startswith("look_") else ""
+                if stem[len(prefix):] == digest or (
+                        media_store.exists(name) and _sha256_file(media_store.path_for(name)) == digest):
+                    target_name = name
+                else:
+                    target_name = f"{prefix}{digest}{ext.lower()}"
+                    self.renamed[name] = target_name
+                    stats["renamed"] += 1
+                self.files.add(target_name)
+                if media_store.exists(target_name):
+                    target_name = None
+                self.masters[stem] = target_name
+
+            if not target_name or media_store.exists(target_name):
+                stats["skipped"] += 1
+                os.remove(tmp)
+                return
+            target_rel = media_store.relpath(target_name)
+            target = os.path.join(media_store.MEDIA_DIR, *target_rel.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp, target)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        media_index.add(target_rel)
+        stats["written"] += 1
+        stats["bytes"] += size
+
+    def _url(self, url: Optional[str]) -> Optional[str]:
+        """image_url fra arkivet -> URL her (nytt navn og/eller ny undermappe)."""
+        name = media_store.filename_from_url(url)
+        if not name:
+            return url
+        return media_store.url_for(self.renamed.get(name, name))
+
+    # ----- rader -----
+
+    def _existing(self, model, ids: List[int]) -> Dict[int, Any]:
+        return {r.id: r for r in self.db.execute(
+            select(model.id, model.user_id, model.image_url).where(model.id.in_(ids)))}
+
+    def _foreign(self, names: Iterable[Optional[str]]) -> Set[str]:
+        """
+        Filnavnene som verken kom fra arkivet eller allerede brukes av
+        brukerens egne rader. En rad får ikke peke på dem: filen kan
+        tilhøre en annen bruker.
+        """
+        unknown = {n for n in names if n} - self.files
+        if not unknown:
+            return set()
+        urls: Dict[str, str] = {}
+        for n in unknown:
+            for url in (f"/media/{n}", f"/media/{media_paths.relpath(n)}", media_store.url_for(n)):
+                urls[url] = n
+        known: Set[str] = set()
+        chunks = [list(urls)[i:i + SQL_CHUNK] for i in range(0, len(urls), SQL_CHUNK)]
+        for model in (Cloth, Look):
+            for chunk in chunks:
+                known.update(urls[u] for u in self.db.execute(
+                    select(model.image_url).where(owned_by(model.user_id, self.user_id),
+                                                  model.image_url.in_(chunk))).scalars())
+        return unknown - known
+
+    def _upsert(self, model, rows: List[dict], fields: Tuple[str, ...]) -> List[int]:
+        """Upsert rows (på id) for brukeren. Returnerer id-ene som ble skrevet."""
+        label = model.__tablename__
+        stats = self.stats[label]
+        existing = self._existing(model, [r["id"] for r in rows])
+        foreign = self._foreign(media_store.filename_from_url(r["image_url"]) for r in rows)
+        accepted, acquire = [], {}
+        now = datetime.utcnow()
+        for r in rows:
+            old = existing.get(r["id"])
+            if old is not None and old.user_id != self.user_id:
+                stats["conflicts"] += 1
+                continue
+            name = media_store.filename_from_url(r["image_url"])
+            if name in foreign:
+                # raden beholdes uten bilde: plagget som "failed" (som når behandlingen feiler),
+                # looken kan tegnes på nytt fra layouten (POST /api/looks/render)
+                stats["no_image"] += 1
+                r = {**r, "image_url": "", "status": "failed"} if model is Cloth else \
+                    {**r, "image_url": None, "render_key": None}
+                name = None
+            old_name = media_store.filename_from_url(old.image_url) if old is not None else None
+            if name != old_name:
+                if name:
+                    acquire[name] = acquire.get(name, 0) + 1
+                if old_name and media_store.release(self.db, old.image_url):
+                    self.orphans += 1
+                if old is not None and model is Cloth:
+                    self.changed_clothes.append(r["id"])
+            stats["updated" if old is not None else "created"] += 1
+            accepted.append({**r, "user_id": self.user_id, "job_id": None, "updated_at": now})
+        if not accepted:
+            return []
+        media_store.acquire_many(self.db, acquire)
+        table = model.__table__
+        if self.db.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={**{f: stmt.excluded[f] for f in fields if f != "id"}, "updated_at": stmt.excluded.updated_at},
+        )
+        self.db.execute(stmt, accepted)
+        return [r["id"] for r in accepted]
+
+    def clothes(self, src: BinaryIO) -> None:
+        valid = {c.value for c in ClothCategory}
+        rows = []
+        for r in _ndjson(src):
+            try:
+                row = {
+                    "id": int(r["id"]),
+                    "name": str(r["name"]),
+                    "category": ClothCategory(r["category"]) if r["category"] in valid else None,
+                    "image_url": self._url(r["image_url"]),
+                    "created_at": _parse_dt(r.get("created_at")),
+                    "status": r.get("status") if r.get("status") in ("ready", "failed") else "ready",
+                }
+            except (KeyError, TypeError, ValueError):
+                row = None
+            if row is None or row["category"] is None or not row["image_url"]:
+                self.stats["clothes"]["invalid"] += 1
+                continue
+            rows.append(row)
+        if rows:
+            self._upsert(Cloth, rows, CLOTH_FIELDS + ("user_id", "job_id"))
+        self.db.commit()
+
+    def looks(self, src: BinaryIO) -> None:
+        rows = []
+        for r in _ndjson(src):
+            try:
+                row = {
+                    "id": int(r["id"]),
+                    "title": r.get("title"),
+                    "image_url": self._url(r.get("image_url")),
+                    "created_at": _parse_dt(r.get("created_at")),
+                    "layout": r.get("layout") if isinstance(r.get("layout"), dict) else None,
+                    "render_key": r.get("render_key"),
+                    "status": r.get("status") if r.get("status") in ("ready", "failed") else "ready",
+                }
+            except (KeyError, TypeError, ValueError):
+                self.stats["looks"]["invalid"] += 1
+                continue
+            rows.append(row)
+        if rows:
+            ids = self._upsert(Look, rows, LOOK_FIELDS + ("user_id", "job_id"))
+            if ids:
+                # plaggene til disse looksene kommer fra look_clothes-delene
+                self.db.execute(delete(look_clothes).where(look_clothes.c.look_id.in_(ids)))
+        self.db.commit()
+
+    def look_clothes(self, src: BinaryIO) -> None:
+        pairs = set()
+        for r in _ndjson(src):
+            try:
+                pairs.add((int(r["look_id"]), int(r["cloth_id"])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if not pairs:
+            return
+        looks = set(self.db.execute(select(Look.id).where(
+            Look.id.in_({p[0] for p in pairs}), owned_by(Look.user_id, self.user_id))).scalars())
+        clothes = set(self.db.execute(select(Cloth.id).where(
+            Cloth.id.in_({p[1] for p in pairs}), owned_by(Cloth.user_id, self.user_id))).scalars())
+        rows = [{"look_id": lk, "cloth_id": c} for lk, c in sorted(pairs) if lk in looks and c in clothes]
+        if rows:
+            if self.db.get_bind().dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            self.db.execute(insert(look_clothes).on_conflict_do_nothing(), rows)
+        self.stats["look_clothes"] += len(rows)
+        self.db.commit()
+
+
+def _parse_dt(raw: Any) -> datetime:
+    if raw in (None, ""):
+        return datetime.utcnow()
+    return datetime.fromisoformat(str(raw))
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in _file_chunks(fh):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def import_archive(db: Session, fp: BinaryIO, *, user_id: Optional[int] = None) -> dict:
+    """
+    Les et arkiv fra export_archive inn for user_id. Committer del for del;
+    returnerer tellinger og hvilke plagg som fikk nytt bilde (for
+    likhetsindeksen) og filer som kan slettes.
+    """
+    imp = _Importer(db, user_id)
+    seen_manifest = False
+    for name, src in _entries(fp):
+        if name == "manifest.json":
+            try:
+                manifest = json.loads(src.read() or b"{}")
+            except ValueError:
+                raise ArchiveError("manifest.json er ikke gyldig JSON")
+            if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+                raise ArchiveError("Ikke et Looksy-arkiv (manifest.json mangler format)")
+            try:
+                version = int(manifest.get("version", 0))
+            except (TypeError, ValueError):
+                raise ArchiveError("manifest.json har ugyldig versjon")
+            if version > VERSION:
+                raise ArchiveError(f"Arkivet er versjon {manifest.get('version')}; denne appen leser til {VERSION}")
+            seen_manifest = True
+            continue
+        if not seen_manifest:
+            raise ArchiveError("manifest.json må ligge først i arkivet")
+        top = name.split("/", 1)[0]
+        if top == "media":
+            imp.media(name, src)
+        elif top == "clothes" and name.endswith(".ndjson"):
+            imp.clothes(src)
+        elif top == "looks" and name.endswith(".ndjson"):
+            imp.looks(src)
+        elif top == "look_clothes" and name.endswith(".ndjson"):
+            imp.look_clothes(src)
+    if not seen_manifest:
+        raise ArchiveError("Tomt arkiv eller manifest.json mangler")
+    return {**imp.stats, "changed_clothes": imp.changed_clothes, "orphaned_files": imp.orphans}
@@ -0,0 +1,205 @@
+# backend/services/atlas.py
+"""
+Sprite-atlas for plagglistene: én side med plagg pakket som faste ruter
+(tile x tile px) i ett WebP-bilde, pluss et koordinatkart. Klienten
+henter da ett bilde per side i stedet for ett per plagg.
+
+Atlaset er navngitt etter innholdet: nøkkelen er en hash av rutestørrelsen
+og (id, image_url) for hver rute. image_url er innholdsadressert og er
+dermed plaggets bildeversjon – et nytt, slettet eller flyttet plagg gir
+en ny nøkkel, et nytt navn gjør det ikke. Ferdige atlas ligger i en
+disk-LRU: bildet (<nøkkel>.webp) og kartet med URL-ene per rute
+(<nøkkel>.json), så bildet kan bygges på nytt uten databasen.
+
+Når en side endres (opplasting, sletting, ny kategori), bygges det nye
+atlaset ut fra det forrige for samme side: ruter for bilder som fortsatt
+er med klippes ut av det gamle atlaset, og bare de nye dekodes.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from io import BytesIO
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from .. import config
+from ..metrics import stage
+from . import compositor, serialize
+from .result_cache import DiskLRUCache
+
+logger = logging.getLogger("looksy")
+
+TILE_SIZES = tuple(config.ATLAS_TILE_SIZES)
+
+_KEY_RE = re.compile(r"^[0-9a-f]{32}$")
+
+images = DiskLRUCache(config.ATLAS_CACHE_DIR, config.ATLAS_CACHE_MAX_BYTES, suffix=".webp")
+maps = DiskLRUCache(config.ATLAS_CACHE_DIR, max(1, config.ATLAS_CACHE_MAX_BYTES // 16), suffix=".json")
+
+# siste atlas per side: (user_id, kategori, side, rute) -> nøkkel
+_slots: Dict[Hashable, str] = {}
+_build_lock = threading.Lock()
+_counts = {"built": 0, "reused": 0, "decoded": 0}
+
+
+# ---------- geometri ----------
+
+def _grid(n: int, tile: int) -> Tuple[int, int, int]:
+    """(kolonner, bredde, høyde) for n ruter."""
+    cols = max(1, min(config.ATLAS_COLUMNS, n))
+    rows = max(1, -(-n // cols))
+    return cols, cols * tile, rows * tile
+
+
+def _cell(i: int, cols: int, tile: int) -> Tuple[int, int]:
+    return (i % cols) * tile, (i // cols) * tile
+
+
+def atlas_key(tile: int, tiles: Sequence[Tuple[int, Optional[str]]]) -> str:
+    payload = json.dumps([tile, list(tiles)], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def valid_key(key: str) -> bool:
+    return bool(_KEY_RE.match(key))
+
+
+# ---------- bygging ----------
+
+def _tile(image_url: str, tile: int) -> Optional[Image.Image]:
+    """Plagget skalert inn i en gjennomsiktig rute, midtstilt."""
+    path = compositor.source_path(image_url, tile)
+    if path is None:
+        return None
+    try:
+        with Image.open(path) as src:
+            src.draft("RGB", (tile, tile))
+            img = src.convert("RGBA")
+    except OSError as e:
+        logger.warning(f"Atlas: kunne ikke lese {path}: {e}")
+        return None
+    img.thumbnail((tile, tile), Image.LANCZOS)
+    cell = Image.new("RGBA", (tile, tile), (0, 0, 0, 0))
+    cell.paste(img, ((tile - img.width) // 2, (tile - img.height) // 2))
+    return cell
+
+
+def _load_map(key: str) -> Optional[dict]:
+    data = maps.get(key)
+    if data is None:
+        return None
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def _previous_tiles(key: Optional[str], tile: int, wanted: set) -> Dict[str, Image.Image]:
+    """Rutene fra et tidligere atlas som kan gjenbrukes (image_url -> rute)."""
+    spec = _load_map(key) if key else None
+    if not spec or spec.get("tile") != tile or not wanted.intersection(spec["tiles"]):
+        return {}
+    data = images.get(key)
+    if data is None:
+        return {}
+    out: Dict[str, Image.Image] = {}
+    cols, _w, _h = _grid(len(spec["tiles"]), tile)
+    with Image.open(BytesIO(data)) as sheet:
+        sheet = sheet.convert("RGBA")
+        for i, url in enumerate(spec["tiles"]):
+            if url in wanted and url not in out:
+                x, y = _cell(i, cols, tile)
+                out[url] = sheet.crop((x, y, x + tile, y + tile))
+    return out
+
+
+def _build(key: str, tile: int, tiles: List[Optional[str]], previous: Optional[str] = None) -> bytes:
+    with _build_lock:
+        data = images.get(key)
+        if data is not None:
+            return data
+        reuse = _previous_tiles(previous, tile, {u for u in tiles if u})
+        cols, width, height = _grid(len(tiles), tile)
+        sheet = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        for i, url in enumerate(tiles):
+            if not url:
+                continue
+            cell = reuse.get(url)
+            if cell is not None:
+                _counts["reused"] += 1
+            else:
+                cell = _tile(url, tile)
+                if cell is None:
+                    continue
+                _counts["decoded"] += 1
+            sheet.paste(cell, _cell(i, cols, tile))
+        buf = BytesIO()
+        with stage("atlas_encode"):
+            sheet.save(buf, format="WEBP", quality=config.ATLAS_WEBP_QUALITY, method=4)
+        data = buf.getvalue()
+        # kartet først: finnes bildet, finnes også oppskriften på det
+        maps.put(key, json.dumps({"tile": tile, "tiles": tiles}).encode("utf-8"))
+        images.put(key, data)
+        _counts["built"] += 1
+        return data
+
+
+def image(key: str) -> Optional[bytes]:
+    """WebP-bytene for et atlas, bygget på nytt fra kartet hvis bildet er kastet."""
+    if not valid_key(key):
+        return None
+    data = images.get(key)
+    if data is not None:
+        return data
+    spec = _load_map(key)
+    if spec is None:
+        return None
+    return _build(key, spec["tile"], spec["tiles"])
+
+
+# ---------- API ----------
+
+def page_map(rows: Sequence[Any], *, tile: int, slot: Hashable, page: int, has_more: bool) -> Dict[str, Any]:
+    """
+    Kartet for én side: plaggene (ClothOut-dict-er) med "sprite" = ruten i
+    atlaset ({x, y, w, h} i px), eller None for plagg uten ferdig bilde.
+    Atlaset bygges her hvis det mangler, så bildet er klart når klienten ber om det.
+    """
+    tiles = [r.image_url if (r.status or "ready") == "ready" else None for r in rows]
+    cols, width, height = _grid(len(rows), tile)
+    key = None
+    if any(tiles):
+        key = atlas_key(tile, [(r.id, url) for r, url in zip(rows, tiles)])
+        if key not in images:
+            _build(key, tile, tiles, previous=_slots.get((slot, tile)))
+        _slots[(slot, tile)] = key
+
+    items = []
+    for i, (row, url) in enumerate(zip(rows, tiles)):
+        item = serialize.cloth_dict(row)
+        if url:
+            x, y = _cell(i, cols, tile)
+            item["sprite"] = {"x": x, "y": y, "w": tile, "h": tile}
+        else:
+            item["sprite"] = None
+        items.append(item)
+    return {
+        "key": key,
+        "page": page,
+        "next_page": page + 1 if has_more else None,
+        "tile": tile,
+        "columns": cols,
+        "width": width,
+        "height": height,
+        "items": items,
+    }
+
+
+def stats() -> dict:
+    return {**images.stats(), "built": _counts["built"],
+            "tiles_reused": _counts["reused"], "tiles_decoded": _counts["decoded"]}
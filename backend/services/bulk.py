@@ -0,0 +1,82 @@
+# backend/services/bulk.py
+"""
+Mange oppdateringer og slettinger av plagg eller looks i én transaksjon,
+med mengdebasert SQL i stedet for én runde per rad: én UPDATE ... SET
+kolonne = CASE id WHEN ... END og én DELETE per bit av id-er.
+
+Filene bak slettede rader slettes ikke her. Referansetellingen senkes i
+samme transaksjon, og filer uten eier ryddes senere av media_gc
+(python -m backend.media_gc), så en feil på disken aldri kan gi en rad
+uten fil eller stoppe transaksjonen.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.orm import Session
+
+from . import media_store
+from .users import owned_by
+
+# SQLite: maks bundne parametre per setning (999 i eldre versjoner)
+CHUNK = 900
+
+
+class BulkResult(NamedTuple):
+    updated: List[int]
+    deleted: List[int]
+    missing: List[int]            # finnes ikke, eller tilhører en annen bruker
+    orphaned: List[str]           # filnavn uten eier etter slettingen
+
+
+def _chunks(ids: Sequence[int]):
+    for i in range(0, len(ids), CHUNK):
+        yield ids[i:i + CHUNK]
+
+
+def apply_bulk(
+    db: Session,
+    model,
+    user_id: Optional[int],
+    updates: Dict[int, Dict[str, Any]],
+    deletes: Sequence[int],
+    *,
+    before_delete: Optional[Callable[[List[int]], None]] = None,
+) -> BulkResult:
+    """
+    updates: id -> {kolonne: ny verdi}; deletes: id-er. Bare radene til
+    user_id berøres, og en rad som både oppdateres og slettes slettes.
+    Callerens transaksjon – commit gjøres av caller.
+    """
+    wanted = sorted(set(updates) | set(deletes))
+    owned: Dict[int, Optional[str]] = {}
+    for chunk in _chunks(wanted):
+        owned.update(db.execute(
+            select(model.id, model.image_url).where(model.id.in_(chunk), owned_by(model.user_id, user_id))
+        ).all())
+    missing = [i for i in wanted if i not in owned]
+    deleted = sorted({i for i in deletes if i in owned})
+    gone = set(deleted)
+    updated = [i for i in sorted(updates) if i in owned and i not in gone and updates[i]]
+
+    now = datetime.utcnow()
+    for chunk in _chunks(updated):
+        values: Dict[str, Any] = {}
+        for col in sorted({c for i in chunk for c in updates[i]}):
+            mapping = {i: updates[i][col] for i in chunk if col in updates[i]}
+            attr = getattr(model, col)
+            values[col] = case(mapping, value=model.id, else_=attr)
+        values["updated_at"] = now
+        db.execute(
+            update(model).where(model.id.in_(chunk)).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    for chunk in _chunks(deleted):
+        if before_delete is not None:
+            before_delete(chunk)
+        db.execute(delete(model).where(model.id.in_(chunk)).execution_options(synchronize_session=False))
+    orphaned = media_store.release_many(db, (owned[i] for i in deleted))
+    return BulkResult(updated, deleted, missing, orphaned)
@@ -0,0 +1,306 @@
+# backend/services/changes.py
+"""
+Endringslogg for plagg og looks, så klientene kan synke små differ i
+stedet for å hente hele listene på nytt.
+
+Triggere på clothes, looks og look_clothes skriver én rad i `changes` per
+endret rad: ("cloth"|"look", id, eier, "upsert"|"delete"). Slik kommer
+alle skriveveier med – ORM, bulk-insert fra importen, arkiv-import og
+statusoppdateringer fra jobbkøen – og slettinger etterlater en tombstone.
+Endret medlemskap (look_clothes) logges som en endring på looken.
+
+Markøren er id-en til siste endring klienten har sett. På Postgres tar
+triggeren en transaksjonslås først, så id-ene blir synlige i stigende
+rekkefølge og en klient aldri hopper over en endring som committes sent.
+
+delta() slår sammen endringene per rad og henter radene slik de er nå:
+en rad som finnes er "upserted" (hele ClothOut/LookOut), en som ikke
+finnes er "deleted". Feed vekker SSE-strømmene når det kommer nye rader.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..models import Change, Look
+from . import serialize
+from .users import owned_by
+
+logger = logging.getLogger("looksy")
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# (tabell, type i loggen)
+SOURCES = (("clothes", "cloth"), ("looks", "look"))
+
+
+class CursorGone(Exception):
+    """Markøren er eldre enn loggen (ryddet bort) eller ukjent – hent alt på nytt."""
+
+
+# ---------- triggere ----------
+
+def _sqlite_ddl() -> List[str]:
+    ddl = []
+    for table, kind in SOURCES:
+        for event, row, op in (("INSERT", "new", UPSERT), ("UPDATE", "new", UPSERT), ("DELETE", "old", DELETE)):
+            ddl.append(
+                f"CREATE TRIGGER IF NOT EXISTS changes_{table}_{event[0].lower()} AFTER {event} ON {table} BEGIN "
+                f"INSERT INTO changes(kind, target_id, user_id, op) "
+                f"VALUES ('{kind}', {row}.id, {row}.user_id, '{op}'); END"
+            )
+    # nytt/fjernet plagg i en look: looken er endret (finnes den ikke lenger, logges ingenting her)
+    for event, row in (("INSERT", "new"), ("DELETE", "old")):
+        ddl.append(
+            f"CREATE TRIGGER IF NOT EXISTS changes_look_clothes_{event[0].lower()} AFTER {event} ON look_clothes BEGIN "
+            f"INSERT INTO changes(kind, target_id, user_id, op) "
+            f"SELECT 'look', id, user_id, '{UPSERT}' FROM looks WHERE id = {row}.look_id; END"
+        )
+    return ddl
+
+
+# vilkårlig, men fast nøkkel for pg_advisory_xact_lock
+_PG_LOCK = 7461_2024
+
+_PG_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION looksy_log_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock({_PG_LOCK});
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO changes(kind, target_id, user_id, op) VALUES (TG_ARGV[0], OLD.id, OLD.user_id, '{DELETE}');
+            RETURN OLD;
+        END IF;
+        INSERT INTO changes(kind, target_id, user_id, op) VALUES (TG_ARGV[0], NEW.id, NEW.user_id, '{UPSERT}');
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION looksy_log_look_member() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock({_PG_LOCK});
+        INSERT INTO changes(kind, target_id, user_id, op)
+        SELECT 'look', id, user_id, '{UPSERT}' FROM looks
+        WHERE id = CASE WHEN TG_OP = 'DELETE' THEN OLD.look_id ELSE NEW.look_id END;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+    """,
+]
+
+
+def _pg_triggers() -> List[str]:
+    ddl = []
+    for table, kind in SOURCES:
+        ddl += [
+            f"DROP TRIGGER IF EXISTS changes_{table} ON {table}",
+            f"CREATE TRIGGER changes_{table} AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION looksy_log_change('{kind}')",
+        ]
+    ddl += [
+        "DROP TRIGGER IF EXISTS changes_look_clothes ON look_clothes",
+        "CREATE TRIGGER changes_look_clothes AFTER INSERT OR DELETE ON look_clothes "
+        "FOR EACH ROW EXECUTE FUNCTION looksy_log_look_member()",
+    ]
+    return ddl
+
+
+def install(engine: Engine) -> None:
+    """Opprett triggerne (idempotent). Kalles fra init_db."""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        ddl = _sqlite_ddl()
+    elif dialect == "postgresql":
+        ddl = _PG_DDL + _pg_triggers()
+    else:
+        logger.warning(f"Endringslogg: ingen triggere for {dialect} – /api/changes ser ingen endringer.")
+        return
+    with engine.begin() as conn:
+        if conn.exec_driver_sql("SELECT 1 FROM changes LIMIT 1").first() is None:
+            # tom logg (ny tabell): radene som finnes fra før regnes som endret nå
+            for table, kind in SOURCES:
+                conn.exec_driver_sql(
+                    f"INSERT INTO changes(kind, target_id, user_id, op) "
+                    f"SELECT '{kind}', id, user_id, '{UPSERT}' FROM {table} ORDER BY id"
+                )
+        for sql in ddl:
+            conn.exec_driver_sql(sql)
+
+
+# ---------- lesing ----------
+
+def latest(db: Session) -> int:
+    """Markøren for "nå" (id-en til siste endring, 0 for tom logg)."""
+    return db.execute(select(func.max(Change.id))).scalar() or 0
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None or cursor == "":
+        return None
+    try:
+        value = int(cursor)
+    except ValueError:
+        raise ValueError("Ugyldig markør")
+    if value < 0:
+        raise ValueError("Ugyldig markør")
+    return value
+
+
+def delta(db: Session, since: int, user_id: Optional[int], limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Endringene for user_id etter markøren `since`, sammenslått per rad:
+    {"cursor", "has_more", "clothes": {"upserted", "deleted"}, "looks": {...}}.
+    Med has_more er det flere endringer – spør igjen med den nye markøren.
+    """
+    limit = limit or config.CHANGES_PAGE_SIZE
+    # "nå" leses før endringene: det som committes imens kommer med neste gang
+    head = latest(db)
+    if since > head:
+        raise CursorGone("Ukjent markør")
+    oldest = db.execute(select(func.min(Change.id))).scalar()
+    if oldest is not None and since < oldest - 1:
+        raise CursorGone("Markøren er eldre enn endringsloggen")
+
+    rows = db.execute(
+        select(Change.id, Change.kind, Change.target_id)
+        .where(Change.id > since, Change.id <= head, owned_by(Change.user_id, user_id))
+        .order_by(Change.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    touched: Dict[str, Dict[int, None]] = {"cloth": {}, "look": {}}
+    for row in rows:
+        touched.setdefault(row.kind, {})[row.target_id] = None
+
+    clothes = serialize.clothes_by_id(db, list(touched["cloth"]))
+    look_rows = []
+    if touched["look"]:
+        look_rows = db.execute(select(*serialize.LOOK_COLUMNS).where(Look.id.in_(list(touched["look"])))).all()
+    looks = {d["id"]: d for d in serialize.look_dicts(db, look_rows)}
+
+    return {
+        "cursor": str(rows[-1].id if has_more else head),
+        "has_more": has_more,
+        "clothes": {"upserted": [clothes[i] for i in touched["cloth"] if i in clothes],
+                    "deleted": [i for i in touched["cloth"] if i not in clothes]},
+        "looks": {"upserted": [looks[i] for i in touched["look"] if i in looks],
+                  "deleted": [i for i in touched["look"] if i not in looks]},
+    }
+
+
+def is_empty(out: Dict[str, Any]) -> bool:
+    return not any(out[k][part] for k in ("clothes", "looks") for part in ("upserted", "deleted"))
+
+
+def prune(db: Session, days: Optional[int] = None) -> int:
+    """
+    Slett endringer eldre enn `days` dager. Den nyeste beholdes alltid, så
+    markøren aldri går bakover (SQLite gjenbruker ellers høyeste id).
+    """
+    days = config.CHANGES_RETENTION_DAYS if days is None else days
+    head = latest(db)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    n = db.execute(delete(Change).where(Change.at < cutoff, Change.id < head)).rowcount or 0
+    db.commit()
+    return n
+
+
+# ---------- varsling (SSE) ----------
+
+class Feed:
+    """
+    Én poller per prosess: ser etter nye rader i `changes` mens noen lytter
+    (endringer fra jobbarbeidere og andre web-workere kommer bare via
+    databasen) og vekker ventende strømmer. Rydder også gamle endringer.
+
+    Hooks (on_change) kjøres i trådpoolen når det er nye rader; da polles
+    det også uten lyttere. Slik holder prosessens egne minnestrukturer
+    (likhetsindeksen) seg i takt med de andre prosessene.
+    """
+
+    def __init__(self, interval: float, prune_every_s: float = 3600.0):
+        self.interval = interval
+        self.prune_every_s = prune_every_s
+        self.head = 0
+        self.listeners = 0
+        self._session_factory: Optional[Callable[[], Session]] = None
+        self._cond: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pruned_at = 0.0
+        self._hooks: List[Callable[[], None]] = []
+
+    def on_change(self, fn: Callable[[], None]) -> None:
+        self._hooks.append(fn)
+
+    def _latest(self) -> int:
+        with self._session_factory() as db:
+            return latest(db)
+
+    def _prune(self) -> None:
+        with self._session_factory() as db:
+            n = prune(db)
+        if n:
+            logger.info(f"Endringslogg: slettet {n} gamle endringer")
+
+    async def start(self, session_factory: Callable[[], Session]) -> None:
+        self._session_factory = session_factory
+        self._cond = asyncio.Condition()
+        self.head = await run_in_threadpool(self._latest)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if time.monotonic() - self._pruned_at > self.prune_every_s:
+                    self._pruned_at = time.monotonic()
+                    await run_in_threadpool(self._prune)
+                if not self.listeners and not self._hooks:
+                    continue
+                head = await run_in_threadpool(self._latest)
+            except Exception as e:  # databasen borte et øyeblikk – prøv igjen neste runde
+                logger.warning(f"Endringslogg: kunne ikke lese changes: {e}")
+                continue
+            if head != self.head:
+                self.head = head
+                async with self._cond:
+                    self._cond.notify_all()
+                for fn in self._hooks:
+                    try:
+                        await run_in_threadpool(fn)
+                    except Exception as e:
+                        logger.warning(f"Endringslogg: hook feilet: {e}")
+
+    async def wait(self, after: int, timeout: float) -> int:
+        """Vent til det finnes endringer etter `after` (eller timeout). Returnerer siste markør."""
+        if self.head > after or self._cond is None:
+            return self.head
+        try:
+            async with self._cond:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self.head > after), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.head
+
+
+feed = Feed(config.CHANGES_POLL_S)
@@ -1,26 +1,45 @@
 # backend/services/clothes_service.py
 from __future__ import annotations
 
-import os
-import uuid
 from io import BytesIO
-from typing import Iterable, Optional
+from typing import BinaryIO, Iterable, List, Optional, Sequence, Union
 
-from PIL import Image, UnidentifiedImageError
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from .. import config
+from ..metrics import stage
 from ..models import Cloth, ClothCategory
+from . import atlas, jobs, media_store, pagination, pipeline, renditions, serialize
+from .bulk import BulkResult, apply_bulk
+from .response_cache import bump_clothes
+from .similarity import features_for_url, index as similarity_index
+from .uploads import open_image, probe_image
+from .users import owned_by
+from .pagination import Page
 
+# felt som kan velges med ?fields=
+LIST_FIELDS = ("id", "name", "category", "image_url", "created_at", "renditions", "thumbnail", "status",
+               "updated_at")
 
-MEDIA_DIR = os.path.join(os.path.dirname(__file__), "..", "media")
-os.makedirs(MEDIA_DIR, exist_ok=True)
+
+class DuplicateCloth(Exception):
+    """Bildet er (nesten) likt et plagg som allerede finnes."""
+
+    def __init__(self, ids: List[int]):
+        super().__init__(f"Mulig duplikat av plagg {', '.join(map(str, ids))}")
+        self.ids = ids
 
 
 class ClothesService:
-    """Forretningslogikk for plagg (Cloth). Routeren kaller denne."""
+    """
+    Forretningslogikk for plagg (Cloth). Routeren kaller denne.
+    Alt gjelder plaggene til user_id (de delte med user_id NULL når None).
+    """
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, user_id: Optional[int] = None):
         self.db = db
+        self.user_id = user_id
 
     # ---------- helpers ----------
 
@@ -30,63 +49,254 @@ class ClothesService:
         if category not in valid:
             raise ValueError(f"Ugyldig kategori. Gyldige: {', '.join(sorted(valid))}")
 
-    @staticmethod
-    def _save_png(content: bytes) -> str:
-        """Konverterer til PNG, lagrer på disk, og returnerer image_url."""
-        try:
-            img = Image.open(BytesIO(content)).convert("RGBA")
-        except (UnidentifiedImageError, OSError):
-            raise ValueError("Kunne ikke lese bildefilen (støttes kun JPG/PNG).")
-
-        filename = f"{uuid.uuid4().hex}.png"
-        path = os.path.join(MEDIA_DIR, filename)
-        img.save(path, format="PNG")
-        return f"/media/{filename}"
+    def _save_png(self, content: Union[bytes, BinaryIO], content_hash: Optional[str] = None) -> str:
+        """
+        Konverterer til PNG, lagrer innholdsadressert på disk og returnerer
+        image_url. Har vi sett de samme bytene før, gjenbrukes filen uten
+        ny dekoding/koding – bare referansetelleren økes.
+        content kan være bytes eller en (spolt) fil; for filer må
+        content_hash være sha256 av innholdet.
+        """
+        if isinstance(content, (bytes, bytearray)):
+            content_hash = content_hash or media_store.content_hash(content)
+            content = BytesIO(content)
+        elif not content_hash:
+            raise ValueError("content_hash mangler for filinnhold")
 
-    @staticmethod
-    def _delete_file_if_exists(image_url: Optional[str]) -> None:
-        try:
-            if image_url and image_url.startswith("/media/"):
-                filename = os.path.basename(image_url)
-                path = os.path.join(MEDIA_DIR, filename)
-                if os.path.exists(path):
-                    os.remove(path)
-        except Exception:
-            # Bevisst "best effort" – vi lar ikke filfeil krasje api-kallet.
-            pass
+        filename = f"{content_hash}.png"
+        if not media_store.exists(filename):
+            img = open_image(content).convert("RGBA")
+            buf = BytesIO()
+            with stage("png_encode"):
+                img.save(buf, format="PNG")
+            media_store.write_atomic(filename, buf.getvalue())
+            renditions.generate(img, media_store.path_for(filename))
+
+        media_store.acquire(self.db, filename)
+        return media_store.url_for(filename)
+
+    def _owned(self):
+        return owned_by(Cloth.user_id, self.user_id)
 
     # ---------- API-orienterte metoder ----------
 
-    def list(self, category: Optional[str] = None) -> Iterable[Cloth]:
-        q = self.db.query(Cloth).order_by(Cloth.created_at.desc())
+    def page(
+        self,
+        category: Optional[str] = None,
+        *,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[Sequence[str]] = None,
+        as_dicts: bool = False,
+    ) -> Page:
+        """
+        Én side med plagg, nyeste først. Uten limit returneres alt.
+        Med fields hentes bare de nødvendige kolonnene, og items blir dict-er.
+        Med as_dicts blir items ClothOut-formede dict-er rett fra kolonnene
+        (ingen ORM-objekter, se services/serialize.py).
+        """
+        if fields:
+            q = select(*pagination.columns_for(Cloth, fields))
+        elif as_dicts:
+            q = select(*serialize.CLOTH_COLUMNS)
+        else:
+            q = select(Cloth)
+        q = q.where(self._owned())
+        if category:
+            self._validate_category(category)
+            q = q.where(Cloth.category == category)
+        q = pagination.apply_keyset(q, Cloth.created_at, Cloth.id, cursor=cursor, limit=limit)
+
+        result = self.db.execute(q)
+        page = pagination.finish_page(result.all() if fields or as_dicts else result.scalars().all(), limit)
+        if fields:
+            return Page(pagination.project(page.items, fields), page.next_cursor)
+        if as_dicts:
+            return Page([serialize.cloth_dict(r) for r in page.items], page.next_cursor)
+        return page
+
+    def atlas(self, category: Optional[str] = None, *, page: int = 0, tile: Optional[int] = None) -> dict:
+        """
+        Én side (ATLAS_PAGE_SIZE plagg, samme rekkefølge som page()) som
+        sprite-atlas + koordinatkart, se services/atlas.py.
+        """
+        tile = tile or atlas.TILE_SIZES[0]
+        if tile not in atlas.TILE_SIZES:
+            raise ValueError(f"Ugyldig rutestørrelse. Gyldige: {', '.join(map(str, atlas.TILE_SIZES))}")
         if category:
             self._validate_category(category)
-            q = q.filter(Cloth.category == category)
-        return q.all()
+        size = config.ATLAS_PAGE_SIZE
+        q = select(*serialize.CLOTH_COLUMNS).where(self._owned())
+        if category:
+            q = q.where(Cloth.category == category)
+        q = q.order_by(Cloth.created_at.desc(), Cloth.id.desc()).offset(page * size).limit(size + 1)
+        rows = self.db.execute(q).all()
+        return atlas.page_map(rows[:size], tile=tile, slot=(self.user_id, category or "", page),
+                              page=page, has_more=len(rows) > size)
+
+    def list(self, category: Optional[str] = None) -> Iterable[Cloth]:
+        return self.page(category).items
 
     def get(self, cloth_id: int) -> Optional[Cloth]:
-        return self.db.query(Cloth).get(cloth_id)
+        return self.db.query(Cloth).filter(Cloth.id == cloth_id, self._owned()).first()
 
-    def create(self, *, name: str, category: str, image_content: bytes) -> Cloth:
+    def create(
+        self,
+        *,
+        name: str,
+        category: str,
+        image_content: Union[bytes, BinaryIO],
+        content_hash: Optional[str] = None,
+        reject_duplicates: bool = False,
+        defer: Optional[bool] = None,
+    ) -> Cloth:
+        """
+        Lagrer plagget og legger det i likhetsindeksen. Nesten like plagg
+        som finnes fra før står i cloth.possible_duplicates (ikke lagret);
+        med reject_duplicates kastes DuplicateCloth i stedet.
+
+        Med defer (standard: JOBS_DEFER_UPLOADS) lagres plagget straks med
+        status "processing", og koding/renditions/indeks gjøres i jobbkøen
+        (cloth.job_id). Ikke med reject_duplicates – den må vente på svaret.
+        """
         self._validate_category(category)
-        image_url = self._save_png(image_content)
+        if defer is None:
+            defer = config.JOBS_DEFER_UPLOADS
+        if defer and not reject_duplicates:
+            cloth = self._create_deferred(name, category, image_content, content_hash)
+            if cloth is not None:
+                return cloth
+        image_url = self._save_png(image_content, content_hash)
+
+        features = features_for_url(image_url)
+        duplicates = similarity_index.duplicates(features, user_id=self.user_id) if features is not None else []
+        if duplicates and reject_duplicates:
+            # filen blir liggende til media_gc rydder den, hvis ingen andre bruker den
+            media_store.release(self.db, image_url)
+            self.db.commit()
+            raise DuplicateCloth(duplicates)
 
         cloth = Cloth(
             name=name,
             category=category,
             image_url=image_url,
-            user_id=None,
+            user_id=self.user_id,
         )
         self.db.add(cloth)
         self.db.commit()
+        # indeksen oppdateres før cachen bumpes, så ingen svar caches med gammel indeks
+        if features is not None:
+            similarity_index.add(cloth.id, category, features, user_id=self.user_id, image_url=cloth.image_url)
+        bump_clothes()
         self.db.refresh(cloth)
+        cloth.possible_duplicates = duplicates
         return cloth
 
+    def _create_deferred(
+        self,
+        name: str,
+        category: str,
+        content: Union[bytes, BinaryIO],
+        content_hash: Optional[str],
+    ) -> Optional[Cloth]:
+        """
+        Lagre plagget med status "processing" og legg cloth.process i køen.
+        None når bildet allerede finnes (da er det ingenting å vente på).
+        """
+        if isinstance(content, (bytes, bytearray)):
+            content_hash = content_hash or media_store.content_hash(content)
+            content = BytesIO(content)
+        elif not content_hash:
+            raise ValueError("content_hash mangler for filinnhold")
+
+        filename = f"{content_hash}.png"
+        if media_store.exists(filename):
+            return None
+        probe_image(content)          # ugyldig fil -> 400 nå, ikke "failed" senere
+        spooled = pipeline.spool(content, content_hash)
+
+        media_store.acquire(self.db, filename)
+        cloth = Cloth(
+            name=name,
+            category=category,
+            image_url=media_store.url_for(filename),
+            user_id=self.user_id,
+            status=pipeline.PROCESSING,
+        )
+        self.db.add(cloth)
+        self.db.flush()
+        job = jobs.enqueue(
+            self.db, "cloth.process",
+            {"cloth_id": cloth.id, "filename": filename, "spool": spooled},
+            key=f"cloth.process:{cloth.id}",
+            target=("cloth", cloth.id),
+            user_id=self.user_id,
+        )
+        cloth.job_id = job.id
+        self.db.commit()
+        bump_clothes()
+        self.db.refresh(cloth)
+        cloth.possible_duplicates = []
+        return cloth
+
+    def similar(self, cloth_id: int, *, limit: int = 20, category: Optional[str] = None) -> Optional[List[dict]]:
+        """
+        De mest like plaggene (farger + form), best først. None hvis plagget
+        ikke finnes. Plagg som mangler i indeksen (f.eks. rett etter en
+        migrering) legges inn først.
+        """
+        if category:
+            self._validate_category(category)
+        cloth = self.get(cloth_id)
+        if not cloth:
+            return None
+        hits = similarity_index.query_id(cloth_id, k=limit, category=category, user_id=self.user_id)
+        if hits is None:
+            features = features_for_url(cloth.image_url)
+            if features is None:
+                return []
+            similarity_index.add(cloth.id, getattr(cloth.category, "value", cloth.category), features,
+                                 user_id=cloth.user_id, image_url=cloth.image_url)
+            hits = similarity_index.query_id(cloth_id, k=limit, category=category, user_id=self.user_id) or []
+        return hits
+
+    def bulk(self, updates: Sequence[dict], deletes: Sequence[int]) -> BulkResult:
+        """
+        Mange endringer ({id, name?, category?}) og slettinger i én
+        transaksjon (se services/bulk.py). Felt som mangler er uendret.
+        Filer uten eier ryddes av media_gc.
+        """
+        patches: dict = {}
+        for u in updates:
+            patch = patches.setdefault(u["id"], {})
+            for field in ("name", "category"):
+                if field not in u:
+                    continue
+                if u[field] is None:
+                    raise ValueError(f"{field} kan ikke være null (plagg {u['id']})")
+                if field == "category":
+                    self._validate_category(u[field])
+                patch[field] = u[field]
+        result = apply_bulk(self.db, Cloth, self.user_id, patches, deletes)
+        self.db.commit()
+        for cloth_id in result.deleted:
+            similarity_index.remove(cloth_id)
+        for cloth_id in result.updated:
+            if "category" in patches[cloth_id]:
+                similarity_index.set_category(cloth_id, patches[cloth_id]["category"])
+        if result.updated or result.deleted:
+            bump_clothes()
+        return result
+
     def delete(self, cloth_id: int) -> bool:
         cloth = self.get(cloth_id)
         if not cloth:
             return False
-        self._delete_file_if_exists(cloth.image_url)
+        # Filen slettes ikke her: en samtidig opplasting av samme bilde kan
+        # gjenbruke den. Filer uten eier ryddes av media_gc.
+        media_store.release(self.db, cloth.image_url)
         self.db.delete(cloth)
         self.db.commit()
+        similarity_index.remove(cloth_id)
+        bump_clothes()
         return True
@@ -0,0 +1,222 @@
+# backend/services/compositor.py
+"""
+Server-side tegning av looks fra plagg + layout.
+
+Hvert plagg dekodes og skaleres til ønsket bredde én gang og legges i en
+LRU-cache (nøkkel: image_url + bredde), så mange looks som deler plagg
+kan tegnes på nytt billig. Looken husker en render_key (hash av layout og
+plaggenes image_url, pluss status for plagg som ikke er klare); er den
+uendret, hoppes tegningen over.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image, ImageColor
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..metrics import stage
+from ..models import Cloth, Look
+from . import media_store, renditions
+
+logger = logging.getLogger("looksy")
+
+# største side på et lag, som det største lerretet LookLayout tillater: et
+# lag er da maks 4096² × 4 byte (64 MB), uansett scale og plaggets form
+MAX_LAYER_SIDE = 4096
+
+
+class LayerCache:
+    """LRU av ferdigskalerte RGBA-lag, begrenset av antall bytes (w*h*4)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple[str, int], Image.Image]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size(img: Image.Image) -> int:
+        return img.width * img.height * 4
+
+    def get(self, key: Tuple[str, int]) -> Optional[Image.Image]:
+        with self._lock:
+            img = self._items.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key: Tuple[str, int], img: Image.Image) -> None:
+        size = self._size(img)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+            self._items[key] = img
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _k, evicted = self._items.popitem(last=False)
+                self._bytes -= self._size(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+layer_cache = LayerCache(config.COMPOSITOR_CACHE_BYTES)
+
+
+def source_path(image_url: str, width: int) -> Optional[str]:
+    """Minste rendition som er minst like bred som målet, ellers masteren."""
+    filename = media_store.filename_from_url(image_url)
+    if not filename:
+        return None
+    for size in sorted(renditions.SIZES):
+        if size >= width:
+            cand = media_store.path_for(renditions.rendition_filename(filename, size))
+            if os.path.exists(cand):
+                return cand
+            break
+    master = media_store.path_for(filename)
+    return master if os.path.exists(master) else None
+
+
+def get_layer(image_url: str, width: int) -> Optional[Image.Image]:
+    """
+    Plagget som RGBA, skalert til `width` px bredt (fra cache hvis mulig).
+    Et smalt, høyt plagg skaleres ned så ingen side blir over MAX_LAYER_SIDE.
+    """
+    width = min(max(1, int(width)), MAX_LAYER_SIDE)
+    key = (image_url, width)
+    layer = layer_cache.get(key)
+    if layer is not None:
+        return layer
+
+    path = source_path(image_url, width)
+    if path is None:
+        return None
+    try:
+        with Image.open(path) as src:
+            w, h = src.size
+            height = max(1, round(h * width / w))
+            if height > MAX_LAYER_SIDE:
+                width, height = max(1, round(w * MAX_LAYER_SIDE / h)), MAX_LAYER_SIDE
+            src.draft("RGB", (width, height))
+            img = src.convert("RGBA")
+    except OSError as e:
+        logger.warning(f"Compositor: kunne ikke lese {path}: {e}")
+        return None
+    layer = img.resize((width, height), Image.LANCZOS)
+    layer_cache.put(key, layer)
+    return layer
+
+
+def _image_key(cloth: Cloth) -> Optional[str]:
+    # et plagg som fortsatt behandles (eller feilet) har ingen fil ennå og
+    # tegnes ikke med; status i nøkkelen gjør looken utdatert når det blir klart
+    status = getattr(cloth, "status", None) or "ready"
+    return cloth.image_url if status == "ready" else f"{cloth.image_url}#{status}"
+
+
+def render_key(layout: dict, clothes: Dict[int, Cloth]) -> str:
+    payload = {
+        "layout": layout,
+        "images": {str(i): _image_key(clothes[i]) for i in sorted(clothes)},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def render(layout: dict, clothes: Dict[int, Cloth]) -> Image.Image:
+    """Tegn layouten til et RGB-bilde. Plagg som mangler (slettet/fil borte) hoppes over."""
+    width, height = int(layout["width"]), int(layout["height"])
+    try:
+        bg = ImageColor.getrgb(layout.get("background") or "#ffffff")[:3]
+    except ValueError:
+        bg = (255, 255, 255)
+    canvas = Image.new("RGB", (width, height), bg)
+
+    for item in sorted(layout["items"], key=lambda it: it.get("z", 0)):
+        cloth = clothes.get(item["cloth_id"])
+        if cloth is None:
+            continue
+        # scale > 1 tegnes som 1: et lag blir aldri bredere enn lerretet
+        layer = get_layer(cloth.image_url, min(round(item.get("scale", 0.3) * width), width))
+        if layer is None:
+            continue
+        pos = (round(item["x"] * width), round(item["y"] * height))
+        canvas.paste(layer, pos, layer)
+    return canvas
+
+
+def layout_cloth_ids(layout: dict) -> list:
+    return list(dict.fromkeys(it["cloth_id"] for it in layout["items"]))
+
+
+def render_look(db: Session, look: Look, *, force: bool = False,
+                clothes: Optional[Dict[int, Cloth]] = None) -> None:
+    """
+    Tegn looken fra look.layout hvis noe har endret seg (eller force).
+    Oppdaterer image_url/render_key i sesjonen – caller committer. Den
+    forrige filen slippes; uten eier ryddes den av media_gc.
+    """
+    layout = look.layout
+    if not layout:
+        raise ValueError("Looken har ingen layout å tegne fra")
+    if clothes is None:
+        ids = layout_cloth_ids(layout)
+        clothes = {c.id: c for c in db.query(Cloth).filter(Cloth.id.in_(ids))}
+
+    key = render_key(layout, clothes)
+    current = media_store.filename_from_url(look.image_url)
+    if not force and key == look.render_key and current and media_store.exists(current):
+        return
+
+    with stage("compose"):
+        img = render(layout, clothes)
+    buf = BytesIO()
+    with stage("jpeg_encode"):
+        img.save(buf, format="JPEG", quality=config.COMPOSITOR_JPEG_QUALITY, optimize=True)
+    data = buf.getvalue()
+
+    filename = f"look_{media_store.content_hash(data)}.jpg"
+    if filename == current:
+        look.render_key = key
+        return
+    if not media_store.exists(filename):
+        media_store.write_atomic(filename, data)
+        renditions.generate(img, media_store.path_for(filename))
+    media_store.acquire(db, filename)
+
+    if look.image_url:
+        media_store.release(db, look.image_url)
+    look.image_url = media_store.url_for(filename)
+    look.render_key = key
+
+
+def stale_looks(db: Session, looks: Iterable[Look]) -> list:
+    """Looks med layout der render_key ikke lenger stemmer (f.eks. nytt plaggbilde)."""
+    looks = [lk for lk in looks if lk.layout]
+    ids = {i for lk in looks for i in layout_cloth_ids(lk.layout)}
+    clothes = {c.id: c for c in db.query(Cloth).filter(Cloth.id.in_(ids))} if ids else {}
+    out = []
+    for lk in looks:
+        sub = {i: clothes[i] for i in layout_cloth_ids(lk.layout) if i in clothes}
+        if render_key(lk.layout, sub) != lk.render_key:
+            out.append((lk, sub))
+    return out
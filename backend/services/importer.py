@@ -0,0 +1,368 @@
+# backend/services/importer.py
+"""
+Bulk-import av plagg – brukes av CLI-en (backend.import_clothes),
+seed_from_media og POST /api/clothes/batch.
+
+Flyten:
+  1. bildene dekodes, normaliseres til RGBA-PNG og får renditions i en
+     prosesspool (lagres innholdsadressert, som ved vanlig opplasting);
+     kildene leses i takt med poolen, og filer i en zip leses først i
+     arbeideren (ZipMember),
+  2. hvilke som allerede finnes sjekkes med én IN-spørring per 900 stk,
+  3. nye rader settes inn med bulk-insert i transaksjoner på
+     config.IMPORT_CHUNK_ROWS rader, med fremdriftsrapportering underveis.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import zipfile
+from collections import Counter
+from collections.abc import Sized
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import lru_cache
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..models import Cloth, ClothCategory
+from . import media_paths, media_store, renditions
+from .media_index import index as media_index
+from .response_cache import bump_clothes
+from .similarity import index as similarity_index
+from .uploads import open_image
+from .users import owned_by
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+
+# (kategori, nøkkelord) i prioritert rekkefølge; alt annet blir "topp"
+CATEGORY_KEYWORDS: Sequence[Tuple[str, Sequence[str]]] = (
+    (ClothCategory.sko.value, ("sko", "sneaker", "boots", "sandaler", "hæler", "heler", "slippers")),
+    (ClothCategory.underdel.value, ("bukse", "jeans", "skjørt", "skjort", "shorts", "underdel", "tights")),
+    (ClothCategory.tilbehør.value, ("belte", "caps", "hatt", "lue", "smykke", "veske", "tilbehør",
+                                    "tilbehor", "hals", "skjerf")),
+)
+DEFAULT_CATEGORY = ClothCategory.topp.value
+
+# Én alternasjon per kategori, kompilert én gang, i stedet for any(w in s ...) per ord
+_CATEGORY_PATTERNS = [
+    (cat, re.compile("|".join(re.escape(w) for w in words))) for cat, words in CATEGORY_KEYWORDS
+]
+
+
+
+class ZipMember(NamedTuple):
+    """En fil i en zip: stien til zip-en og navnet i den. Leses i arbeideren."""
+    path: str
+    member: str
+
+
+Progress = Callable[[str, int, int], None]
+Source = Union[str, bytes, BinaryIO, ZipMember]
+
+
+def guess_categories(names: Iterable[str]) -> List[str]:
+    """Gjett kategori for mange navn på én gang (samme regler som før)."""
+    out = []
+    for name in names:
+        s = (name or "").lower()
+        for cat, pattern in _CATEGORY_PATTERNS:
+            if pattern.search(s):
+                out.append(cat)
+                break
+        else:
+            out.append(DEFAULT_CATEGORY)
+    return out
+
+
+def is_image(filename: str) -> bool:
+    return filename.lower().endswith(IMAGE_EXTS)
+
+
+@dataclass
+class ImportItem:
+    name: str
+    source: Source                 # sti, bytes, åpen fil eller fil i en zip
+    category: Optional[str] = None
+
+
+@dataclass
+class ImportResult:
+    total: int = 0
+    created: int = 0
+    skipped: int = 0
+    failed: List[Dict[str, str]] = field(default_factory=list)
+
+
+# ---------- kilder ----------
+
+def items_from_dir(directory: str) -> List[ImportItem]:
+    return [
+        ImportItem(name=os.path.splitext(fn)[0], source=os.path.join(directory, fn))
+        for fn in sorted(os.listdir(directory))
+        if is_image(fn) and not fn.startswith(".")
+    ]
+
+
+def items_from_zip(path: str) -> List[ImportItem]:
+    """Bildene i zip-en, fra innholdslisten. Bytes leses først i arbeideren."""
+    with zipfile.ZipFile(path) as zf:
+        infos = zf.infolist()
+    items = []
+    for info in infos:
+        base = os.path.basename(info.filename)
+        if info.is_dir() or not is_image(base) or base.startswith("."):
+            continue
+        items.append(ImportItem(name=os.path.splitext(base)[0], source=ZipMember(path, info.filename)))
+    return items
+
+
+# ---------- arbeidere (kjører i prosesspoolen) ----------
+
+@lru_cache(maxsize=4)
+def _open_zip(path: str, mtime_ns: int) -> zipfile.ZipFile:
+    # én åpen zip per arbeider, så innholdslisten ikke leses på nytt for hver fil
+    return zipfile.ZipFile(path)
+
+
+def _read(source: Union[str, bytes, ZipMember]) -> bytes:
+    if isinstance(source, ZipMember):
+        return _open_zip(source.path, os.stat(source.path).st_mtime_ns).read(source.member)
+    if isinstance(source, str):
+        with open(source, "rb") as fh:
+            return fh.read()
+    return source
+
+
+def _normalize(args: Tuple[int, Union[str, bytes, ZipMember]]) -> Tuple[int, Optional[str], Optional[str]]:
+    """Dekod, normaliser til RGBA-PNG og lag renditions. Returnerer (index, filnavn, feil)."""
+    idx, source = args
+    try:
+        data = _read(source)
+        filename = f"{hashlib.sha256(data).hexdigest()}.png"
+        path = media_store.path_for(filename)
+        if not os.path.exists(path):
+            img = open_image(BytesIO(data)).convert("RGBA")
+            buf = BytesIO()
+            img.save(buf, format="PNG")
+            media_store.write_atomic(filename, buf.getvalue())
+            renditions.generate(img, path)
+        return idx, filename, None
+    except (ValueError, OSError, KeyError, zipfile.BadZipFile) as e:
+        return idx, None, str(e)
+
+
+def _verify(args: Tuple[int, str]) -> Tuple[int, Optional[str], Optional[str]]:
+    """Sjekk at en fil som allerede ligger i MEDIA_DIR er et lesbart bilde."""
+    idx, path = args
+    try:
+        with open(path, "rb") as fh:
+            open_image(fh, max(renditions.SIZES))
+        return idx, os.path.basename(path), None
+    except (ValueError, OSError) as e:
+        return idx, None, str(e)
+
+
+# ---------- felles prosesspool ----------
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=max(1, config.IMPORT_WORKERS))
+        return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _load(source: Source) -> Union[str, bytes, ZipMember]:
+    if isinstance(source, (str, bytes, ZipMember)):
+        return source
+    source.seek(0)
+    return source.read()
+
+
+def _bounded_map(pool: Executor, fn, items: Iterable[Tuple[int, Source]], window: int):
+    """Som pool.map, men med maks `window` jobber (og bytes) i luften samtidig."""
+    pending = set()
+    for idx, source in items:
+        pending.add(pool.submit(fn, (idx, _load(source))))
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+    for fut in pending:
+        yield fut.result()
+
+
+# ---------- selve importen ----------
+
+def _existing_urls(db: Session, urls: Sequence[str], user_id: Optional[int] = None) -> set:
+    found = set()
+    for i in range(0, len(urls), 900):
+        chunk = urls[i:i + 900]
+        found.update(u for (u,) in db.query(Cloth.image_url).filter(
+            Cloth.image_url.in_(chunk), owned_by(Cloth.user_id, user_id)))
+    return found
+
+
+def _insert_rows(db: Session, rows: List[dict], acquire: bool, result: ImportResult,
+                 progress: Optional[Progress]) -> None:
+    chunk_rows = max(1, config.IMPORT_CHUNK_ROWS)
+    for i in range(0, len(rows), chunk_rows):
+        chunk = rows[i:i + chunk_rows]
+        db.execute(insert(Cloth), chunk)
+        if acquire:
+            media_store.acquire_many(
+                db, Counter(media_store.filename_from_url(r["image_url"]) for r in chunk)
+            )
+        db.commit()
+        bump_clothes()
+        result.created += len(chunk)
+        if progress:
+            progress("insert", min(i + chunk_rows, len(rows)), len(rows))
+
+
+def _collect(results, names: List[str], total: Optional[int], result: ImportResult,
+             progress: Optional[Progress]) -> Dict[int, str]:
+    """names fylles mens results leses (run_import), så names[idx] finnes når resultatet kommer."""
+    files: Dict[int, str] = {}
+    done = 0
+    for done, (idx, filename, err) in enumerate(results, 1):
+        if err:
+            result.failed.append({"name": names[idx], "error": err})
+        else:
+            files[idx] = filename
+            media_index.add(media_store.relpath(filename))
+        if progress and (done % 50 == 0 or done == total):
+            progress("normalize", done, total)
+    if progress and done != total:
+        progress("normalize", done, done)
+    return files
+
+
+def run_import(
+    db: Session,
+    items: Iterable[ImportItem],
+    *,
+    executor: Optional[Executor] = None,
+    progress: Optional[Progress] = None,
+    user_id: Optional[int] = None,
+    total: Optional[int] = None,
+) -> ImportResult:
+    """
+    Importer plagg fra vilkårlige kilder (innholdsadressert, som vanlig
+    opplasting). items leses i takt med prosesspoolen, og bare navn og
+    kategori holdes til radene settes inn; et plagg med ugyldig kategori
+    feiler alene. total er for fremdriften når items ikke har len().
+    """
+    if total is None and isinstance(items, Sized):
+        total = len(items)
+    valid = {c.value for c in ClothCategory}
+    result = ImportResult()
+    names: List[str] = []
+    categories: List[Optional[str]] = []
+
+    def sources():
+        for it in items:
+            names.append(it.name)
+            categories.append(it.category)
+            if it.category is not None and it.category not in valid:
+                result.failed.append({"name": it.name, "error": f"Ugyldig kategori: {it.category}"})
+                continue
+            yield len(names) - 1, it.source
+
+    pool = executor or get_executor()
+    window = max(4, 4 * max(1, config.IMPORT_WORKERS))
+    results = _bounded_map(pool, _normalize, sources(), window)
+    files = _collect(results, names, total, result, progress)
+    result.total = len(names)
+
+    guessed = guess_categories(names)
+    existing = _existing_urls(db, [media_store.url_for(f) for f in set(files.values())], user_id)
+
+    rows, seen = [], set(existing)
+    for idx in sorted(files):
+        url = media_store.url_for(files[idx])
+        if url in seen:
+            result.skipped += 1
+            continue
+        seen.add(url)
+        rows.append({
+            "name": names[idx],
+            "category": categories[idx] or guessed[idx],
+            "image_url": url,
+            "user_id": user_id,
+        })
+
+    _insert_rows(db, rows, True, result, progress)
+    if result.created:
+        similarity_index.sync(db, executor=pool)
+    return result
+
+
+def register_in_place(
+    db: Session,
+    directory: str,
+    *,
+    executor: Optional[Executor] = None,
+    progress: Optional[Progress] = None,
+) -> ImportResult:
+    """
+    Registrer bilder som allerede ligger i MEDIA_DIR under sitt eget navn
+    (seed_from_media). Filene valideres, men kodes ikke om; de som ligger
+    flatt i MEDIA_DIR flyttes til undermappen sin (se media_paths).
+    """
+    names = sorted(f for f in os.listdir(directory)
+                   if is_image(f) and not f.startswith(".") and not renditions.is_rendition(f))
+    result = ImportResult(total=len(names))
+    if not names:
+        return result
+
+    # raden kan peke på den flate eller den nye stien
+    candidates = {fn: (f"/media/{fn}", f"/media/{media_paths.relpath(fn)}") for fn in names}
+    existing = _existing_urls(db, [u for urls in candidates.values() for u in urls])
+    todo = [fn for fn in names if not existing.intersection(candidates[fn])]
+    result.skipped = len(names) - len(todo)
+
+    items = [ImportItem(name=os.path.splitext(fn)[0], source=os.path.join(directory, fn)) for fn in todo]
+    pool = executor or get_executor()
+    window = max(4, 4 * max(1, config.IMPORT_WORKERS))
+    results = _bounded_map(pool, _verify, ((i, it.source) for i, it in enumerate(items)), window)
+    files = _collect(results, [it.name for it in items], len(items), result, progress)
+
+    if os.path.abspath(directory) == os.path.abspath(config.MEDIA_DIR):
+        for filename in files.values():
+            media_store.shard_existing(filename)
+
+    guessed = guess_categories(it.name for it in items)
+    rows = [
+        {
+            "name": items[idx].name,
+            "category": guessed[idx],
+            "image_url": media_store.url_for(files[idx]),
+            "user_id": None,
+        }
+        for idx in sorted(files)
+    ]
+    # eldre filer uten media_refs-rad regnes som eid av én rad – ingen telling her
+    _insert_rows(db, rows, False, result, progress)
+    if result.created:
+        similarity_index.sync(db, executor=pool)
+    return result
@@ -0,0 +1,394 @@
+# backend/services/jobs.py
+"""
+Varig jobbkø i databasen (tabellen `jobs`) – ingen ekstern broker.
+
+  enqueue()   legger inn en jobb i callerens transaksjon. Med key er den
+              idempotent: samme nøkkel to ganger gir den samme jobben.
+  claim()     tar neste ledige jobb av en type med én atomisk UPDATE, og
+              bare hvis typen har færre enn `concurrency` jobber i gang.
+  run_one()   kjører handleren, og ved feil nytt forsøk senere (ventetiden
+              dobles) til max_attempts – da blir jobben og raden den
+              gjelder "failed".
+
+Handlerne registreres med @handler(kind). Tunge typer kjøres av
+arbeiderprosessene (Workers, eller python -m backend.job_worker); typer
+med local=True kjøres av en tråd i app-prosessen, fordi de oppdaterer
+minnet der (likhetsindeksen). Samme tråd ser etter jobber som er
+endret og bumper svar-cachen, så lister med "processing" ikke blir
+hengende i cachen.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import traceback
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..models import Cloth, Job, Look
+
+logger = logging.getLogger("looksy")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# target_type -> modell med status/job_id-kolonner
+TARGETS = {"cloth": Cloth, "look": Look}
+
+
+class Retry(Exception):
+    """Kast fra en handler for å prøve igjen senere uten at det regnes som en feil i loggen."""
+
+
+class Fatal(Exception):
+    """Kast fra en handler når et nytt forsøk ikke kan hjelpe (f.eks. ugyldig bildefil)."""
+
+
+@dataclass
+class Handler:
+    kind: str
+    fn: Callable[["JobContext"], Optional[dict]]
+    concurrency: int
+    max_attempts: int
+    local: bool
+    # kalles (i samme transaksjon) når jobben gir opp, for å rydde det jobben skulle fullføre
+    on_failed: Optional[Callable[[Session, Job], None]] = None
+
+
+_handlers: Dict[str, Handler] = {}
+
+
+def handler(kind: str, *, concurrency: int = 1, max_attempts: Optional[int] = None, local: bool = False,
+            on_failed: Optional[Callable[[Session, Job], None]] = None):
+    """
+    Registrer fn(ctx) -> resultat (dict eller None) for jobbtypen kind.
+    on_failed(db, job) kjøres når jobben ender som "failed".
+    """
+    def register(fn):
+        _handlers[kind] = Handler(kind, fn, max(1, concurrency),
+                                  max_attempts or config.JOBS_MAX_ATTEMPTS, local, on_failed)
+        return fn
+    return register
+
+
+def handlers(local: bool) -> List[Handler]:
+    return [h for h in _handlers.values() if h.local == local]
+
+
+# ---------- køen ----------
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[dict] = None,
+    *,
+    key: Optional[str] = None,
+    target: Optional[Tuple[str, int]] = None,
+    user_id: Optional[int] = None,
+    delay_s: float = 0.0,
+) -> Job:
+    """Legg inn en jobb (i callerens transaksjon). Finnes key fra før, returneres den jobben."""
+    if key is not None:
+        existing = db.query(Job).filter(Job.key == key).first()
+        if existing is not None:
+            return existing
+    spec = _handlers.get(kind)
+    now = datetime.utcnow()
+    job = Job(
+        kind=kind,
+        status=QUEUED,
+        key=key,
+        user_id=user_id,
+        target_type=target[0] if target else None,
+        target_id=target[1] if target else None,
+        payload=payload or {},
+        attempts=0,
+        max_attempts=spec.max_attempts if spec else config.JOBS_MAX_ATTEMPTS,
+        run_after=now + timedelta(seconds=delay_s),
+        created_at=now,
+        updated_at=now,
+    )
+    if key is None:
+        db.add(job)
+        db.flush()
+        return job
+    try:
+        with db.begin_nested():
+            db.add(job)
+    except IntegrityError:
+        # noen andre la inn samme nøkkel i mellomtiden
+        return db.query(Job).filter(Job.key == key).one()
+    return job
+
+
+def claim(db: Session, spec: Handler, worker: str) -> Optional[int]:
+    """Ta neste ledige jobb av typen (id), eller None. Committer."""
+    now = datetime.utcnow()
+    running = (
+        select(func.count()).select_from(Job)
+        .where(Job.kind == spec.kind, Job.status == RUNNING)
+        .scalar_subquery()
+    )
+    nxt = (
+        select(Job.id)
+        .where(Job.status == QUEUED, Job.kind == spec.kind, Job.run_after <= now)
+        .order_by(Job.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    # ett UPDATE-uttrykk: SQLite kjører skrivinger etter hverandre, så to
+    # arbeidere kan ikke ta samme jobb eller gå over concurrency-grensen
+    job_id = db.execute(
+        update(Job)
+        .where(Job.id == nxt, Job.status == QUEUED, running < spec.concurrency)
+        .values(status=RUNNING, locked_by=worker, locked_at=now, updated_at=now,
+                attempts=Job.attempts + 1)
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.commit()
+    return job_id
+
+
+def recover_expired(db: Session) -> int:
+    """Legg jobber som har kjørt lenger enn JOBS_LEASE_S (krasjet arbeider) tilbake i køen."""
+    now = datetime.utcnow()
+    res = db.execute(
+        update(Job)
+        .where(Job.status == RUNNING, Job.locked_at < now - timedelta(seconds=config.JOBS_LEASE_S))
+        .values(status=QUEUED, locked_by=None, locked_at=None, run_after=now, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return res.rowcount or 0
+
+
+def set_target_status(db: Session, job: Job, status: str) -> None:
+    model = TARGETS.get(job.target_type or "")
+    if model is None or job.target_id is None:
+        return
+    db.execute(
+        update(model)
+        .where(model.id == job.target_id, model.job_id == job.id)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# ---------- kjøring ----------
+
+class JobContext:
+    """Det en handler får: sesjonen, jobben og fremdriftsrapportering."""
+
+    def __init__(self, db: Session, job: Job):
+        self.db = db
+        self.job = job
+        self.payload = job.payload or {}
+        self.next_job_id: Optional[int] = None
+
+    def progress(self, done: int, total: int) -> None:
+        """Lagre fremdriften med én gang (egen commit), så GET /api/jobs/{id} ser den."""
+        self.db.execute(
+            update(Job).where(Job.id == self.job.id)
+            .values(progress_done=done, progress_total=total, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+
+    def then(self, kind: str, payload: Optional[dict] = None) -> Job:
+        """Neste steg i samme pipeline (samme mål og bruker), lagt inn ved suksess."""
+        nxt = enqueue(
+            self.db, kind, payload if payload is not None else self.payload,
+            key=f"{kind}:{self.job.id}",
+            target=(self.job.target_type, self.job.target_id) if self.job.target_type else None,
+            user_id=self.job.user_id,
+        )
+        model = TARGETS.get(self.job.target_type or "")
+        if model is not None:
+            self.db.execute(
+                update(model).where(model.id == self.job.target_id, model.job_id == self.job.id)
+                .values(job_id=nxt.id)
+                .execution_options(synchronize_session=False)
+            )
+        self.next_job_id = nxt.id
+        return nxt
+
+
+def _finish(db: Session, job_id: int, **values) -> None:
+    now = datetime.utcnow()
+    db.execute(
+        update(Job).where(Job.id == job_id)
+        .values(locked_by=None, locked_at=None, updated_at=now, **values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def run_one(session_factory, specs: Sequence[Handler], worker: str) -> bool:
+    """Kjør én jobb av en av typene hvis noen er ledig. True hvis noe ble kjørt."""
+    with session_factory() as db:
+        for spec in specs:
+            job_id = claim(db, spec, worker)
+            if job_id is not None:
+                break
+        else:
+            return False
+
+        job = db.get(Job, job_id)
+        ctx = JobContext(db, job)
+        try:
+            result = spec.fn(ctx)
+            if ctx.next_job_id is not None:
+                result = {**(result or {}), "next_job_id": ctx.next_job_id}
+            _finish(db, job_id, status=DONE, result=result, error=None, finished_at=datetime.utcnow())
+            db.commit()
+            return True
+        except Exception as exc:
+            e = exc
+            db.rollback()
+            error = f"{type(e).__name__}: {e}"
+            if not isinstance(e, (Retry, Fatal)):
+                logger.warning(f"Jobb {job_id} ({spec.kind}) feilet, forsøk {job.attempts}/{job.max_attempts}: "
+                               f"{error}\n{traceback.format_exc(limit=5)}")
+        job = db.get(Job, job_id)
+        if isinstance(e, Fatal) or job.attempts >= job.max_attempts:
+            _finish(db, job_id, status=FAILED, error=error, finished_at=datetime.utcnow())
+            set_target_status(db, job, FAILED)
+            if spec.on_failed is not None:
+                try:
+                    spec.on_failed(db, job)
+                except Exception as hook_error:
+                    logger.warning(f"Opprydding etter jobb {job_id} ({spec.kind}) feilet: {hook_error}")
+                    db.rollback()
+                    _finish(db, job_id, status=FAILED, error=error, finished_at=datetime.utcnow())
+                    set_target_status(db, job, FAILED)
+        else:
+            delay = config.JOBS_RETRY_BASE_S * 2 ** (job.attempts - 1)
+            _finish(db, job_id, status=QUEUED, error=error,
+                    run_after=datetime.utcnow() + timedelta(seconds=delay))
+        db.commit()
+        return True
+
+
+def chain(db: Session, job: Job, max_steps: int = 20) -> List[Job]:
+    """Jobben og stegene etter den (via result.next_job_id), i rekkefølge."""
+    out = [job]
+    while len(out) < max_steps:
+        nxt = (out[-1].result or {}).get("next_job_id")
+        if not nxt:
+            break
+        job = db.get(Job, nxt)
+        if job is None:
+            break
+        out.append(job)
+    return out
+
+
+def changed_targets(db: Session, since: datetime) -> set:
+    """target_type for jobber som er endret etter since."""
+    rows = db.query(Job.target_type).filter(Job.updated_at > since).distinct()
+    return {t for (t,) in rows if t}
+
+
+def counts(db: Session) -> Dict[Tuple[str, str], int]:
+    """(kind, status) -> antall, for /metrics."""
+    return {(k, s): n for k, s, n in db.query(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status)}
+
+
+def worker_name(suffix: str = "") -> str:
+    return f"{socket.gethostname()}:{os.getpid()}{suffix}"
+
+
+def work(session_factory, stop: threading.Event, *, local: bool = False,
+         on_idle: Optional[Callable[[], None]] = None) -> None:
+    """Løkke for én arbeider: kjør jobber til stop settes, vent JOBS_POLL_S når køen er tom."""
+    from . import pipeline  # noqa: F401  (registrerer handlerne)
+
+    name = worker_name("/app" if local else "")
+    specs = handlers(local)
+    turn = 0
+    while not stop.is_set():
+        try:
+            if not local and turn % 100 == 0:
+                with session_factory() as db:
+                    recovered = recover_expired(db)
+                if recovered:
+                    logger.warning(f"Jobbkø: {recovered} forlatte jobber lagt tilbake i køen.")
+            turn += 1
+            # roter rekkefølgen, så én travel type ikke sulter de andre
+            order = specs[turn % len(specs):] + specs[:turn % len(specs)] if specs else []
+            ran = run_one(session_factory, order, name)
+        except Exception as e:
+            logger.warning(f"Jobbkø: arbeideren {name} fikk en feil: {e}")
+            ran = False
+        if on_idle:
+            on_idle()
+        if not ran:
+            stop.wait(config.JOBS_POLL_S)
+
+
+def _process_main(stop) -> None:
+    """Inngang for arbeiderprosessene (spawn – ingen arv av app-tilstand)."""
+    logging.basicConfig(level=logging.INFO)
+    from ..database import SessionLocal
+    try:
+        work(SessionLocal, stop)
+    except KeyboardInterrupt:
+        pass
+
+
+class Workers:
+    """
+    Arbeiderprosessene + tråden i app-prosessen (lokale jobber og
+    cache-bump). Startes og stoppes av appen.
+    """
+
+    def __init__(self, session_factory, processes: int, on_change: Callable[[set], None]):
+        self._session_factory = session_factory
+        self._processes = processes
+        self._on_change = on_change
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop_proc = self._ctx.Event()
+        self._stop = threading.Event()
+        self._procs: list = []
+        self._thread: Optional[threading.Thread] = None
+        self._since = datetime.utcnow()
+
+    def _check_changes(self) -> None:
+        now = datetime.utcnow()
+        with self._session_factory() as db:
+            changed = changed_targets(db, self._since)
+        if changed:
+            self._since = now
+            self._on_change(changed)
+
+    def start(self) -> None:
+        for i in range(self._processes):
+            p = self._ctx.Process(target=_process_main, args=(self._stop_proc,), name=f"job-worker-{i}", daemon=True)
+            p.start()
+            self._procs.append(p)
+        self._thread = threading.Thread(
+            target=work, args=(self._session_factory, self._stop),
+            kwargs={"local": True, "on_idle": self._check_changes}, name="jobs-local", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout_s: float = 5.0) -> None:
+        self._stop.set()
+        self._stop_proc.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout_s)
+        for p in self._procs:
+            p.join(timeout=timeout_s)
+            if p.is_alive():
+                p.terminate()
+        self._procs = []
+
+    def alive(self) -> int:
+        return sum(1 for p in self._procs if p.is_alive())
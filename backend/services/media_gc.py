@@ -0,0 +1,230 @@
+# backend/services/media_gc.py
+"""
+Opprydding i MEDIA_DIR: sammenligner filene på disk med radene i
+databasen i bulk og sletter filer ingen plagg eller look peker på.
+
+Radene er fasiten, ikke media_refs: en fil blir foreldreløs når en rad
+slettes eller får nytt bilde (forespørslene rører ikke disken, se
+media_store), og når en forespørsel krasjet etter at filen var skrevet
+(f.eks. create_look). En master og dens renditions (abc.png,
+abc_128.webp, ...) hører sammen og slettes sammen; renditions uten
+master, og rester av temp-filer (.tmp-*), ryddes også.
+
+Bare filer eldre enn grace-perioden røres, siden en opplasting skriver
+filen før raden er committet. Rett før hver gruppe slettes sjekkes den
+på nytt: ingen rad peker på den (image_url), media_refs er uendret siden
+starten, og filene er fortsatt eldre enn grace. Ellers står den til
+neste kjøring.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..models import Cloth, Look, MediaRef
+from . import media_paths, media_store, renditions
+from .media_index import index as media_index
+
+logger = logging.getLogger("looksy")
+
+TMP_PREFIX = ".tmp-"
+# SQLite: maks bundne parametre per setning
+CHUNK = 900
+
+
+class MediaFile(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+
+
+class Group(NamedTuple):
+    stem: str
+    master: Optional[str]         # filnavnet til masteren, hvis den finnes
+    files: List[MediaFile]
+
+
+def _walk(root: str) -> Iterator[os.DirEntry]:
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def scan(root: Optional[str] = None) -> tuple:
+    """
+    Gå gjennom MEDIA_DIR én gang. Returnerer (grupper per stamme, temp-filer).
+    Filer som verken er master, rendition eller temp-fil hoppes over.
+    """
+    root = root or media_store.MEDIA_DIR
+    groups: Dict[str, Group] = {}
+    temps: List[MediaFile] = []
+    for entry in _walk(root):
+        st = entry.stat(follow_symlinks=False)
+        f = MediaFile(entry.path, st.st_size, st.st_mtime)
+        name = entry.name
+        if name.startswith(TMP_PREFIX):
+            temps.append(f)
+            continue
+        stem, ext = os.path.splitext(name)
+        if ext in renditions.MASTER_EXTS:
+            master = name
+        elif renditions.is_rendition(name):
+            stem, master = renditions.parse_rendition(stem), None
+        else:
+            continue
+        group = groups.get(stem) or Group(stem, None, [])
+        if master:
+            group = group._replace(master=master)
+        group.files.append(f)
+        groups[stem] = group
+    return groups, temps
+
+
+def referenced(db: Session) -> Set[str]:
+    """Stammene til alle filer som et plagg eller en look peker på."""
+    stems: Set[str] = set()
+    for model in (Cloth, Look):
+        rows = db.execute(
+            select(model.image_url).where(model.image_url.isnot(None))
+            .execution_options(yield_per=5000)
+        )
+        for (url,) in rows:
+            filename = media_store.filename_from_url(url)
+            if filename:
+                stems.add(os.path.splitext(filename)[0])
+    return stems
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Media-GC: kunne ikke slette {path}: {e}")
+        return False
+    directory = os.path.dirname(path)
+    # tomme shard-mapper (media/ab/cd) fjernes også; MEDIA_DIR selv blir stående
+    while os.path.abspath(directory) != os.path.abspath(media_store.MEDIA_DIR):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+    return True
+
+
+def _names(group: Group) -> List[str]:
+    # alle masternavn en rad kan bruke for stammen (heal_url prøver de andre endelsene)
+    return [group.stem + ext for ext in renditions.MASTER_EXTS]
+
+
+def _refcounts(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    out: Dict[str, int] = {}
+    for i in range(0, len(names), CHUNK):
+        out.update(db.execute(
+            select(MediaRef.filename, MediaRef.refcount).where(MediaRef.filename.in_(names[i:i + CHUNK]))
+        ).all())
+    return out
+
+
+def _urls(group: Group) -> Set[str]:
+    """image_url-ene som kan peke på gruppen: flat, i undermappen, og der filene faktisk ligger."""
+    root = os.path.abspath(media_store.MEDIA_DIR)
+    dirs = {os.path.relpath(os.path.dirname(f.path), root).replace(os.sep, "/") for f in group.files}
+    urls = set()
+    for name in _names(group):
+        urls.add(f"/media/{name}")
+        urls.add(f"/media/{media_paths.relpath(name)}")
+        urls.update(f"/media/{d}/{name}" for d in dirs if d != ".")
+    return urls
+
+
+def _still_orphan(db: Session, group: Group, refs_before: Dict[str, int], cutoff: float) -> bool:
+    """Sjekk gruppen på nytt rett før den slettes (se modul-docstringen)."""
+    for f in group.files:
+        try:
+            if os.stat(f.path).st_mtime >= cutoff:
+                return False
+        except FileNotFoundError:
+            pass
+    urls = list(_urls(group))
+    for model in (Cloth, Look):
+        if db.execute(select(model.id).where(model.image_url.in_(urls)).limit(1)).first() is not None:
+            return False
+    names = _names(group)
+    now = _refcounts(db, names)
+    return all(now.get(n) == refs_before.get(n) for n in names)
+
+
+def collect(db: Session, *, grace_s: Optional[float] = None, dry_run: bool = False,
+            root: Optional[str] = None) -> dict:
+    """
+    Finn og slett foreldreløse filer. Returnerer en rapport med antall
+    filer og bytes (frigjort, eller som ville blitt frigjort med dry_run).
+    """
+    grace_s = config.MEDIA_GC_GRACE_S if grace_s is None else grace_s
+    cutoff = time.time() - grace_s
+    t0 = time.perf_counter()
+
+    groups, temps = scan(root)
+    refs = referenced(db)
+    orphans = [g for g in groups.values() if g.stem not in refs]
+    old = [g for g in orphans if max(f.mtime for f in g.files) < cutoff]
+    stale_temps = [f for f in temps if f.mtime < cutoff]
+    report = {
+        "dry_run": dry_run,
+        "scanned_files": sum(len(g.files) for g in groups.values()) + len(temps),
+        "referenced": len(refs),
+        "orphans": len(orphans),
+        "recent_skipped": len(orphans) - len(old),
+        "changed_skipped": 0,
+        "deleted_files": 0,
+        "freed_bytes": 0,
+    }
+
+    if dry_run:
+        doomed = [f for g in old for f in g.files] + stale_temps
+        report["deleted_files"] = len(doomed)
+        report["freed_bytes"] = sum(f.size for f in doomed)
+        report["seconds"] = round(time.perf_counter() - t0, 3)
+        return report
+
+    refs_before = _refcounts(db, (n for g in old for n in _names(g)))
+    db.rollback()                     # ny lesing per gruppe under, ikke et gammelt øyeblikksbilde
+    for group in old:
+        if not _still_orphan(db, group, refs_before, cutoff):
+            report["changed_skipped"] += 1
+            db.rollback()
+            continue
+        for f in group.files:
+            if _remove(f.path):
+                media_index.discard(os.path.basename(f.path))
+                report["deleted_files"] += 1
+                report["freed_bytes"] += f.size
+        # tellere som står igjen for slettede filer (lekket refcount), bare hvis ingen har rørt dem
+        for name in _names(group):
+            if name in refs_before:
+                db.execute(delete(MediaRef).where(MediaRef.filename == name,
+                                                  MediaRef.refcount == refs_before[name]))
+        db.commit()
+
+    for f in stale_temps:
+        if _remove(f.path):
+            report["deleted_files"] += 1
+            report["freed_bytes"] += f.size
+
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
@@ -0,0 +1,222 @@
+# backend/services/media_index.py
+"""
+Minneindeks over filene i MEDIA_DIR.
+
+Erstatter os.path.exists-kall på lesestien: indeksen bygges med én
+gjennomgang av treet ved oppstart (filnavn -> undermappe, se
+media_paths) og holdes oppdatert av våre egne skrivinger,
+filendringsvarsler (watchfiles, hvis installert) og en periodisk rescan.
+Rader med image_url som peker på en fil som ikke finnes, repareres av
+en bakgrunnsjobb i én batch – aldri inne i en GET.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .. import config
+from .response_cache import bump_looks
+
+logger = logging.getLogger("looksy")
+
+# Rekkefølgen vi prøver filendelser i når eksakt filnavn mangler
+FALLBACK_EXTS = (".png", ".jpg", ".jpeg", ".JPG", ".JPEG", ".PNG")
+
+
+def _ignored(name: str) -> bool:
+    return name.startswith(".")
+
+
+class MediaIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # filnavn -> undermappe relativt til directory ("" eller "ab/cd")
+        self._names: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.scans = 0
+
+    # ---------- oppdatering ----------
+
+    def scan(self) -> None:
+        names: Dict[str, str] = {}
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not _ignored(d)]
+            rel = os.path.relpath(root, self.directory)
+            rel = "" if rel == "." else rel.replace(os.sep, "/")
+            for fn in files:
+                if not _ignored(fn):
+                    names[fn] = rel
+        with self._lock:
+            self._names = names
+            self.scans += 1
+
+    def add(self, relpath: str) -> None:
+        """Registrer en fil, gitt som sti relativt til directory ('ab/cd/x.png' eller 'x.png')."""
+        directory, _, name = relpath.rpartition("/")
+        if _ignored(name) or any(_ignored(part) for part in directory.split("/") if part):
+            return
+        with self._lock:
+            self._names[name] = directory
+
+    def discard(self, name: str) -> None:
+        with self._lock:
+            self._names.pop(name, None)
+
+    # ---------- oppslag ----------
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return name in self._names
+
+    def location(self, name: str) -> Optional[str]:
+        """Stien relativt til directory hvis filen er kjent, ellers None."""
+        with self._lock:
+            directory = self._names.get(name)
+        if directory is None:
+            return None
+        return f"{directory}/{name}" if directory else name
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Eksakt filnavn, ellers samme stamme med en annen bildeendelse."""
+        with self._lock:
+            if name in self._names:
+                return name
+            stem = os.path.splitext(name)[0]
+            for ext in FALLBACK_EXTS:
+                if stem + ext in self._names:
+                    return stem + ext
+        return None
+
+    def heal_url(self, url: Optional[str]) -> Optional[str]:
+        """
+        Reparert /media-URL hvis filen finnes under et annet navn eller i en
+        annen undermappe (f.eks. etter shard_media), ellers None.
+        """
+        url = (url or "").strip()
+        fname = os.path.basename(url)
+        if not fname:
+            return None
+        found = self.resolve(fname)
+        if found is None:
+            return None
+        healed = f"/media/{self.location(found) or found}"
+        return None if healed == url else healed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._names)
+
+    # ---------- bakgrunn ----------
+
+    def start(self, on_change: Optional[Callable[[], None]] = None) -> None:
+        """Start periodisk rescan (og watchfiles hvis mulig). on_change kalles etter endringer."""
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads.append(threading.Thread(
+            target=self._rescan_loop, args=(on_change,), name="media-rescan", daemon=True))
+        if config.MEDIA_WATCH:
+            try:
+                import watchfiles  # type: ignore  # følger med uvicorn[standard]
+            except ImportError:
+                watchfiles = None
+            if watchfiles is not None:
+                self._threads.append(threading.Thread(
+                    target=self._watch_loop, args=(watchfiles, on_change), name="media-watch", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2)
+        self._threads = []
+
+    def _rescan_loop(self, on_change) -> None:
+        while not self._stop.wait(config.MEDIA_RESCAN_INTERVAL_S):
+            try:
+                self.scan()
+                if on_change:
+                    on_change()
+            except Exception as e:
+                logger.warning(f"Media-rescan feilet: {e}")
+
+    def _watch_loop(self, watchfiles, on_change) -> None:
+        logging.getLogger("watchfiles").setLevel(logging.WARNING)  # logger hver endring på INFO
+        try:
+            for changes in watchfiles.watch(self.directory, stop_event=self._stop, recursive=True):
+                for change, path in changes:
+                    rel = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                    if change == watchfiles.Change.deleted:
+                        if self.location(os.path.basename(path)) == rel:
+                            self.discard(os.path.basename(path))
+                    elif os.path.isfile(path):
+                        self.add(rel)
+                if on_change:
+                    on_change()
+        except Exception as e:
+            logger.warning(f"Filovervåking av media stoppet, bruker bare periodisk rescan: {e}")
+
+
+index = MediaIndex(config.MEDIA_DIR)
+
+
+def repair_look_urls(db: Session, batch_size: int = 500) -> int:
+    """
+    Finn looks med image_url som ikke finnes i indeksen, men som har en
+    fil med samme stamme og annen endelse, og skriv rettelsene i én batch.
+    """
+    from ..models import Look  # unngå sirkulær import (models -> services)
+
+    fixes = []
+    rows = db.query(Look.id, Look.image_url).filter(Look.image_url.isnot(None))
+    for look_id, url in rows.yield_per(batch_size):
+        healed = index.heal_url(url)
+        if healed:
+            fixes.append({"id": look_id, "image_url": healed})
+    for i in range(0, len(fixes), batch_size):
+        db.bulk_update_mappings(Look, fixes[i:i + batch_size])
+    if fixes:
+        db.commit()
+        bump_looks()
+        logger.info(f"Media-indeks: reparerte image_url for {len(fixes)} looks.")
+    return len(fixes)
+
+
+class RepairJob:
+    """Kjører repair_look_urls i bakgrunnen, slått sammen når endringer kommer tett."""
+
+    def __init__(self, session_factory, delay_s: float = 1.0):
+        self._session_factory = session_factory
+        self._delay_s = delay_s
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def schedule(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self._delay_s, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self) -> None:
+        with self._lock:
+            self._timer = None
+        try:
+            with self._session_factory() as db:
+                repair_look_urls(db)
+        except Exception as e:
+            logger.warning(f"Reparasjon av look-URL-er feilet: {e}")
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
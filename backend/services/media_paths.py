@@ -0,0 +1,44 @@
+# backend/services/media_paths.py
+"""
+Hvor en mediafil ligger under MEDIA_DIR.
+
+Med MEDIA_SHARD_DEPTH = 2 lagres <navn> som ab/cd/<navn>, der ab/cd er de
+første hex-tegnene i navnet (sha256/uuid), eller i en hash av navnet for
+andre filnavn. Renditions og masteren deler mappe, siden nøkkelen tas fra
+masterens stamme. Ingen avhengigheter utover config, så både
+media_store, media-ruten og skript kan bruke modulen.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+
+from .. import config
+from .renditions import parse_rendition
+
+_HEX_STEM = re.compile(r"^(?:look_)?([0-9a-f]{4,})")
+
+
+def shard_key(filename: str) -> str:
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    stem = parse_rendition(stem) or stem
+    m = _HEX_STEM.match(stem)
+    if m:
+        return m.group(1)
+    return hashlib.sha1(stem.encode("utf-8")).hexdigest()
+
+
+def shard_dir(filename: str, depth: int = None) -> str:
+    """'abcd1234….png' -> 'ab/cd' (tom streng når depth er 0)."""
+    depth = config.MEDIA_SHARD_DEPTH if depth is None else depth
+    if depth <= 0:
+        return ""
+    key = shard_key(filename)
+    return "/".join(key[i * 2:i * 2 + 2] for i in range(depth))
+
+
+def relpath(filename: str, depth: int = None) -> str:
+    """Sti relativt til MEDIA_DIR (med /), der en ny fil med dette navnet skal ligge."""
+    d = shard_dir(filename, depth)
+    return f"{d}/{filename}" if d else filename
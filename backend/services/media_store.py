@@ -0,0 +1,212 @@
+# backend/services/media_store.py
+"""
+Innholdsadressert lagring av opplastede filer.
+
+Filnavnet er sha256 av innholdet, så like bytes lagres bare én gang.
+Hvor mange rader som peker på en fil telles i tabellen `media_refs`.
+Filer slettes aldri fra en forespørsel: en samtidig opplasting av de
+samme bytene kan ha gjenbrukt filen mellom commit og sletting. Filer
+uten eier ryddes av media_gc (python -m backend.media_gc).
+
+Nye filer legges i undermapper (media/ab/cd/<navn>, se media_paths);
+`media_refs` og lesestien bruker fortsatt bare filnavnet. Filer som
+fortsatt ligger flatt i MEDIA_DIR finnes via indeksen eller et stat-kall.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Dict, Iterable, List, Optional, Union
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..metrics import stage
+from ..models import MediaRef
+from . import media_paths, renditions
+from .media_index import index as media_index
+
+MEDIA_DIR = config.MEDIA_DIR
+os.makedirs(MEDIA_DIR, exist_ok=True)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def relpath(filename: str) -> str:
+    """Hvor filen ligger (eller skal ligge) relativt til MEDIA_DIR."""
+    known = media_index.location(filename)
+    if known is not None:
+        return known
+    sharded = media_paths.relpath(filename)
+    # indeksen er tom i prosesspoolen og før første scan – spør disken
+    if sharded != filename and not os.path.exists(os.path.join(MEDIA_DIR, sharded)) \
+            and os.path.exists(os.path.join(MEDIA_DIR, filename)):
+        return filename
+    return sharded
+
+
+def url_for(filename: str) -> str:
+    return f"/media/{relpath(filename)}"
+
+
+def filename_from_url(image_url: Optional[str]) -> Optional[str]:
+    if not image_url or not image_url.startswith("/media/"):
+        return None
+    return os.path.basename(image_url) or None
+
+
+def path_for(filename: str) -> str:
+    return os.path.join(MEDIA_DIR, *relpath(filename).split("/"))
+
+
+def exists(filename: str) -> bool:
+    """
+    Finnes filen på disk? Brukes før gjenbruk av en fil (dedupe), så svaret
+    bekreftes alltid med et stat-kall: indeksen kan ennå ikke ha sett at
+    filen er slettet i en annen prosess (media_gc).
+    """
+    if os.path.exists(path_for(filename)):
+        return True
+    media_index.discard(filename)
+    return False
+
+
+def write_atomic(filename: str, data: Union[bytes, BinaryIO]) -> None:
+    """Skriv via temp-fil + rename, så ingen leser en halvskrevet fil."""
+    rel = relpath(filename)
+    target = os.path.join(MEDIA_DIR, *rel.split("/"))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+    try:
+        with stage("disk_write"), os.fdopen(fd, "wb") as fh:
+            if isinstance(data, (bytes, bytearray)):
+                fh.write(data)
+            else:
+                data.seek(0)
+                shutil.copyfileobj(data, fh)
+        os.replace(tmp, target)
+        media_index.add(rel)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def shard_existing(filename: str) -> Optional[str]:
+    """
+    Flytt en fil som ligger flatt i MEDIA_DIR (og renditions) til
+    undermappen sin. Returnerer ny relativ sti, eller None hvis det ikke
+    var noe å flytte.
+    """
+    target_rel = media_paths.relpath(filename)
+    src = os.path.join(MEDIA_DIR, filename)
+    if target_rel == filename or not os.path.isfile(src):
+        return None
+    target = os.path.join(MEDIA_DIR, *target_rel.split("/"))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(src, target)
+    media_index.add(target_rel)
+    if not renditions.is_rendition(filename):
+        for size in renditions.SIZES:
+            shard_existing(renditions.rendition_filename(filename, size))
+    return target_rel
+
+
+# ---------- referansetelling ----------
+
+_UPSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def acquire_many(db: Session, counts: Dict[str, int]) -> None:
+    """
+    Øk tellerne (filnavn -> antall) i callerens transaksjon, med én
+    INSERT ... ON CONFLICT DO UPDATE per bit, så to samtidige første
+    opplastinger av samme bytes ikke kolliderer på primærnøkkelen.
+    """
+    if not counts:
+        return
+    insert = _UPSERT.get(db.get_bind().dialect.name)
+    if insert is None:
+        for filename, n in counts.items():
+            res = db.execute(update(MediaRef).where(MediaRef.filename == filename)
+                             .values(refcount=MediaRef.refcount + n))
+            if res.rowcount == 0:
+                db.add(MediaRef(filename=filename, refcount=n))
+        db.flush()
+        return
+    items = [{"filename": f, "refcount": n} for f, n in counts.items()]
+    for i in range(0, len(items), 400):
+        stmt = insert(MediaRef).values(items[i:i + 400])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[MediaRef.filename],
+            set_={"refcount": MediaRef.refcount + stmt.excluded.refcount},
+        ))
+
+
+def acquire(db: Session, filename: str) -> None:
+    """Øk telleren for filename (i callerens transaksjon)."""
+    acquire_many(db, {filename: 1})
+
+
+def release(db: Session, image_url: Optional[str]) -> bool:
+    """
+    Senk telleren for filen bak image_url (i callerens transaksjon).
+    True hvis filen ikke lenger har eiere; den slettes av media_gc.
+    """
+    filename = filename_from_url(image_url)
+    if not filename:
+        return False
+    res = db.execute(
+        update(MediaRef).where(MediaRef.filename == filename)
+        .values(refcount=MediaRef.refcount - 1)
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount == 0:
+        # Eldre fil uten telling – den hadde bare denne ene eieren.
+        return True
+    gone = db.execute(
+        delete(MediaRef).where(MediaRef.filename == filename, MediaRef.refcount <= 0)
+        .execution_options(synchronize_session=False)
+    )
+    return bool(gone.rowcount)
+
+
+def release_many(db: Session, image_urls: Iterable[Optional[str]]) -> List[str]:
+    """
+    Som release, men for mange filer på én gang (bulk-sletting). Returnerer
+    filnavnene som ikke lenger har eiere.
+    """
+    counts: Dict[str, int] = {}
+    for url in image_urls:
+        filename = filename_from_url(url)
+        if filename:
+            counts[filename] = counts.get(filename, 0) + 1
+    names = list(counts)
+    orphaned: List[str] = []
+    for i in range(0, len(names), 900):
+        chunk = names[i:i + 900]
+        existing = {f for (f,) in db.execute(select(MediaRef.filename).where(MediaRef.filename.in_(chunk)))}
+        # eldre filer uten telling hadde bare én eier
+        orphaned += [f for f in chunk if f not in existing]
+        if not existing:
+            continue
+        db.execute(
+            update(MediaRef).where(MediaRef.filename.in_(existing))
+            .values(refcount=MediaRef.refcount - case({f: counts[f] for f in existing}, value=MediaRef.filename))
+            .execution_options(synchronize_session=False)
+        )
+        dead = [f for (f,) in db.execute(
+            select(MediaRef.filename).where(MediaRef.filename.in_(existing), MediaRef.refcount <= 0))]
+        if dead:
+            db.execute(delete(MediaRef).where(MediaRef.filename.in_(dead))
+                       .execution_options(synchronize_session=False))
+        orphaned += dead
+    return orphaned
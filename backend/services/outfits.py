@@ -0,0 +1,303 @@
+# backend/services/outfits.py
+"""
+Forslag til antrekk: topp × underdel × sko (+ evt. tilbehør).
+
+Egenskapene per plagg (fargetone, hvor fargerikt det er, lyshet og
+dominerende farge) avledes av histogrammene i likhetsindeksen, så ingen
+bilder leses her. Par av kategorier scores som hele matriser på én gang.
+
+Antall kombinasjoner vokser som |topp|·|underdel|·|sko|, så de listes
+ikke opp. For hvert (topp, underdel)-par finnes en øvre grense
+  par + beste sko for toppen + beste sko for underdelen,
+og parene behandles i blokker i synkende grense-rekkefølge. Når neste
+grense er lavere enn den k-te beste antrekket så langt, kan ingen senere
+par komme inn – resultatet er det samme som ved full opptelling.
+Tilbehør velges til slutt for hvert av de k antrekkene.
+
+Antrekk settes bare sammen av plaggene til én bruker (user_id).
+"""
+from __future__ import annotations
+
+import colorsys
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .similarity import CATEGORY_CODES, HIST_BINS, index as similarity_index, user_code
+
+CORE = ("topp", "underdel", "sko")
+ACCESSORY = "tilbehør"
+
+PAIR_CHUNK = 256             # (topp, underdel)-par per vektorisert blokk
+NEUTRAL_SCORE = 0.7          # par der minst ett plagg er gråtone/svart/hvitt
+CONTRAST_WEIGHT = 0.15       # litt ekstra for lys/mørk-kontrast
+PAIR_CACHE_ENTRIES = 256     # (kategori, kategori, bruker)-matriser som holdes i minnet
+
+
+@dataclass
+class Outfit:
+    score: float
+    items: Dict[str, int]          # kategori -> cloth_id
+
+
+# ---------- egenskaper per plagg ----------
+
+def _bin_centers() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    nh, ns, nv = HIST_BINS
+    h, s, v = np.meshgrid((np.arange(nh) + 0.5) / nh, (np.arange(ns) + 0.5) / ns,
+                          (np.arange(nv) + 0.5) / nv, indexing="ij")
+    return h.reshape(-1), s.reshape(-1), v.reshape(-1)
+
+
+_H, _S, _V = _bin_centers()
+_HUE_VEC = np.stack([np.cos(2 * np.pi * _H), np.sin(2 * np.pi * _H)], axis=1)     # 64 x 2
+
+
+def _harmony_lut(steps: int = 2048) -> np.ndarray:
+    """Fargeharmoni som funksjon av cos(vinkelen mellom fargetonene), som oppslagstabell."""
+    d = np.degrees(np.arccos(np.linspace(-1.0, 1.0, steps + 1)))      # 180..0
+    return np.maximum.reduce([
+        np.exp(-(d / 30.0) ** 2),                    # samme fargetone
+        0.9 * np.exp(-((180.0 - d) / 30.0) ** 2),    # komplementære
+        0.6 * np.exp(-((d - 45.0) / 20.0) ** 2),     # analoge
+    ]).astype(np.float32)
+
+
+_HARMONY = _harmony_lut()
+_HARMONY_STEPS = len(_HARMONY) - 1
+
+
+def _hex(bin_idx: int) -> str:
+    r, g, b = colorsys.hsv_to_rgb(_H[bin_idx], _S[bin_idx], _V[bin_idx])
+    return "#{:02x}{:02x}{:02x}".format(round(r * 255), round(g * 255), round(b * 255))
+
+
+class Attributes:
+    """Vektoriserte egenskaper for alle plagg i indeksen (én rad per plagg)."""
+
+    def __init__(self, version: int, ids: np.ndarray, cats: np.ndarray, users: np.ndarray, hist: np.ndarray):
+        self.version = version
+        self.ids = ids
+        self.cats = cats
+        self.users = users
+        p = hist.astype(np.float32) ** 2                 # histogrammet er lagret som kvadratrot
+        p /= np.maximum(p.sum(axis=1, keepdims=True), 1e-9)
+        vec = (p * _S) @ _HUE_VEC                        # fargetone vektet med metning
+        chroma = np.linalg.norm(vec, axis=1)
+        self.hue = vec / np.maximum(chroma, 1e-9)[:, None]
+        self.chroma = np.clip(chroma * 1.5, 0.0, 1.0)    # ~0 for gråtoner, ~1 for klare farger
+        self.value = p @ _V
+        self.dominant = p.argmax(axis=1)
+        self.row = {int(i): r for r, i in enumerate(ids)}
+        self._lock = threading.Lock()
+        self._pairs: "OrderedDict[Tuple[str, str, int], np.ndarray]" = OrderedDict()
+
+    def rows(self, category: str, user: int) -> np.ndarray:
+        return np.nonzero((self.cats == CATEGORY_CODES[category]) & (self.users == user))[0]
+
+    def pair_scores(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """|a| x |b| matrise med hvor godt plaggene passer sammen (0..~1)."""
+        cos = self.hue[a] @ self.hue[b].T
+        lut_idx = ((cos + 1.0) * (_HARMONY_STEPS / 2)).astype(np.int32)
+        np.clip(lut_idx, 0, _HARMONY_STEPS, out=lut_idx)
+        harmony = _HARMONY[lut_idx]
+        w = np.outer(self.chroma[a], self.chroma[b])     # fargetone betyr bare noe når begge er fargerike
+        contrast = np.abs(self.value[a][:, None] - self.value[b][None, :])
+        return (NEUTRAL_SCORE + w * (harmony - NEUTRAL_SCORE) + CONTRAST_WEIGHT * contrast).astype(np.float32)
+
+    def category_pair(self, cat_a: str, cat_b: str, user: int) -> np.ndarray:
+        """pair_scores for to hele kategorier hos én bruker – uavhengig av spørringen, så den caches."""
+        key = (cat_a, cat_b, user)
+        with self._lock:
+            m = self._pairs.get(key)
+            if m is not None:
+                self._pairs.move_to_end(key)
+                return m
+            m = self._pairs[key] = self.pair_scores(self.rows(cat_a, user), self.rows(cat_b, user))
+            while len(self._pairs) > PAIR_CACHE_ENTRIES:
+                self._pairs.popitem(last=False)
+            return m
+
+    def dominant_color(self, cloth_id: int) -> Optional[str]:
+        row = self.row.get(cloth_id)
+        return None if row is None else _hex(int(self.dominant[row]))
+
+
+_attrs_lock = threading.Lock()
+_attrs: Optional[Attributes] = None
+
+
+def attributes() -> Attributes:
+    """Egenskapene, beregnet på nytt bare når likhetsindeksen har endret seg."""
+    global _attrs
+    with _attrs_lock:
+        if _attrs is None or _attrs.version != similarity_index.version:
+            _attrs = Attributes(*similarity_index.snapshot())
+        return _attrs
+
+
+# ---------- søk ----------
+
+def _select(cands: List[np.ndarray], k: int, max_per_item: int,
+            free: Sequence[int] = ()) -> List[Tuple[float, Tuple[int, ...]]]:
+    """
+    Grådig topp-k over kandidatene (rader: score, plaggrad...), med maks
+    max_per_item antrekk per plagg (0 = fritt). Rader i free telles ikke.
+    """
+    if not cands:
+        return []
+    allc = np.concatenate(cands)
+    allc = allc[np.argsort(-allc[:, 0], kind="stable")]
+    if not max_per_item:
+        return [(float(c[0]), tuple(int(x) for x in c[1:])) for c in allc[:k]]
+    used: Dict[int, int] = {}
+    out = []
+    for c in allc:
+        rows = tuple(int(x) for x in c[1:])
+        counted = [r for r in rows if r not in free]
+        if any(used.get(r, 0) >= max_per_item for r in counted):
+            continue
+        for r in counted:
+            used[r] = used.get(r, 0) + 1
+        out.append((float(c[0]), rows))
+        if len(out) == k:
+            break
+    return out
+
+
+def _top_pairs(pab: np.ndarray, a: np.ndarray, b: np.ndarray, k: int, max_per_item: int,
+               free: Sequence[int] = ()):
+    """To kategorier: ta de beste parene med argpartition, flere om begrensningen krever det."""
+    flat = pab.ravel()
+    m = k
+    while True:
+        m = min(m, len(flat))
+        top = np.argpartition(-flat, m - 1)[:m]
+        ia, ib = np.unravel_index(top, pab.shape)
+        chosen = _select([np.stack([flat[top], a[ia], b[ib]], axis=1)], k, max_per_item, free)
+        if len(chosen) == k or m == len(flat):
+            return chosen
+        m *= 4
+
+
+def _top_triples(pab, pac, pbc, a, b, c, k: int, max_per_item: int, free: Sequence[int] = ()):
+    """Tre kategorier med grense-beskjæring (se modul-docstring)."""
+    bound = pab + pac.max(axis=1)[:, None] + pbc.max(axis=1)[None, :]
+    flat = bound.ravel()
+    # Hvor mange sko per par som må vurderes: med maks m bruk per plagg kan
+    # et par i verste fall trenge sin ceil(k/m)+1 beste sko
+    r = k if not max_per_item else min(k, math.ceil(k / max_per_item) + 1)
+    r = min(r, len(c))
+
+    cands: List[np.ndarray] = []
+    chosen: List[Tuple[float, Tuple[int, ...]]] = []
+    remaining = flat.copy()
+    block = min(len(flat), max(PAIR_CHUNK * 8, k * 4))
+    left = len(flat)
+    while left:
+        # neste blokk med høyeste grenser, uten å sortere hele matrisen
+        take = min(block, left)
+        idx = np.argpartition(-remaining, take - 1)[:take]
+        idx = idx[np.argsort(-remaining[idx], kind="stable")]
+        remaining[idx] = -np.inf
+        left -= take
+        for start in range(0, take, PAIR_CHUNK):
+            part = idx[start:start + PAIR_CHUNK]
+            if len(chosen) == k and flat[part[0]] < chosen[-1][0]:
+                return chosen
+            ia, ib = np.unravel_index(part, pab.shape)
+            shoe = pac[ia] + pbc[ib]                                   # blokk x |c|
+            top = np.argpartition(-shoe, r - 1, axis=1)[:, :r]
+            scores = pab[ia, ib][:, None] + np.take_along_axis(shoe, top, axis=1)
+            cands.append(np.stack([
+                scores.ravel(),
+                np.repeat(a[ia], r),
+                np.repeat(b[ib], r),
+                c[top].ravel(),
+            ], axis=1))
+            chosen = _select(cands, k, max_per_item, free)
+            if not max_per_item:
+                # uten begrensning kan bare de k beste noen gang bli valgt
+                cands = [np.array([(sc, *rows) for sc, rows in chosen], dtype=np.float64)]
+    return chosen
+
+
+def suggest(k: int = 50, *, max_per_item: int = 3, with_id: Optional[int] = None,
+            accessories: bool = True, user_id: Optional[int] = None) -> List[Outfit]:
+    """
+    De k beste antrekkene av plaggene til user_id, best først. with_id
+    låser ett plagg (f.eks. "hva passer til denne toppen?"). Plagg som
+    ikke er i likhetsindeksen ennå er ikke med.
+    """
+    at = attributes()
+    user = user_code(user_id)
+    rows = {cat: at.rows(cat, user) for cat in CATEGORY_CODES}
+    # posisjoner innen hver kategori som er med (None = alle)
+    sel: Dict[str, Optional[np.ndarray]] = {cat: None for cat in CATEGORY_CODES}
+    free: Tuple[int, ...] = ()
+    if with_id is not None:
+        row = at.row.get(with_id)
+        if row is None or at.users[row] != user:
+            raise KeyError(with_id)
+        cat = next(c for c, code in CATEGORY_CODES.items() if code == at.cats[row])
+        sel[cat] = np.searchsorted(rows[cat], [row])
+        free = (row,)
+        if cat == ACCESSORY:
+            accessories = True
+
+    def matrix(ca: str, cb: str) -> np.ndarray:
+        m = at.category_pair(ca, cb, user)
+        if sel[ca] is not None:
+            m = m[sel[ca]]
+        if sel[cb] is not None:
+            m = m[:, sel[cb]]
+        return m
+
+    def labels(cat: str) -> np.ndarray:
+        return rows[cat] if sel[cat] is None else rows[cat][sel[cat]]
+
+    core = [cat for cat in CORE if len(rows[cat])]
+    if len(core) < 2:
+        return []
+
+    if len(core) == 2:
+        top = _top_pairs(matrix(*core), labels(core[0]), labels(core[1]), k, max_per_item, free)
+        n_pairs = 1
+    else:
+        ca, cb, cc = core
+        top = _top_triples(matrix(ca, cb), matrix(ca, cc), matrix(cb, cc),
+                           labels(ca), labels(cb), labels(cc), k, max_per_item, free)
+        n_pairs = 3
+    if not top:
+        return []
+
+    totals = np.array([t for t, _ in top], dtype=np.float32)
+    item_rows = np.array([r for _, r in top])                       # k x len(core)
+    scores = totals / n_pairs
+    best_acc = np.full(len(top), -1)
+    if accessories and len(rows[ACCESSORY]):
+        # tilbehør tas med hvis det ikke trekker snittet ned
+        fit = np.zeros((len(labels(ACCESSORY)), len(top)), dtype=np.float32)
+        for j, cat in enumerate(core):
+            pos = np.searchsorted(rows[cat], item_rows[:, j])
+            fit += matrix(ACCESSORY, cat)[:, pos]
+        fit /= len(core)
+        best = fit.argmax(axis=0)
+        best_fit = fit[best, np.arange(len(top))]
+        take = (best_fit >= scores) | (sel[ACCESSORY] is not None)
+        n = len(core)
+        scores = np.where(take, (totals + best_fit * n) / (n_pairs + n), scores)
+        best_acc = np.where(take, labels(ACCESSORY)[best], -1)
+
+    outfits = []
+    for i in range(len(top)):
+        items = {cat: int(at.ids[r]) for cat, r in zip(core, item_rows[i])}
+        if best_acc[i] >= 0:
+            items[ACCESSORY] = int(at.ids[best_acc[i]])
+        outfits.append(Outfit(round(float(scores[i]), 4), items))
+    outfits.sort(key=lambda o: -o.score)
+    return outfits
@@ -0,0 +1,106 @@
+# backend/services/pagination.py
+"""
+Keyset-paginering på (created_at, id) og feltutvalg (fields=) for listene.
+
+Cursoren er en opak base64-streng med (created_at, id) for siste rad på
+forrige side. Neste side hentes med WHERE (created_at, id) < cursor, som
+går rett på de sammensatte indeksene – like raskt på side 1 som side 10 000.
+"""
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+
+from .renditions import rendition_urls
+
+MAX_LIMIT = 500
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: Optional[str]
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_raw, id_raw = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_raw), int(id_raw)
+    except Exception:
+        raise ValueError("Ugyldig cursor")
+
+
+def apply_keyset(q, created_col, id_col, *, cursor: Optional[str], limit: Optional[int]):
+    """Legg på sortering, cursor-filter og limit (+1 for å se om det finnes mer)."""
+    q = q.order_by(created_col.desc(), id_col.desc())
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        q = q.filter(tuple_(created_col, id_col) < tuple_(created_at, row_id))
+    if limit is not None:
+        q = q.limit(limit + 1)
+    return q
+
+
+def finish_page(rows: Sequence[Any], limit: Optional[int]) -> Page:
+    """Kutt ekstra-raden og lag cursor til neste side."""
+    if limit is None or len(rows) <= limit:
+        return Page(list(rows), None)
+    rows = list(rows[:limit])
+    last = rows[-1]
+    return Page(rows, encode_cursor(last.created_at, last.id))
+
+
+# ---------- feltutvalg ----------
+
+# felt som krever image_url fra databasen
+_IMAGE_FIELDS = {"image_url", "renditions", "thumbnail"}
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    allowed = set(allowed)
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown:
+        raise ValueError(f"Ukjente felt: {', '.join(unknown)}. Gyldige: {', '.join(sorted(allowed))}")
+    return list(dict.fromkeys(wanted))
+
+
+def columns_for(model, fields: Sequence[str]) -> list:
+    """Kolonnene som må hentes for å bygge fields (id/created_at alltid med for cursoren)."""
+    names = {"id", "created_at"}
+    for f in fields:
+        names.add("image_url" if f in _IMAGE_FIELDS else f)
+    return [getattr(model, n) for n in sorted(names)]
+
+
+def project(rows: Iterable[Any], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    out = []
+    for row in rows:
+        item: Dict[str, Any] = {}
+        for f in fields:
+            if f == "renditions":
+                item[f] = rendition_urls(row.image_url)
+            elif f == "thumbnail":
+                item[f] = rendition_urls(row.image_url).get("128") or row.image_url
+            else:
+                item[f] = getattr(row, f)
+        out.append(item)
+    return out
+
+
+def page_headers(url, next_cursor: Optional[str]) -> Dict[str, str]:
+    """X-Next-Cursor + Link rel=next, så klienten slipper å bygge URL selv."""
+    if not next_cursor:
+        return {}
+    next_url = url.include_query_params(cursor=next_cursor)
+    return {"X-Next-Cursor": next_cursor, "Link": f'<{next_url}>; rel="next"'}
@@ -0,0 +1,154 @@
+# backend/services/pipeline.py
+"""
+Stegene som kjøres i jobbkøen etter en opplasting (se services/jobs.py).
+
+Plagg:  cloth.process (arbeiderprosess) – dekod, PNG-kod og lag renditions
+        cloth.index   (app-prosessen)   – likhetsindeks, duplikater, "ready"
+Looks:  look.render   (arbeiderprosess) – tegn looken fra layouten
+
+Hvert steg er idempotent: finnes filen allerede, hoppes arbeidet over, så
+et nytt forsøk etter en krasj gjør bare det som mangler.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from io import BytesIO
+from typing import BinaryIO, Optional, Union
+
+from sqlalchemy import select
+
+from .. import config
+from ..metrics import stage
+from ..models import Cloth, Look
+from . import compositor, media_store, renditions
+from .jobs import Fatal, JobContext, handler
+from .similarity import features_for_url, index as similarity_index
+from .uploads import open_image
+
+READY = "ready"
+PROCESSING = "processing"
+
+
+# ---------- opplastede bytes som venter ----------
+
+def spool_path(name: str) -> str:
+    return os.path.join(config.JOBS_SPOOL_DIR, os.path.basename(name))
+
+
+def spool(content: Union[bytes, BinaryIO], sha256: str) -> str:
+    """Lagre opplastingen til jobben kjører (innholdsadressert). Returnerer navnet."""
+    path = spool_path(sha256)
+    if os.path.exists(path):
+        return sha256
+    os.makedirs(config.JOBS_SPOOL_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=config.JOBS_SPOOL_DIR, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            if isinstance(content, (bytes, bytearray)):
+                fh.write(content)
+            else:
+                content.seek(0)
+                while True:
+                    chunk = content.read(1 << 20)
+                    if not chunk:
+                        break
+                    fh.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return sha256
+
+
+def _drop_spool(name: Optional[str]) -> None:
+    if not name:
+        return
+    try:
+        os.remove(spool_path(name))
+    except OSError:
+        pass
+
+
+# ---------- plagg ----------
+
+def _cloth_process_failed(db, job) -> None:
+    """
+    cloth.process ga opp: slipp referansen _create_deferred tok på filen
+    jobben skulle skrive, og fjern den spolte opplastingen. Plagget står
+    igjen med status "failed" og tom image_url (peker ikke på noen fil),
+    til brukeren sletter det. En halvskrevet fil ryddes av media_gc.
+    """
+    payload = job.payload or {}
+    _drop_spool(payload.get("spool"))
+    cloth = db.execute(
+        select(Cloth).where(Cloth.id == payload.get("cloth_id"), Cloth.job_id == job.id)
+    ).scalar_one_or_none()
+    if cloth is None or not cloth.image_url:
+        return
+    media_store.release(db, cloth.image_url)
+    cloth.image_url = ""
+
+
+@handler("cloth.process", concurrency=config.JOBS_PROCESS_CONCURRENCY, on_failed=_cloth_process_failed)
+def process_cloth(ctx: JobContext) -> Optional[dict]:
+    filename = ctx.payload["filename"]
+    if ctx.db.get(Cloth, ctx.payload["cloth_id"]) is None:
+        _drop_spool(ctx.payload.get("spool"))         # slettet mens den ventet
+        return None
+    if not media_store.exists(filename):
+        try:
+            with open(spool_path(ctx.payload["spool"]), "rb") as fh:
+                img = open_image(fh).convert("RGBA")
+        except ValueError as e:
+            _drop_spool(ctx.payload.get("spool"))
+            raise Fatal(str(e))
+        ctx.progress(1, 3)
+        buf = BytesIO()
+        with stage("png_encode"):
+            img.save(buf, format="PNG")
+        media_store.write_atomic(filename, buf.getvalue())
+        ctx.progress(2, 3)
+        renditions.generate(img, media_store.path_for(filename))
+        ctx.progress(3, 3)
+    _drop_spool(ctx.payload.get("spool"))
+    ctx.then("cloth.index", {"cloth_id": ctx.payload["cloth_id"]})
+    return {"image_url": media_store.url_for(filename)}
+
+
+@handler("cloth.index", local=True)
+def index_cloth(ctx: JobContext) -> Optional[dict]:
+    """
+    Kjøres i app-prosessen: likhetsindeksen ligger i minnet der. Andre
+    web-prosesser får plagget via endringsloggen (SimilarityIndex.follow).
+    """
+    cloth = ctx.db.get(Cloth, ctx.payload["cloth_id"])
+    if cloth is None:
+        return None
+    duplicates = []
+    features = features_for_url(cloth.image_url)
+    if features is not None:
+        duplicates = similarity_index.duplicates(features, exclude=[cloth.id], user_id=cloth.user_id)
+        similarity_index.add(cloth.id, getattr(cloth.category, "value", cloth.category), features,
+                             user_id=cloth.user_id, image_url=cloth.image_url)
+    cloth.status = READY
+    return {"possible_duplicates": duplicates}
+
+
+# ---------- looks ----------
+
+@handler("look.render")
+def render_look(ctx: JobContext) -> Optional[dict]:
+    look = ctx.db.get(Look, ctx.payload["look_id"])
+    if look is None:
+        return None
+    try:
+        compositor.render_look(ctx.db, look, force=bool(ctx.payload.get("force")))
+    except ValueError as e:
+        raise Fatal(str(e))
+    look.status = READY
+    ctx.db.commit()
+    return {"image_url": look.image_url}
@@ -0,0 +1,512 @@
+# backend/services/rembg_service.py
+"""
+Bakgrunnsfjerning med rembg.
+
+All tung jobb (dekoding, ONNX-inferens, PNG-koding) kjøres i en egen
+trådpool bak en begrenset kø, slik at event-loopen aldri blokkeres.
+Forespørsler som kommer samtidig samles i batcher. For modellene i
+_BATCH_MODELS skaleres alle bildene i en batch til modellens faste
+inndatastørrelse og stables til én tensor, så hele batchen går i ett
+ONNX-kall; masken skaleres tilbake per bilde. Andre modeller (og modeller
+eksportert med fast batchstørrelse 1) kjøres ett og ett mot samme session.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import BinaryIO, Callable, List, Optional, Sequence, Union
+
+import numpy as np
+from PIL import Image
+
+from .. import config
+from ..metrics import stage
+from .media_store import content_hash
+from .result_cache import DiskLRUCache
+from .uploads import SpooledUpload, open_image
+
+logger = logging.getLogger("looksy")
+
+REMBG_OK = False
+_rembg_session = None
+_rembg_model: Optional[str] = None
+_remove = None
+
+# Modellens tilstand: idle -> loading -> ready | failed (eller disabled)
+_state = "idle"
+_state_error: Optional[str] = None
+_load_seconds: Optional[float] = None
+_load_lock = threading.Lock()
+_loaded = threading.Event()
+
+_GRAPH_OPT = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def _session_options(single_threaded: bool = False):
+    """ONNX Runtime-innstillinger fra config (tråder, grafoptimalisering)."""
+    import onnxruntime as ort  # type: ignore
+
+    opts = ort.SessionOptions()
+    intra, inter = config.REMBG_INTRA_OP_THREADS, config.REMBG_INTER_OP_THREADS
+    if single_threaded:
+        # Ingen trådpool i ORT: sessionen kan lages før fork og deles av workerne
+        intra = inter = 1
+    if intra > 0:
+        opts.intra_op_num_threads = intra
+    if inter > 0:
+        opts.inter_op_num_threads = inter
+    level = _GRAPH_OPT.get(config.REMBG_GRAPH_OPT.lower())
+    if level is None:
+        raise RuntimeError(f"Ukjent REMBG_GRAPH_OPT: {config.REMBG_GRAPH_OPT!r} (gyldige: {', '.join(_GRAPH_OPT)})")
+    opts.graph_optimization_level = getattr(ort.GraphOptimizationLevel, level)
+    opts.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if config.REMBG_EXECUTION_MODE.lower() == "parallel"
+        else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    return opts
+
+
+def _new_session(model: str, single_threaded: bool):
+    """Som rembg.new_session, men med våre SessionOptions."""
+    from rembg.sessions import sessions_class  # type: ignore
+
+    for cls in sessions_class:
+        if cls.name() == model:
+            return cls(model, _session_options(single_threaded))
+    raise RuntimeError(f"Ukjent rembg-modell: {model!r}")
+
+
+def init_rembg(*, single_threaded: bool = False) -> bool:
+    """
+    Last modellen fra config.REMBG_MODEL (synkront) og kjør en liten
+    oppvarmingsinferens. Trygt å kalle flere ganger; bare første laster.
+    Returnerer True hvis rembg er klar.
+    """
+    global REMBG_OK, _rembg_session, _rembg_model, _remove, _state, _state_error, _load_seconds
+    with _load_lock:
+        if _state in ("ready", "failed", "disabled"):
+            return REMBG_OK
+        model = config.REMBG_MODEL.strip()
+        if not model or config.REMBG_LOAD == "off":
+            _state = "disabled"
+            _loaded.set()
+            logger.info("REMBG: slått av i config – bakgrunn fjernes ikke.")
+            return False
+
+        _state = "loading"
+        t0 = time.perf_counter()
+        try:
+            from rembg import remove  # type: ignore
+
+            session = _new_session(model, single_threaded)
+            if config.REMBG_WARMUP:
+                # første inferens allokerer minne og kompilerer kjerner – ta den her
+                remove(Image.new("RGB", (64, 64), (255, 255, 255)), session=session)
+            _rembg_session, _rembg_model, _remove = session, model, remove
+            REMBG_OK = True
+            _state, _state_error = "ready", None
+            logger.info(f"REMBG: OK – session initialised ({model}).")
+        except Exception as e:
+            REMBG_OK = False
+            _state, _state_error = "failed", str(e)
+            logger.warning(f"REMBG: NOT OK – falling back. Error: {e}")
+        finally:
+            _load_seconds = round(time.perf_counter() - t0, 3)
+            _loaded.set()
+        return REMBG_OK
+
+
+def start_warmup() -> None:
+    """Last modellen i en bakgrunnstråd (appen svarer på alt annet imens)."""
+    if _state != "idle":
+        return
+    threading.Thread(target=init_rembg, name="rembg-warmup", daemon=True).start()
+
+
+async def wait_ready(timeout_s: float) -> bool:
+    """
+    Vent (uten å blokkere loopen) til modellen er ferdig lastet eller har
+    feilet. Med REMBG_LOAD=lazy startes lastingen her. False = fortsatt laster.
+    """
+    if _state == "idle":
+        start_warmup()
+    if _loaded.is_set():
+        return True
+    return await asyncio.to_thread(_loaded.wait, timeout_s)
+
+
+def model_state() -> dict:
+    return {
+        "state": _state,
+        "model": _rembg_model or (config.REMBG_MODEL or None),
+        "load_mode": config.REMBG_LOAD,
+        "load_seconds": _load_seconds,
+        "error": _state_error,
+    }
+
+
+def model_name() -> Optional[str]:
+    return _rembg_model if REMBG_OK else None
+
+
+def _prepare(pil_image: Image.Image) -> Image.Image:
+    try:
+        pil_image = pil_image.convert("RGB")
+        pil_image.thumbnail((2048, 2048))
+    except Exception:
+        pass
+    return pil_image
+
+
+def remove_bg_pil(pil_image: Image.Image) -> Image.Image:
+    """Fjern bakgrunn hvis rembg finnes, ellers bare konverter til RGBA."""
+    pil_image = _prepare(pil_image)
+
+    if REMBG_OK:
+        # rembg tar imot PIL direkte – vi slipper en PNG-runde inn og ut.
+        with stage("rembg"):
+            return _remove(pil_image, session=_rembg_session).convert("RGBA")
+
+    logger.warning("Fallback i bruk – bakgrunn fjernes ikke.")
+    return pil_image.convert("RGBA")
+
+
+ImageInput = Union[bytes, BinaryIO]
+
+# modell -> (mean, std, inndatastørrelse), samme forbehandling som rembg sine sessions
+_IMAGENET = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320))
+_BATCH_MODELS = {
+    "u2net": _IMAGENET,
+    "u2netp": _IMAGENET,
+    "u2net_human_seg": _IMAGENET,
+    "silueta": _IMAGENET,
+    "isnet-general-use": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+    "isnet-anime": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+# None = ikke prøvd ennå; False = modellen har fast batchstørrelse 1
+_batch_dim_ok: Optional[bool] = None
+
+
+def _normalize(img: Image.Image, mean, std, size) -> np.ndarray:
+    arr = np.asarray(img.convert("RGB").resize(size, Image.LANCZOS), dtype=np.float32)
+    arr = arr / max(float(arr.max()), 1e-6)
+    arr = (arr - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    return arr.transpose(2, 0, 1)
+
+
+def _predict_masks(images: Sequence[Image.Image]) -> List[Image.Image]:
+    """Masker for alle bildene med ett session-kall (ett per bilde hvis modellen ikke tar batch)."""
+    global _batch_dim_ok
+    mean, std, size = _BATCH_MODELS[_rembg_model]
+    batch = np.stack([_normalize(im, mean, std, size) for im in images])
+    inner = _rembg_session.inner_session
+    name = inner.get_inputs()[0].name
+
+    preds = None
+    if len(images) > 1 and _batch_dim_ok is not False:
+        try:
+            preds = inner.run(None, {name: batch})[0][:, 0]
+            _batch_dim_ok = True
+        except Exception as e:
+            if _batch_dim_ok:
+                raise
+            _batch_dim_ok = False
+            logger.info(f"REMBG: {_rembg_model} tar ikke batch (kjører ett og ett): {e}")
+    if preds is None:
+        preds = np.concatenate([inner.run(None, {name: batch[i:i + 1]})[0][:, 0] for i in range(len(images))])
+
+    masks = []
+    for pred, im in zip(preds, images):
+        lo, hi = float(pred.min()), float(pred.max())
+        pred = (pred - lo) / max(hi - lo, 1e-6)
+        mask = Image.fromarray((pred * 255).astype(np.uint8), mode="L")
+        masks.append(mask.resize(im.size, Image.LANCZOS))
+    return masks
+
+
+def _cutouts(images: Sequence[Image.Image]) -> List[Image.Image]:
+    with stage("rembg"):
+        masks = _predict_masks(images)
+    return [Image.composite(im.convert("RGBA"), Image.new("RGBA", im.size, 0), m) for im, m in zip(images, masks)]
+
+
+def remove_bg_batch(contents: Sequence[ImageInput]) -> List[Union[bytes, Exception]]:
+    """
+    Kjør en hel batch: dekod alle bildene, kjør inferens på hele batchen i
+    ett session-kall (se _BATCH_MODELS), og kod resultatene som PNG.
+    Returnerer én PNG eller ett unntak per inndata, i samme rekkefølge.
+    """
+    results: List[Union[bytes, Exception, None]] = [None] * len(contents)
+    images: dict = {}
+    for i, content in enumerate(contents):
+        try:
+            fp = BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+            images[i] = _prepare(open_image(fp, 2048))
+        except ValueError:
+            results[i] = ValueError("Ugyldig bilde")
+
+    outputs: dict = {}
+    if images and REMBG_OK and _rembg_model in _BATCH_MODELS:
+        try:
+            outputs = dict(zip(images, _cutouts(list(images.values()))))
+        except Exception as e:
+            # ett dårlig bilde skal ikke felle resten – prøv dem enkeltvis under
+            logger.warning(f"REMBG: batch på {len(images)} feilet, kjører enkeltvis: {e}")
+    for i, img in images.items():
+        try:
+            out = outputs.get(i) or remove_bg_pil(img)
+            buf = BytesIO()
+            with stage("png_encode"):
+                out.save(buf, format="PNG")
+            results[i] = buf.getvalue()
+        except Exception as e:
+            results[i] = e
+    return results
+
+
+# -----------------------------
+# Inferensmotor (kø + batching)
+# -----------------------------
+class QueueFullError(RuntimeError):
+    """Køen er full – klienten bør prøve igjen senere."""
+
+
+@dataclass
+class _Job:
+    content: ImageInput
+    future: Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class RembgEngine:
+    """
+    Begrenset kø foran en trådpool. En dispatcher-tråd henter jobber fra
+    køen, venter et kort vindu på flere, og sender dem samlet til poolen.
+    Hver arbeider holder en "slot", så køen – ikke poolen – er der
+    forespørsler venter. Full kø gir QueueFullError (→ 503).
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[Sequence[ImageInput]], List[Union[bytes, Exception]]],
+        *,
+        queue_size: int,
+        batch_size: int,
+        batch_wait_ms: int,
+        workers: int,
+        image_timeout_s: float,
+    ):
+        self._batch_fn = batch_fn
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait_ms = max(0, batch_wait_ms)
+        self.workers = max(1, workers)
+        self.image_timeout_s = image_timeout_s
+
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=self.queue_size)
+        self._slots = threading.Semaphore(self.workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+        # statistikk
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._batches = 0
+        self._batched_items = 0
+        self._latency_total = 0.0
+        self._last_latency = 0.0
+        self._wait_total = 0.0
+
+    # ---------- livssyklus ----------
+
+    def start(self) -> None:
+        with self._lock:
+            if self._dispatcher is not None and self._dispatcher.is_alive():
+                return
+            self._stopping.clear()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="rembg-worker"
+            )
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_loop, name="rembg-dispatcher", daemon=True
+            )
+            self._dispatcher.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopping.set()
+            if self._dispatcher is not None:
+                self._dispatcher.join(timeout=2)
+                self._dispatcher = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        # Avvis det som fortsatt venter i køen
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(RuntimeError("Bakgrunnsfjerneren er stoppet"))
+
+    # ---------- innsending ----------
+
+    def submit(self, content: ImageInput) -> Future:
+        self.start()
+        fut: Future = Future()
+        try:
+            self._queue.put_nowait(_Job(content, fut))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError("Bakgrunnsfjerneren er opptatt")
+        return fut
+
+    async def run(self, content: ImageInput) -> bytes:
+        """Legg et bilde i køen og vent (uten å blokkere loopen) på PNG-svaret."""
+        fut = self.submit(content)
+        # Avbrytes ventingen, kanselleres også jobben hvis den ikke har startet.
+        return await asyncio.wait_for(asyncio.wrap_future(fut), timeout=self.image_timeout_s)
+
+    # ---------- intern ----------
+
+    def _dispatch_loop(self) -> None:
+        while not self._stopping.is_set():
+            # Vent på ledig arbeider før vi tar noe ut av køen
+            if not self._slots.acquire(timeout=0.5):
+                continue
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._slots.release()
+                continue
+
+            batch = [first]
+            deadline = time.perf_counter() + self.batch_wait_ms / 1000.0
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            executor = self._executor
+            if executor is None:
+                self._slots.release()
+                break
+            executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: List[_Job]) -> None:
+        try:
+            # Jobber som er kansellert (timeout hos klienten) hoppes over
+            jobs = [j for j in batch if j.future.set_running_or_notify_cancel()]
+            if not jobs:
+                return
+            started = time.perf_counter()
+            try:
+                results = self._batch_fn([j.content for j in jobs])
+            except Exception as e:
+                results = [e] * len(jobs)
+            finished = time.perf_counter()
+            per_image = (finished - started) / len(jobs)
+
+            failed = 0
+            for job, res in zip(jobs, results):
+                if isinstance(res, Exception):
+                    failed += 1
+                    job.future.set_exception(res)
+                else:
+                    job.future.set_result(res)
+
+            with self._lock:
+                self._batches += 1
+                self._batched_items += len(jobs)
+                self._processed += len(jobs) - failed
+                self._failed += failed
+                self._latency_total += per_image * len(jobs)
+                self._last_latency = per_image
+                self._wait_total += sum(started - j.enqueued_at for j in jobs)
+        finally:
+            self._slots.release()
+
+    # ---------- innsyn ----------
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = self._batched_items
+            return {
+                "model": model_name(),
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self.queue_size,
+                "batch_size": self.batch_size,
+                "batch_wait_ms": self.batch_wait_ms,
+                "workers": self.workers,
+                "image_timeout_s": self.image_timeout_s,
+                "processed": self._processed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "batches": self._batches,
+                "avg_batch_size": round(done / self._batches, 2) if self._batches else 0.0,
+                "avg_latency_ms": round(1000 * self._latency_total / done, 2) if done else 0.0,
+                "last_latency_ms": round(1000 * self._last_latency, 2),
+                "avg_queue_wait_ms": round(1000 * self._wait_total / done, 2) if done else 0.0,
+            }
+
+
+def _cache_key(digest: str) -> str:
+    if _loaded.is_set():
+        model = model_name()
+    else:
+        # laster fortsatt (eller lazy): modellen som blir brukt når den er klar
+        model = config.REMBG_MODEL.strip() if config.REMBG_LOAD != "off" else None
+    return f"{digest}-{model or 'fallback'}"
+
+
+async def cached_result(upload: SpooledUpload) -> Optional[bytes]:
+    """Ferdig resultat for samme bytes og modell fra disk-cachen, ellers None. Venter ikke på modellen."""
+    return await asyncio.to_thread(result_cache.get, _cache_key(upload.sha256))
+
+
+async def remove_bg_upload(upload: SpooledUpload) -> bytes:
+    """
+    Fjern bakgrunn fra en spolt opplasting og returner PNG-bytes.
+    Samme input med samme modell hentes fra disk-cachen i stedet for å
+    kjøre inferens på nytt.
+    """
+    cached = await cached_result(upload)
+    if cached is not None:
+        return cached
+    key = _cache_key(upload.sha256)
+    png = await engine.run(upload.file)
+    await asyncio.to_thread(result_cache.put, key, png)
+    return png
+
+
+result_cache = DiskLRUCache(config.REMBG_CACHE_DIR, config.REMBG_CACHE_MAX_BYTES, suffix=".png")
+
+engine = RembgEngine(
+    remove_bg_batch,
+    queue_size=config.REMBG_QUEUE_SIZE,
+    batch_size=config.REMBG_BATCH_SIZE,
+    batch_wait_ms=config.REMBG_BATCH_WAIT_MS,
+    workers=config.REMBG_WORKERS,
+    image_timeout_s=config.REMBG_IMAGE_TIMEOUT_S,
+)
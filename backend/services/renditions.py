@@ -0,0 +1,106 @@
+# backend/services/renditions.py
+"""
+Nedskalerte WebP-varianter ("renditions") av bildene i MEDIA_DIR.
+
+Masteren (PNG for plagg, PNG/JPG for looks) beholdes tapsfritt. Ved
+opplasting lages én WebP per størrelse i config.RENDITION_SIZES:
+
+    abc.png  ->  abc_128.webp, abc_384.webp, abc_1024.webp
+
+Klientene får URL-er uten filendelse (/media/abc_384). Media-ruten
+velger .webp hvis klienten sier den støtter det, ellers masteren.
+"""
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from .. import config
+from ..metrics import stage
+
+SIZES = tuple(config.RENDITION_SIZES)
+MASTER_EXTS = (".png", ".jpg", ".jpeg", ".PNG", ".JPG", ".JPEG")
+
+_RENDITION_RE = re.compile(r"^(?P<stem>.+)_(?P<size>\d+)$")
+
+
+def rendition_stem(filename: str, size: int) -> str:
+    stem, _ext = os.path.splitext(filename)
+    return f"{stem}_{size}"
+
+
+def rendition_filename(filename: str, size: int) -> str:
+    return rendition_stem(filename, size) + ".webp"
+
+
+def is_rendition(filename: str) -> bool:
+    stem, ext = os.path.splitext(filename)
+    m = _RENDITION_RE.match(stem)
+    return ext.lower() == ".webp" and m is not None and int(m.group("size")) in SIZES
+
+
+def parse_rendition(name: str) -> Optional[str]:
+    """'abc_384' -> 'abc' (stammen til masteren), ellers None."""
+    m = _RENDITION_RE.match(name)
+    if not m or int(m.group("size")) not in SIZES:
+        return None
+    return m.group("stem")
+
+
+def rendition_urls(image_url: Optional[str]) -> Dict[str, str]:
+    """Forhandlede URL-er per størrelse, f.eks. {'128': '/media/abc_128', ...}."""
+    if not image_url or not image_url.startswith("/media/"):
+        return {}
+    prefix, fname = image_url.rsplit("/", 1)
+    if not fname:
+        return {}
+    return {str(size): f"{prefix}/{rendition_stem(fname, size)}" for size in SIZES}
+
+
+def _save_webp(img: Image.Image, path: str) -> None:
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".webp")
+    os.close(fd)
+    try:
+        img.save(tmp, format="WEBP", quality=config.RENDITION_WEBP_QUALITY, method=4)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def generate(img: Image.Image, master_path: str, *, overwrite: bool = False) -> List[str]:
+    """
+    Lag alle størrelsene for en master som ligger på master_path.
+    Skalerer trinnvis fra største til minste, så hver størrelse bygger
+    på forrige i stedet for på originalen.
+    """
+    directory, fname = os.path.split(master_path)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+    written: List[str] = []
+    current = img
+    with stage("renditions"):
+        for size in sorted(SIZES, reverse=True):
+            out_path = os.path.join(directory, rendition_filename(fname, size))
+            if not overwrite and os.path.exists(out_path):
+                continue
+            current = current.copy()
+            current.thumbnail((size, size), Image.LANCZOS)
+            _save_webp(current, out_path)
+            written.append(out_path)
+    return written
+
+
+def generate_for_file(master_path: str, *, overwrite: bool = False) -> List[str]:
+    with Image.open(master_path) as img:
+        img.load()
+        return generate(img, master_path, overwrite=overwrite)
@@ -0,0 +1,195 @@
+# backend/services/response_cache.py
+"""
+Cache for ferdig serialiserte JSON-svar fra GET-rutene.
+
+Hvert svar lagres som bytes under (sti + sortert query) sammen med
+versjonene til entitetene det bygger på ("clothes", "looks"). Alle
+skriveoperasjoner kaller bump() etter commit; et lagret svar med eldre
+versjoner brukes aldri igjen. ETag-en er avledet av versjonene, så en
+klient med gjeldende ETag får 304 uten at databasen røres.
+
+Svarene avhenger av brukeren (config.USER_HEADER), så headeren er med
+i både nøkkelen og ETag-en, og svarene sendes med Vary på den.
+
+Versjonene lever i prosessen: kjører du flere workere, ser bare den
+som gjorde endringen den. Slå da av med RESPONSE_CACHE=0.
+"""
+from __future__ import annotations
+
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from .. import config
+from .serialize import dumps
+
+CLOTHES = "clothes"
+LOOKS = "looks"
+
+
+class Entry(NamedTuple):
+    body: bytes
+    headers: Dict[str, str]
+    versions: Tuple[int, ...]
+    etag: str
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        # ny verdi ved hver oppstart, så ETag-er fra en tidligere prosess ikke matcher
+        self._boot = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {CLOTHES: 0, LOOKS: 0}
+        self._items: "OrderedDict[str, Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- versjoner ----------
+
+    def bump(self, *tags: str) -> None:
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def versions(self, tags: Sequence[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(t, 0) for t in tags)
+
+    def etag(self, tags: Sequence[str], versions: Optional[Tuple[int, ...]] = None) -> str:
+        versions = versions if versions is not None else self.versions(tags)
+        return '"' + self._boot + "".join(f"-{t[0]}{v}" for t, v in zip(tags, versions)) + '"'
+
+    # ---------- oppslag ----------
+
+    def get(self, key: str, tags: Sequence[str]) -> Optional[Entry]:
+        current = self.versions(tags)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry.versions != current:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, tags: Sequence[str], versions: Tuple[int, ...],
+            body: bytes, headers: Dict[str, str]) -> Entry:
+        entry = Entry(body, headers, versions, self.etag(tags, versions))
+        if not self.enabled or len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._items[key] = entry
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and self._items:
+                _k, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted.body)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "versions": dict(self._versions),
+            }
+
+
+cache = ResponseCache(config.RESPONSE_CACHE_MAX_BYTES, enabled=config.RESPONSE_CACHE)
+
+Build = Callable[[], Tuple[Any, Dict[str, str]]]
+
+
+def _user(request: Request) -> str:
+    return (request.headers.get(config.USER_HEADER) or "").strip()
+
+
+def _key(request: Request) -> str:
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    return f"{request.url.path}?{query}#u={_user(request)}"
+
+
+NDJSON = "application/x-ndjson"
+
+
+def _encode(payload: Any, ndjson: bool) -> bytes:
+    if ndjson:
+        # én JSON-verdi per linje, så klienten kan vise elementene etter hvert som de kommer
+        return b"".join(dumps(item) + b"\n" for item in payload)
+    return dumps(payload)
+
+
+def _variant(etag: str, ndjson: bool, user: str = "") -> str:
+    # samme versjoner for en annen bruker eller i et annet format må ha en annen ETag
+    if user:
+        etag = etag[:-1] + f'-u{user}"'
+    return etag[:-1] + '-nd"' if ndjson else etag
+
+
+def _stream(body: bytes, chunk: int = 16 * 1024):
+    for i in range(0, len(body), chunk):
+        yield body[i:i + chunk]
+
+
+def cached_json(request: Request, tags: Sequence[str], build: Build, *, ndjson: bool = False) -> Response:
+    """
+    Svar fra cachen hvis mulig, ellers kall build() -> (JSON-klar payload, headere).
+    Feil (HTTPException) fra build går rett gjennom og caches ikke.
+    Med ndjson må payload være en liste; den sendes som NDJSON i biter.
+    """
+    media_type = NDJSON if ndjson else "application/json"
+    vary = {"Vary": config.USER_HEADER}
+    if not cache.enabled:
+        payload, headers = build()
+        headers = {**headers, **vary}
+        body = _encode(payload, ndjson)
+        if ndjson:
+            return StreamingResponse(_stream(body), media_type=media_type, headers=headers)
+        return Response(body, media_type=media_type, headers=headers)
+
+    user = _user(request)
+    etag = _variant(cache.etag(tags), ndjson, user)
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", **vary})
+
+    key = _key(request) + ("#nd" if ndjson else "")
+    entry = cache.get(key, tags)
+    if entry is None:
+        # versjonene leses før databasen: skjer en skriving mens vi bygger,
+        # lagres svaret med gamle versjoner og brukes aldri
+        versions = cache.versions(tags)
+        payload, headers = build()
+        entry = cache.put(key, tags, versions, _encode(payload, ndjson), headers)
+    headers = {**entry.headers, "ETag": _variant(entry.etag, ndjson, user), "Cache-Control": "no-cache", **vary}
+    if ndjson:
+        return StreamingResponse(_stream(entry.body), media_type=media_type, headers=headers)
+    return Response(entry.body, media_type=media_type, headers=headers)
+
+
+def bump_clothes() -> None:
+    # looks bygger på plaggene (LookOut.clothes, miniatyrer), så begge bumpes
+    cache.bump(CLOTHES, LOOKS)
+
+
+def bump_looks() -> None:
+    cache.bump(LOOKS)
@@ -0,0 +1,122 @@
+# backend/services/result_cache.py
+"""
+Disk-basert LRU-cache for ferdige resultater (f.eks. /remove-bg).
+
+Hver verdi er én fil i cache-mappen. Rekkefølgen holdes i minnet og
+bygges opp fra filenes mtime ved oppstart, så cachen overlever restart.
+Når total størrelse går over taket kastes de eldste oppføringene.
+"""
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class DiskLRUCache:
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ".bin"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # ---------- intern ----------
+
+    def _path(self, key: str) -> str:
+        if not _KEY_RE.match(key):
+            raise ValueError(f"Ugyldig cache-nøkkel: {key!r}")
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _load(self) -> None:
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.suffix):
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name[: -len(self.suffix)], st.st_size))
+        for _mtime, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+
+    def _evict_locked(self) -> None:
+        while self._total > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    # ---------- API ----------
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            os.utime(path)  # så rekkefølgen stemmer etter restart
+        except OSError:
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total -= size
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total -= old
+            self._entries[key] = len(data)
+            self._total += len(data)
+            self._evict_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,329 @@
+# backend/services/search.py
+"""
+Fritekstsøk i plaggnavn og look-titler, med prefiks- og skrivefeil-toleranse.
+
+SQLite: FTS5-tabeller med trigram-tokenizer (clothes_fts, looks_fts) med
+rowid = id, holdt i synk av triggere på clothes/looks – også for
+bulk-insert fra importen.
+Postgres: GIN-indekser med pg_trgm på lower(name)/lower(title).
+
+Et søk henter først kandidater som inneholder søketeksten (indeksert
+delstreng-søk). Er det for få, hentes i tillegg kandidater som deler flest
+trigrammer med søket (skrivefeil). Kandidatene rangeres så likt på begge
+databaser: starter med > ordstart > inneholder > trigram-likhet.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .. import config
+
+logger = logging.getLogger("looksy")
+
+# (tabell, tekstkolonne, type i svaret)
+SOURCES = {
+    "clothes": ("clothes", "name", "cloth"),
+    "looks": ("looks", "title", "look"),
+}
+
+_WS = re.compile(r"\s+")
+
+
+class Hit(NamedTuple):
+    score: float
+    kind: str
+    id: int
+    text: str
+
+
+def normalize(s: Optional[str]) -> str:
+    return _WS.sub(" ", (s or "").lower()).strip()
+
+
+def trigrams(s: str) -> set:
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class Scorer:
+    """
+    score(kandidat) -> 0..1 for ett søk: 1 for eksakt treff, deretter
+    prefiks, ordstart, delstreng og til slutt trigram-likhet (skrivefeil).
+    Trigrammene for ordutsnitt huskes, siden navn gjentar de samme ordene.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.grams = trigrams(query)
+        self.width = query.count(" ") + 1
+        self._memo: Dict[str, float] = {}
+
+    def _similarity(self, window: str) -> float:
+        sim = self._memo.get(window)
+        if sim is None:
+            b = trigrams(window)
+            sim = self._memo[window] = len(self.grams & b) / len(self.grams | b)
+        return sim
+
+    def __call__(self, candidate: Optional[str]) -> float:
+        query, cand = self.query, normalize(candidate)
+        if not cand:
+            return 0.0
+        if cand == query:
+            return 1.0
+        # kortere navn først blant like gode treff
+        tightness = 0.05 * len(query) / len(cand)
+        if cand.startswith(query):
+            return 0.9 + tightness
+        if f" {query}" in f" {cand}":
+            return 0.8 + tightness
+        if query in cand:
+            return 0.7 + tightness
+        # skrivefeil: trigram-likhet mot det beste utsnittet med like mange ord
+        words = cand.split(" ")
+        width = min(self.width, len(words))
+        best = max(self._similarity(" ".join(words[i:i + width])) for i in range(len(words) - width + 1))
+        return 0.65 * best
+
+
+# ---------- indekser ----------
+
+def _sqlite_ddl(table: str, column: str) -> List[str]:
+    # Teksten lagres med et mellomrom foran, så «starter med» og «ord som
+    # starter med» blir samme mønster (LIKE '% q%') – og det er indeksert
+    # av trigrammene allerede fra 2 tegn.
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(body, tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, body) VALUES (new.id, ' ' || coalesce(new.{column}, '')); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"UPDATE {fts} SET body = ' ' || coalesce(new.{column}, '') WHERE rowid = new.id; END",
+    ]
+
+
+def _sqlite_fill(table: str, column: str) -> List[str]:
+    fts = f"{table}_fts"
+    return [
+        f"DELETE FROM {fts}",
+        f"INSERT INTO {fts}(rowid, body) SELECT id, ' ' || coalesce({column}, '') FROM {table}",
+    ]
+
+
+def install(engine: Engine) -> None:
+    """Opprett søkeindeksene (idempotent). Kalles fra init_db."""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        try:
+            with engine.begin() as conn:
+                for table, column, _kind in SOURCES.values():
+                    fts = f"{table}_fts"
+                    existed = conn.exec_driver_sql(
+                        "SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)
+                    ).first() is not None
+                    for ddl in _sqlite_ddl(table, column):
+                        conn.exec_driver_sql(ddl)
+                    if not existed:
+                        # tabellen er ny: indekser radene som finnes fra før
+                        for sql in _sqlite_fill(table, column):
+                            conn.exec_driver_sql(sql)
+        except OperationalError as e:
+            # SQLite uten FTS5/trigram (< 3.34): søket faller tilbake til LIKE
+            logger.warning(f"Søk: fant ikke FTS5 med trigram ({e}) – bruker LIKE.")
+        _fts_tables.clear()
+    elif dialect == "postgresql":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for table, column, _kind in SOURCES.values():
+                conn.exec_driver_sql(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm "
+                    f"ON {table} USING gin (lower({column}) gin_trgm_ops)"
+                )
+
+
+def rebuild(engine: Engine) -> None:
+    """Bygg FTS-tabellene på nytt fra clothes/looks (SQLite)."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for table, column, _kind in SOURCES.values():
+            for sql in _sqlite_fill(table, column):
+                conn.exec_driver_sql(sql)
+
+
+# ---------- kandidater ----------
+
+def _fts_phrase(s: str) -> str:
+    return '"' + s.replace('"', '""') + '"'
+
+
+def _like(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+_fts_tables: Dict[str, bool] = {}
+
+
+def _has_fts(db: Session, fts: str) -> bool:
+    if fts not in _fts_tables:
+        _fts_tables[fts] = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :n"), {"n": fts}
+        ).first() is not None
+    return _fts_tables[fts]
+
+
+def _owner(alias: str, user_id: Optional[int]) -> str:
+    """Eier-filter som SQL (NULL-radene når user_id er None); parameteren heter :u."""
+    return f"{alias}.user_id IS NULL" if user_id is None else f"{alias}.user_id = :u"
+
+
+def _candidates_sqlite(db: Session, table: str, column: str, q: str, limit: int,
+                       user_id: Optional[int] = None) -> List[Tuple[int, str]]:
+    fts = f"{table}_fts"
+    if not _has_fts(db, fts):
+        return _candidates_like(db, table, column, q, limit, user_id)
+    # FTS-tabellen har ikke eieren – hentes fra grunntabellen på rowid
+    source = f"{fts} f JOIN {table} t ON t.id = f.rowid"
+    owner = _owner("t", user_id)
+    if len(q) < 3:
+        # for kort for MATCH: ord som starter med q (indeksert fra 2 tegn)
+        # (ESCAPE slår av trigram-indeksen for LIKE, så den brukes bare når den trengs)
+        escape = " ESCAPE '\\'" if _like(q) != q else ""
+        rows = db.execute(
+            text(f"SELECT f.rowid, f.body FROM {source} WHERE f.body LIKE :w{escape} AND {owner} LIMIT :n"),
+            {"w": "% " + _like(q) + "%", "n": limit, "u": user_id},
+        ).all()
+        return [(r[0], r[1]) for r in rows]
+
+    # 1) delstreng-treff (alle trigrammene i søket, i rekkefølge). Uten
+    # ORDER BY bm25: rangeringen gjøres uansett etterpå, og bm25 over
+    # tusenvis av treff koster mer enn hele resten av søket.
+    rows = db.execute(
+        text(f"SELECT f.rowid, f.body FROM {source} WHERE {fts} MATCH :m AND {owner} LIMIT :n"),
+        {"m": _fts_phrase(q), "n": limit, "u": user_id},
+    ).all()
+    found = [(r[0], r[1]) for r in rows]
+    if len(found) >= config.SEARCH_FUZZY_BELOW:
+        return found
+
+    # 2) skrivefeil: med én feil er minst én av halvdelene av søket intakt,
+    # så de søkes som hver sin delstreng (korte søk: enkelt-trigrammer)
+    if len(q) >= 6:
+        pieces = [q[:len(q) // 2], q[len(q) // 2:]]
+    else:
+        pieces = sorted({q[i:i + 3] for i in range(len(q) - 2)})
+    seen = {rid for rid, _ in found}
+    rows = db.execute(
+        text(f"SELECT f.rowid, f.body FROM {source} WHERE {fts} MATCH :m AND {owner} LIMIT :n"),
+        {"m": " OR ".join(_fts_phrase(p) for p in pieces), "n": limit, "u": user_id},
+    ).all()
+    found += [(r[0], r[1]) for r in rows if r[0] not in seen]
+    return found
+
+
+def _candidates_postgres(db: Session, table: str, column: str, q: str, limit: int,
+                         user_id: Optional[int] = None) -> List[Tuple[int, str]]:
+    owner = _owner(table, user_id)
+    rows = db.execute(
+        text(f"SELECT id, {column} FROM {table} WHERE lower({column}) LIKE :p ESCAPE '\\' "
+             f"AND {owner} LIMIT :n"),
+        {"p": "%" + _like(q) + "%", "n": limit, "u": user_id},
+    ).all()
+    found = [(r[0], r[1]) for r in rows]
+    if len(found) >= config.SEARCH_FUZZY_BELOW or len(q) < 3:
+        return found
+    seen = {rid for rid, _ in found}
+    rows = db.execute(
+        text(f"SELECT id, {column} FROM {table} WHERE lower({column}) % :q AND {owner} "
+             f"ORDER BY similarity(lower({column}), :q) DESC LIMIT :n"),
+        {"q": q, "n": limit, "u": user_id},
+    ).all()
+    found += [(r[0], r[1]) for r in rows if r[0] not in seen]
+    return found
+
+
+def _candidates(db: Session, table: str, column: str, q: str, limit: int,
+                user_id: Optional[int] = None) -> List[Tuple[int, str]]:
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return _candidates_sqlite(db, table, column, q, limit, user_id)
+    if dialect == "postgresql":
+        return _candidates_postgres(db, table, column, q, limit, user_id)
+    return _candidates_like(db, table, column, q, limit, user_id)
+
+
+def _candidates_like(db: Session, table: str, column: str, q: str, limit: int,
+                     user_id: Optional[int] = None) -> List[Tuple[int, str]]:
+    """Uindeksert delstreng-søk (andre databaser, eller SQLite uten FTS5)."""
+    rows = db.execute(
+        text(f"SELECT id, {column} FROM {table} WHERE lower({column}) LIKE :p ESCAPE '\\' "
+             f"AND {_owner(table, user_id)} LIMIT :n"),
+        {"p": "%" + _like(q) + "%", "n": limit, "u": user_id},
+    ).all()
+    return [(r[0], r[1]) for r in rows]
+
+
+# ---------- søk ----------
+
+def encode_cursor(hit: Hit) -> str:
+    raw = json.dumps([hit.score, hit.kind, hit.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        s, kind, rid = json.loads(base64.urlsafe_b64decode(padded))
+        return float(s), str(kind), int(rid)
+    except Exception:
+        raise ValueError("Ugyldig cursor")
+
+
+def _sort_key(h: Hit):
+    return (-h.score, h.kind, h.id)
+
+
+def search(db: Session, q: str, *, kinds: Sequence[str] = ("clothes", "looks"),
+           limit: int = 20, cursor: Optional[str] = None,
+           user_id: Optional[int] = None) -> Tuple[List[Hit], Optional[str]]:
+    """
+    Rangerte treff blant radene til user_id + cursor til neste side.
+    Sidene er keyset på (score, type, id), så de er stabile mellom kall.
+    """
+    query = normalize(q)
+    if not query:
+        return [], None
+    hits: List[Hit] = []
+    score = Scorer(query)
+    for key in kinds:
+        table, column, kind = SOURCES[key]
+        for rid, txt in _candidates(db, table, column, query, config.SEARCH_CANDIDATES, user_id):
+            s = score(txt)
+            if s >= config.SEARCH_MIN_SCORE:
+                hits.append(Hit(round(s, 4), kind, rid, (txt or "").strip()))
+    hits.sort(key=_sort_key)
+    if cursor:
+        after = decode_cursor(cursor)
+        after_key = (-after[0], after[1], after[2])
+        hits = [h for h in hits if _sort_key(h) > after_key]
+    page = hits[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(hits) > limit else None
+    return page, next_cursor
+
+
+def by_kind(hits: Sequence[Hit]) -> Dict[str, List[int]]:
+    out: Dict[str, List[int]] = {}
+    for h in hits:
+        out.setdefault(h.kind, []).append(h.id)
+    return out
@@ -0,0 +1,171 @@
+# backend/services/serialize.py
+"""
+Rask vei for de store listene: rader rett fra kolonnene (Core select)
+til dict-er med samme felt og rekkefølge som ClothOut/LookOut, og
+JSON-koding med orjson når den finnes.
+
+Skjemaene i schemas.py er fortsatt kontrakten. check_contract()
+sammenligner de to veiene (brukes av backend.benchmarks.micro), og med
+FAST_JSON=0 går alt gjennom skjemaene som før.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..models import Cloth, Look, look_clothes
+from .renditions import rendition_urls
+
+try:  # valgfritt: orjson koder store lister mange ganger raskere enn json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ---------- koding ----------
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"{type(obj).__name__} kan ikke JSON-kodes")
+
+
+def _stdlib(payload: Any) -> bytes:
+    # samme format som FastAPIs JSONResponse
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+
+def dumps(payload: Any) -> bytes:
+    """JSON-bytes (kompakt, UTF-8). Datetime/Enum kodes som skjemaene gjør."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, default=_default)
+        except TypeError:
+            pass  # f.eks. numpy-tall – json tar dem via float
+    return _stdlib(payload)
+
+
+# ---------- plagg ----------
+
+# kolonnene ClothOut trenger
+CLOTH_COLUMNS = (Cloth.id, Cloth.name, Cloth.category, Cloth.image_url, Cloth.created_at,
+                 Cloth.status, Cloth.job_id, Cloth.updated_at)
+
+
+def cloth_dict(row) -> Dict[str, Any]:
+    """Rad (eller Cloth) -> samme dict som to_jsonable(ClothOut, ...)."""
+    category = row.category
+    return {
+        "name": row.name,
+        "category": getattr(category, "value", category),
+        "id": row.id,
+        "image_url": row.image_url,
+        "created_at": row.created_at,
+        "renditions": rendition_urls(row.image_url),
+        "status": row.status or "ready",
+        "job_id": row.job_id,
+        "updated_at": row.updated_at,
+    }
+
+
+def clothes_by_id(db: Session, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """id -> ClothOut-dict for plaggene (rett fra kolonnene, eller via skjemaet med FAST_JSON=0)."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    if not config.FAST_JSON:
+        from ..schemas import ClothOut, to_jsonable
+        return {c.id: to_jsonable(ClothOut, c) for c in db.query(Cloth).filter(Cloth.id.in_(ids))}
+    return {r.id: cloth_dict(r) for r in db.execute(select(*CLOTH_COLUMNS).where(Cloth.id.in_(ids)))}
+
+
+# ---------- looks ----------
+
+LOOK_COLUMNS = (Look.id, Look.title, Look.image_url, Look.created_at, Look.layout, Look.status, Look.job_id,
+                Look.updated_at)
+
+
+def look_clothes_for(db: Session, look_ids: Sequence[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """look_id -> plaggene som dict-er, med én spørring for hele siden."""
+    out: Dict[int, List[Dict[str, Any]]] = {i: [] for i in look_ids}
+    if not out:
+        return out
+    stmt = (
+        select(look_clothes.c.look_id, *CLOTH_COLUMNS)
+        .join(Cloth, Cloth.id == look_clothes.c.cloth_id)
+        .where(look_clothes.c.look_id.in_(list(out)))
+        .order_by(look_clothes.c.look_id, Cloth.id)
+    )
+    for row in db.execute(stmt):
+        out[row.look_id].append(cloth_dict(row))
+    return out
+
+
+def look_dicts(db: Session, rows: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Look-rader (LOOK_COLUMNS) -> samme dict-er som to_jsonable(LookOut, ...)."""
+    rows = list(rows)
+    clothes = look_clothes_for(db, [r.id for r in rows])
+    return [
+        {
+            "id": r.id,
+            "title": r.title,
+            "image_url": r.image_url,
+            "renditions": rendition_urls(r.image_url),
+            "created_at": r.created_at,
+            # lagres alltid som LookLayout.as_dict(), så den er allerede på skjemaformen
+            "layout": r.layout,
+            "status": r.status or "ready",
+            "job_id": r.job_id,
+            "updated_at": r.updated_at,
+            "clothes": clothes[r.id],
+        }
+        for r in rows
+    ]
+
+
+# ---------- kontrakten ----------
+
+def check_contract(db: Session, limit: int = 50) -> Optional[str]:
+    """
+    Sammenlign den raske veien med ClothOut/LookOut for de nyeste radene.
+    None når de er like, ellers en beskrivelse av første forskjell.
+    """
+    from sqlalchemy.orm import selectinload
+
+    from ..schemas import ClothOut, LookOut, to_jsonable
+
+    def same(fast: Dict[str, Any], slow: Dict[str, Any], what: str) -> Optional[str]:
+        fast = json.loads(dumps(fast))
+        if list(fast) != list(slow):
+            return f"{what}: feltene {list(fast)} != {list(slow)}"
+        if fast != slow:
+            diff = [k for k in slow if fast[k] != slow[k]]
+            return f"{what}: ulike verdier i {diff}"
+        return None
+
+    clothes = db.query(Cloth).order_by(Cloth.id.desc()).limit(limit).all()
+    rows = {r.id: r for r in db.execute(select(*CLOTH_COLUMNS).where(Cloth.id.in_([c.id for c in clothes])))}
+    for c in clothes:
+        problem = same(cloth_dict(rows[c.id]), to_jsonable(ClothOut, c), f"plagg {c.id}")
+        if problem:
+            return problem
+
+    looks = db.query(Look).options(selectinload(Look.clothes)).order_by(Look.id.desc()).limit(limit).all()
+    fast = {d["id"]: d for d in look_dicts(
+        db, db.execute(select(*LOOK_COLUMNS).where(Look.id.in_([lk.id for lk in looks]))))}
+    for lk in looks:
+        slow = to_jsonable(LookOut, lk)
+        slow["clothes"] = sorted(slow["clothes"], key=lambda c: c["id"])   # rekkefølgen er ikke en del av kontrakten
+        problem = same(fast[lk.id], slow, f"look {lk.id}")
+        if problem:
+            return problem
+    return None
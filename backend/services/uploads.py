@@ -0,0 +1,220 @@
+# backend/services/uploads.py
+"""
+Strømmet opplasting og minnebegrenset dekoding.
+
+Filen leses i biter til en temp-fil på disk (med sha256 underveis) og
+avvises så snart den passerer byte-grensen. Bildet dekodes deretter med
+Pillows draft-modus, slik at en 40 MP JPEG skaleres ned allerede i
+dekoderen i stedet for å pakkes ut i full oppløsning først. Andre
+formater (PNG, WebP, ...) må pakkes helt ut; store bilder av den typen
+slippes gjennom UPLOAD_FULL_DECODES om gangen.
+"""
+from __future__ import annotations
+
+import hashlib
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Optional
+
+from fastapi import UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .. import config
+from ..metrics import stage
+
+
+class UploadTooLarge(ValueError):
+    """Filen (eller forespørselen) er større enn tillatt."""
+
+
+@dataclass
+class SpooledUpload:
+    file: BinaryIO
+    size: int
+    sha256: str
+
+    def close(self) -> None:
+        try:
+            self.file.close()
+        except Exception:
+            pass
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _too_large(max_bytes: int) -> UploadTooLarge:
+    return UploadTooLarge(f"Filen er for stor (maks {max_bytes // (1024 * 1024)} MB).")
+
+
+async def spool_upload(
+    upload: UploadFile,
+    *,
+    max_bytes: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> SpooledUpload:
+    """Kopier opplastingen i biter til en temp-fil og returner den spolt til start."""
+    max_bytes = max_bytes or config.UPLOAD_MAX_BYTES
+    chunk_size = chunk_size or config.UPLOAD_CHUNK_BYTES
+
+    # Kjent størrelse (fra multipart-parseren) → avvis før vi kopierer noe
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    tmp = tempfile.TemporaryFile()
+    hasher = hashlib.sha256()
+    total = 0
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise _too_large(max_bytes)
+            hasher.update(chunk)
+            tmp.write(chunk)
+        tmp.seek(0)
+    except BaseException:
+        tmp.close()
+        raise
+    return SpooledUpload(tmp, total, hasher.hexdigest())
+
+
+# store dekodinger i full oppløsning (ikke-JPEG), se UPLOAD_FULL_DECODES
+_full_decodes = threading.BoundedSemaphore(config.UPLOAD_FULL_DECODES)
+
+
+def open_image(fp: BinaryIO, max_side: Optional[int] = None) -> Image.Image:
+    """
+    Dekod et bilde med lengste side ≤ max_side og riktig EXIF-rotasjon.
+    JPEG dekodes direkte i redusert skala (draft); andre formater
+    reduseres med heltallsfaktor (reduce) før den endelige skaleringen.
+
+    Minnet: JPEG bruker omtrent max_side² × 4 byte. Andre formater pakkes
+    ut i full størrelse, opptil UPLOAD_MAX_PIXELS × 4 byte (~400 MB ved
+    100 MP); er de større enn max_side², holdes en av UPLOAD_FULL_DECODES
+    plasser til bildet er skalert ned, så toppen er begrenset til
+    UPLOAD_FULL_DECODES slike bilder samtidig.
+    """
+    max_side = max_side or config.UPLOAD_MAX_SIDE
+    try:
+        img = Image.open(fp)
+        w, h = img.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValueError("Kunne ikke lese bildefilen (støttes kun JPG/PNG).")
+    if w * h > config.UPLOAD_MAX_PIXELS:
+        raise ValueError("Bildet har for mange piksler.")
+    if img.format != "JPEG" and w * h > max_side * max_side:
+        with _full_decodes:
+            return _decode(img, max_side)
+    return _decode(img, max_side)
+
+
+def _decode(img: Image.Image, max_side: int) -> Image.Image:
+    with stage("decode"):
+        try:
+            if img.format == "JPEG":
+                img.draft("RGB", (max_side, max_side))
+            img.load()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            raise ValueError("Kunne ikke lese bildefilen (støttes kun JPG/PNG).")
+
+    with stage("thumbnail"):
+        img = ImageOps.exif_transpose(img)
+
+        factor = max(img.size) // max_side
+        if factor >= 2:
+            img = img.reduce(factor)
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+    return img
+
+
+def probe_image(fp: BinaryIO) -> str:
+    """
+    Rask sjekk av at fp er et bilde vi kan lese (bare headeren leses),
+    før dekodingen settes i jobbkøen. Spoler tilbake til start og
+    returnerer formatet (Pillow sitt navn, f.eks. "PNG").
+    """
+    try:
+        with Image.open(fp) as img:
+            w, h = img.size
+            fmt = img.format
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValueError("Kunne ikke lese bildefilen (støttes kun JPG/PNG).")
+    finally:
+        fp.seek(0)
+    if w * h > config.UPLOAD_MAX_PIXELS:
+        raise ValueError("Bildet har for mange piksler.")
+    return fmt
+
+
+class MaxBodySizeMiddleware:
+    """
+    Avviser forespørsler som er større enn max_bytes med 413 – på
+    Content-Length hvis den er oppgitt, ellers mens kroppen strømmer inn.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, overrides: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.overrides = overrides or {}   # sti -> egen grense (f.eks. batch-opplasting)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.overrides.get(scope["path"], self.max_bytes)
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    too_big = int(value) > max_bytes
+                except ValueError:
+                    too_big = False
+                if too_big:
+                    await self._reject(send)
+                    return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Svar 413 nå og la appen tro at klienten koblet fra
+                    rejected = True
+                    await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    async def _reject(self, send: Send) -> None:
+        body = '{"detail":"Forespørselen er for stor"}'.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,43 @@
+# backend/services/users.py
+"""
+Hvem en forespørsel gjelder.
+
+Appen har ingen innlogging selv; bruker-id kommer i headeren
+config.USER_HEADER, satt av proxyen/innloggingen foran. Uten header
+gjelder forespørselen de delte radene med user_id = NULL, så
+eksisterende klienter og data virker som før.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from .. import config
+
+
+def user_id_from_headers(headers) -> Optional[int]:
+    """Bruker-id fra headerne, None uten header. ValueError ved ugyldig verdi."""
+    raw = headers.get(config.USER_HEADER)
+    if raw is None or not raw.strip():
+        return None
+    try:
+        user_id = int(raw)
+    except ValueError:
+        raise ValueError(f"Ugyldig {config.USER_HEADER}: må være et heltall")
+    if user_id < 0:
+        raise ValueError(f"Ugyldig {config.USER_HEADER}: kan ikke være negativ")
+    return user_id
+
+
+def current_user_id(request: Request) -> Optional[int]:
+    """Dependency for rutene."""
+    try:
+        return user_id_from_headers(request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def owned_by(column, user_id: Optional[int]):
+    """WHERE-ledd for radene som tilhører user_id (NULL-radene når None)."""
+    return column.is_(None) if user_id is None else column == user_id
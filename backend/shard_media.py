@@ -0,0 +1,117 @@
+# backend/shard_media.py
+"""
+Flytt filer som ligger flatt i backend/media til undermappene sine
+(media/ab/cd/<navn>, se services/media_paths.py) og skriv om image_url
+for plagg og looks i bulk.
+
+    python -m backend.shard_media             # flytt og skriv om
+    python -m backend.shard_media --dry-run   # bare tell
+
+Kan kjøres flere ganger og avbrytes underveis: det som allerede er
+flyttet/skrevet om hoppes over. Gamle flate URL-er virker også i
+mellomtiden (media-ruten finner filen i undermappen).
+"""
+import argparse
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import update
+
+from . import config
+from .database import SessionLocal, init_db
+from .models import Cloth, Look
+from .services import media_paths
+
+MEDIA_DIR = config.MEDIA_DIR
+
+
+def move_files(dry_run: bool = False) -> int:
+    """Flytt alle flate filer (masters og renditions). Returnerer antall."""
+    moved = 0
+    made = set()
+    with os.scandir(MEDIA_DIR) as it:
+        names = [e.name for e in it if e.is_file() and not e.name.startswith(".")]
+    for name in names:
+        rel = media_paths.relpath(name)
+        if rel == name:
+            continue
+        moved += 1
+        if dry_run:
+            continue
+        target = os.path.join(MEDIA_DIR, *rel.split("/"))
+        directory = os.path.dirname(target)
+        if directory not in made:
+            os.makedirs(directory, exist_ok=True)
+            made.add(directory)
+        os.replace(os.path.join(MEDIA_DIR, name), target)
+    return moved
+
+
+def _new_url(url: Optional[str], dry_run: bool) -> Optional[str]:
+    """Sharded URL for en flat /media-URL, ellers None."""
+    if not url or not url.startswith("/media/"):
+        return None
+    name = url[len("/media/"):]
+    if not name or "/" in name:
+        return None
+    rel = media_paths.relpath(name)
+    if rel == name:
+        return None
+    # bare når filen faktisk ligger der (eller kommer dit med denne kjøringen)
+    if os.path.exists(os.path.join(MEDIA_DIR, *rel.split("/"))) or \
+            (dry_run and os.path.exists(os.path.join(MEDIA_DIR, name))):
+        return f"/media/{rel}"
+    return None
+
+
+def rewrite_urls(db, model, batch_size: int, dry_run: bool = False) -> int:
+    """Skriv om image_url i batcher på id (én commit per batch). Returnerer antall rader."""
+    changed = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(model.id, model.image_url)
+            .filter(model.id > last_id)
+            .order_by(model.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return changed
+        last_id = rows[-1].id
+        fixes = []
+        for row in rows:
+            new = _new_url(row.image_url, dry_run)
+            if new:
+                fixes.append({"id": row.id, "image_url": new})
+        changed += len(fixes)
+        if fixes and not dry_run:
+            db.execute(update(model), fixes)
+            db.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flytt media-filer til undermapper og skriv om image_url.")
+    parser.add_argument("--dry-run", action="store_true", help="bare tell, ikke flytt eller skriv")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rader per transaksjon")
+    args = parser.parse_args(argv)
+
+    if config.MEDIA_SHARD_DEPTH <= 0:
+        print("MEDIA_SHARD_DEPTH er 0 – filene skal ligge flatt, ingenting å gjøre.")
+        return
+
+    init_db()
+    t0 = time.perf_counter()
+    moved = move_files(args.dry_run)
+    with SessionLocal() as db:
+        clothes = rewrite_urls(db, Cloth, max(1, args.batch_size), args.dry_run)
+        looks = rewrite_urls(db, Look, max(1, args.batch_size), args.dry_run)
+
+    verb = "Ville flyttet" if args.dry_run else "Flyttet"
+    print(f"{verb} {moved} filer og skrevet om {clothes} plagg og {looks} looks "
+          f"på {time.perf_counter() - t0:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
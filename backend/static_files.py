@@ -0,0 +1,287 @@
+# backend/static_files.py
+"""
+StaticFiles-varianter for /media og /static.
+
+/media:  innholdsnavngitte filer (sha256/uuid i navnet) endres aldri og får
+         `Cache-Control: immutable` med lang max-age.
+/static: frontend-filer får sterk ETag (hash av innholdet) og `no-cache`,
+         så nettleseren revaliderer og får 304 uten kropp. JS/CSS/HTML
+         komprimeres på forhånd (gzip, og brotli hvis pakken finnes) og
+         serveres etter Accept-Encoding.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import stat
+import threading
+from mimetypes import guess_type
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from . import config
+from .services import media_paths
+from .services.renditions import MASTER_EXTS, parse_rendition
+
+try:  # valgfritt: brotli gir ~15-20 % mindre filer enn gzip
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger("looksy")
+
+# sha256 (64 hex) fra media_store, eller uuid4().hex (32 hex) fra før det,
+# evt. med look_-prefiks og _<størrelse>-suffiks for renditions
+_CONTENT_NAME = re.compile(r"^(look_)?([0-9a-f]{64}|[0-9a-f]{32})(_\d+)?\.[a-z0-9]+$")
+
+IMMUTABLE = f"public, max-age={config.MEDIA_MAX_AGE_S}, immutable"
+
+
+def accepts_webp(scope: Scope) -> bool:
+    return "image/webp" in Headers(scope=scope).get("accept", "")
+
+
+def media_cache_control(filename: str) -> str:
+    if _CONTENT_NAME.match(filename):
+        return IMMUTABLE
+    return f"public, max-age={config.MEDIA_OTHER_MAX_AGE_S}"
+
+
+class MediaFiles(StaticFiles):
+    """
+    /media med formatforhandling for renditions.
+
+    /media/<stem>_<size> (uten filendelse) gir WebP-varianten hvis
+    klienten sender `Accept: image/webp` og varianten finnes, ellers
+    masteren (<stem>.png/.jpg). Alle andre stier serveres som før.
+    Svaret på en forhandlet URL kan endre seg (WebP lages i etterkant
+    av backfill), så den caches kortere enn filene selv.
+
+    Gamle flate URL-er (/media/<navn>) virker også etter at filen er
+    flyttet til undermappen sin (/media/ab/cd/<navn>).
+    """
+
+    def _is_file(self, path: str):
+        try:
+            _full_path, st = self.lookup_path(path)
+        except (OSError, ValueError):
+            return None
+        if st and stat.S_ISREG(st.st_mode):
+            return path
+        return None
+
+    def _negotiate(self, path: str, webp: bool):
+        directory, name = posixpath.split(path)
+        master_stem = parse_rendition(name)
+        if master_stem is None:
+            return None
+        if webp and self._is_file(path + ".webp"):
+            return path + ".webp"
+        for ext in MASTER_EXTS:
+            cand = posixpath.join(directory, master_stem + ext)
+            if self._is_file(cand):
+                return cand
+        return None
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = media_cache_control(os.path.basename(full_path))
+        return response
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        try:
+            return await self._get_response(path, scope)
+        except HTTPException as e:
+            if e.status_code != 404 or os.sep in path:
+                raise
+            sharded = media_paths.relpath(path)
+            if sharded == path:
+                raise
+            return await self._get_response(os.path.join(*sharded.split("/")), scope)
+
+    async def _get_response(self, path: str, scope: Scope) -> Response:
+        if os.path.splitext(path)[1]:
+            return await super().get_response(path, scope)
+
+        resolved = await anyio.to_thread.run_sync(self._negotiate, path, accepts_webp(scope))
+        if resolved is None:
+            raise HTTPException(status_code=404)
+        response = await super().get_response(resolved, scope)
+        response.headers["Vary"] = "Accept"
+        response.headers["Cache-Control"] = f"public, max-age={config.MEDIA_NEGOTIATED_MAX_AGE_S}"
+        return response
+
+
+# ---------- frontend ----------
+
+COMPRESS_EXTS = (".html", ".js", ".css", ".svg", ".json", ".txt")
+# (Content-Encoding, filendelse) i foretrukket rekkefølge
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(src_dir: str, out_dir: str, min_bytes: int = config.STATIC_COMPRESS_MIN_BYTES) -> int:
+    """
+    Lag .gz (og .br) av tekstfiler under src_dir i et speilet tre under
+    out_dir. Bare filer som mangler eller er eldre enn kilden skrives.
+    Returnerer antall varianter som ble skrevet.
+    """
+    encodings = [(enc, suffix) for enc, suffix in ENCODINGS if enc != "br" or brotli is not None]
+    written = 0
+    for root, _dirs, files in os.walk(src_dir):
+        for fn in files:
+            if not fn.lower().endswith(COMPRESS_EXTS):
+                continue
+            src = os.path.join(root, fn)
+            st = os.stat(src)
+            if st.st_size < min_bytes:
+                continue
+            rel = os.path.relpath(src, src_dir)
+            data = None
+            for enc, suffix in encodings:
+                dst = os.path.join(out_dir, rel + suffix)
+                try:
+                    if os.stat(dst).st_mtime >= st.st_mtime:
+                        continue
+                except FileNotFoundError:
+                    pass
+                if data is None:
+                    with open(src, "rb") as fh:
+                        data = fh.read()
+                packed = _compress(data, enc)
+                if len(packed) >= len(data):
+                    continue
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                tmp = dst + ".tmp"
+                with open(tmp, "wb") as fh:
+                    fh.write(packed)
+                os.replace(tmp, dst)
+                written += 1
+    return written
+
+
+def _accepted_encodings(scope: Scope) -> set:
+    raw = Headers(scope=scope).get("accept-encoding", "")
+    out = set()
+    for part in raw.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            out.add(name.strip().lower())
+    return out
+
+
+class FrontendFiles(StaticFiles):
+    """
+    /static med sterke ETags og forhåndskomprimerte varianter.
+
+    ETag er sha256 av filinnholdet (med -br/-gzip for komprimerte
+    varianter), så den endres bare når innholdet gjør det – uavhengig av
+    mtime etter en ny checkout/deploy. Hashen og hvilke varianter som
+    finnes regnes ut ved oppstart (warm) og ellers i en tråd før svaret
+    lages, aldri i event-loopen.
+    """
+
+    def __init__(self, *, directory: str, precompressed_dir: Optional[str] = None, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.root = os.path.abspath(directory)
+        self.precompressed_dir = precompressed_dir
+        # full sti -> (mtime_ns, størrelse, hash, [(Content-Encoding, sti, stat), ...])
+        self._info: Dict[str, Tuple[int, int, str, List[Tuple[str, str, os.stat_result]]]] = {}
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, full_path: str, st: os.stat_result) -> Tuple[str, list]:
+        """(innholdshash, ferske komprimerte varianter), cachet på mtime og størrelse."""
+        key = os.path.abspath(full_path)
+        with self._lock:
+            hit = self._info.get(key)
+        if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            return hit[2], hit[3]
+        h = hashlib.sha256()
+        with open(full_path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 16), b""):
+                h.update(chunk)
+        digest = h.hexdigest()[:32]
+        variants = self._variants(key, st)
+        with self._lock:
+            self._info[key] = (st.st_mtime_ns, st.st_size, digest, variants)
+        return digest, variants
+
+    def _variants(self, full_path: str, st: os.stat_result) -> list:
+        if not self.precompressed_dir or not full_path.lower().endswith(COMPRESS_EXTS):
+            return []
+        rel = os.path.relpath(full_path, self.root)
+        out = []
+        for enc, suffix in ENCODINGS:
+            path = os.path.join(self.precompressed_dir, rel + suffix)
+            try:
+                vst = os.stat(path)
+            except OSError:
+                continue
+            if vst.st_mtime >= st.st_mtime:
+                out.append((enc, path, vst))
+        return out
+
+    def warm(self) -> None:
+        """Regn ut ETag og varianter for alle filer på forhånd (kalles ved oppstart)."""
+        for root, _dirs, files in os.walk(self.root):
+            for fn in files:
+                path = os.path.join(root, fn)
+                self._fingerprint(path, os.stat(path))
+
+    def _prepare(self, path: str) -> None:
+        full_path, st = self.lookup_path(path)
+        if st is not None and stat.S_ISREG(st.st_mode):
+            self._fingerprint(full_path, st)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # fyll cachen i en tråd (ny eller endret fil), så file_response bare slår opp
+        await anyio.to_thread.run_sync(self._prepare, path)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        full_path = str(full_path)
+        etag, variants = self._fingerprint(full_path, stat_result)
+        headers = {"Cache-Control": "no-cache"}
+        media_type = guess_type(full_path)[0] or "application/octet-stream"
+        path, st = full_path, stat_result
+
+        if full_path.lower().endswith(COMPRESS_EXTS):
+            headers["Vary"] = "Accept-Encoding"
+            accepted = _accepted_encodings(scope)
+            variant = next((v for v in variants if v[0] in accepted), None)
+            if variant:
+                enc, path, st = variant
+                headers["Content-Encoding"] = enc
+                etag = f"{etag}-{enc}"
+        headers["ETag"] = f'"{etag}"'
+
+        response = FileResponse(path, status_code=status_code, headers=headers,
+                                media_type=media_type, stat_result=st)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    # Byggesteg: python -m backend.static_files
+    logging.basicConfig(level=logging.INFO)
+    frontend = os.path.join(os.path.dirname(config.BASE_DIR), "frontend")
+    n = precompress(frontend, config.STATIC_CACHE_DIR)
+    logger.info(f"Komprimerte {n} varianter til {config.STATIC_CACHE_DIR}")
@@ -0,0 +1,35 @@
+# backend/tests/conftest.py
+"""
+Felles oppsett for testene: egen SQLite-database, media- og cache-mappe i
+en temp-mappe. Miljøet settes før backend importeres (config leses ved import).
+
+    python -m pytest -q backend/tests
+"""
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="looksy-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TMP, 'test.db')}",
+    "LOOKSY_MEDIA_DIR": os.path.join(_TMP, "media"),
+    "LOOKSY_CACHE_DIR": os.path.join(_TMP, "cache"),
+    "JOBS_WORKERS": "0",
+    "REMBG_LOAD": "off",
+})
+os.makedirs(os.environ["LOOKSY_MEDIA_DIR"], exist_ok=True)
+
+import pytest  # noqa: E402
+
+from backend.database import SessionLocal, init_db  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def db_ready():
+    init_db()
+    return True
+
+
+@pytest.fixture
+def db(db_ready):
+    with SessionLocal() as session:
+        yield session
@@ -0,0 +1,103 @@
+# backend/tests/test_archive_import.py
+"""
+Import av arkiv (services/archive.py): et arkiv er brukerdata. Feil i
+det gir ArchiveError (400), og filene i det stoles ikke på før innholdet
+er sjekket.
+"""
+import hashlib
+import io
+import json
+import zipfile
+
+import pytest
+from PIL import Image
+
+from backend.models import Cloth, Look
+from backend.services import archive, media_store, renditions
+
+
+def _zip(files) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in files:
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def _manifest() -> bytes:
+    return json.dumps({"format": archive.FORMAT, "version": archive.VERSION}).encode()
+
+
+@pytest.mark.parametrize("manifest", [b"{ikke json", b"[1, 2]", b'{"format": "looksy-export", "version": "x"}'])
+def test_malformed_manifest_is_archive_error(db, manifest):
+    with pytest.raises(archive.ArchiveError):
+        archive.import_archive(db, _zip([("manifest.json", manifest)]))
+
+
+def _png(color) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _webp(color) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), color).save(buf, format="WEBP")
+    return buf.getvalue()
+
+
+def _cloth_row(cloth_id: int, name: str) -> bytes:
+    return json.dumps({"id": cloth_id, "name": "Import", "category": "topp",
+                       "image_url": f"/media/{name}"}).encode()
+
+
+def test_media_names_are_checked_against_content(db):
+    honest, lying, planted = _png((1, 2, 3)), _png((4, 5, 6)), _png((7, 8, 9))
+    honest_name = f"{hashlib.sha256(honest).hexdigest()}.png"
+    # navnet til et annet bilde: dedupe ved opplasting ville stolt på det
+    stolen_name = f"{hashlib.sha256(planted).hexdigest()}.png"
+    result = archive.import_archive(db, _zip([
+        ("manifest.json", _manifest()),
+        (f"media/{honest_name}", honest),
+        (f"media/{stolen_name}", lying),
+        ("media/notat.txt", b"hei"),
+        ("media/ikke_bilde.png", b"<html>"),
+        (f"media/{renditions.rendition_filename('fremmed.png', renditions.SIZES[0])}", _webp((1, 1, 1))),
+        ("clothes/00000.ndjson", _cloth_row(9001, honest_name) + b"\n" + _cloth_row(9002, stolen_name)),
+    ]), user_id=11)
+
+    assert result["media"]["rejected"] == 3
+    assert result["media"]["renamed"] == 1
+    assert not media_store.exists(stolen_name)
+    assert media_store.filename_from_url(db.get(Cloth, 9001).image_url) == honest_name
+    moved = media_store.filename_from_url(db.get(Cloth, 9002).image_url)
+    assert moved == f"{hashlib.sha256(lying).hexdigest()}.png"
+    with open(media_store.path_for(moved), "rb") as fh:
+        assert fh.read() == lying
+
+
+def test_rows_cannot_point_at_other_users_files(db):
+    theirs = _png((20, 30, 40))
+    name = f"{hashlib.sha256(theirs).hexdigest()}.png"
+    media_store.write_atomic(name, theirs)
+    db.add(Cloth(id=9100, name="Deres", category="topp", image_url=media_store.url_for(name), user_id=12))
+    db.commit()
+    look = json.dumps({"id": 9101, "title": "Lånt", "image_url": f"/media/{name}", "render_key": "x"}).encode()
+
+    result = archive.import_archive(db, _zip([
+        ("manifest.json", _manifest()),
+        ("clothes/00000.ndjson", _cloth_row(9102, name)),
+        ("looks/00000.ndjson", look),
+    ]), user_id=11)
+    assert result["clothes"]["no_image"] == 1 and result["looks"]["no_image"] == 1
+    cloth = db.get(Cloth, 9102)
+    assert (cloth.image_url, cloth.status) == ("", "failed")
+    assert db.get(Look, 9101).image_url is None
+
+    # eieren selv kan importere rader som peker på sin egen fil
+    result = archive.import_archive(db, _zip([
+        ("manifest.json", _manifest()),
+        ("clothes/00000.ndjson", _cloth_row(9103, name)),
+    ]), user_id=12)
+    assert result["clothes"]["created"] == 1
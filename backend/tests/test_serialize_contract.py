@@ -0,0 +1,90 @@
+# backend/tests/test_serialize_contract.py
+"""
+ClothOut/LookOut er kontrakten: den raske veien (services/serialize.py,
+FAST_JSON=1) skal gi nøyaktig de samme svarene som skjemaene.
+"""
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend import config
+from backend.database import SessionLocal
+from backend.models import Cloth, Look
+from backend.schemas import LookLayout
+from backend.services import media_store, renditions, serialize
+from backend.services.media_index import index as media_index
+from backend.services.response_cache import bump_clothes
+
+USER = 7
+
+
+def _image(color) -> str:
+    """Ekte fil med renditions i MEDIA_DIR. Returnerer image_url."""
+    img = Image.new("RGBA", (600, 400), color)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    filename = f"{media_store.content_hash(buf.getvalue())}.png"
+    media_store.write_atomic(filename, buf.getvalue())
+    renditions.generate(img, media_store.path_for(filename))
+    return media_store.url_for(filename)
+
+
+@pytest.fixture(scope="module")
+def seeded(db_ready):
+    t0 = datetime(2024, 5, 1, 12, 0, 0)
+    with SessionLocal() as db:
+        shirt = Cloth(name="Skjorte", category="topp", image_url=_image((200, 10, 10, 255)),
+                      created_at=t0)
+        skirt = Cloth(name="Skjørt æøå", category="underdel", image_url=_image((10, 10, 200, 255)),
+                      created_at=t0 + timedelta(minutes=1))
+        gone = Cloth(name="Uten fil", category="sko", image_url="/media/finnes_ikke.png",
+                     created_at=t0 + timedelta(minutes=2))
+        busy = Cloth(name="Behandles", category="tilbehør", image_url=_image((0, 0, 0, 0)),
+                     status="processing", job_id=42, created_at=t0 + timedelta(minutes=3))
+        mine = Cloth(name="Min", category="topp", image_url=_image((10, 200, 10, 255)),
+                     user_id=USER, created_at=t0 + timedelta(minutes=4))
+        db.add_all([shirt, skirt, gone, busy, mine])
+        db.flush()
+        db.add_all([
+            Look(title="Hverdag", image_url=_image((255, 255, 255, 255)), clothes=[skirt, shirt],
+                 layout=LookLayout(width=600, height=800,
+                                   items=[{"cloth_id": shirt.id, "x": 0.1, "y": 0.1}]).as_dict(),
+                 created_at=t0),
+            Look(title=None, image_url=None, clothes=[], created_at=t0 + timedelta(minutes=1)),
+            Look(title="Tom", image_url="/media/look_borte.jpg", clothes=[], status="failed",
+                 created_at=t0 + timedelta(minutes=2)),
+            Look(title="Min look", image_url=None, clothes=[mine], user_id=USER,
+                 created_at=t0 + timedelta(minutes=3)),
+        ])
+        db.commit()
+    media_index.scan()
+    return True
+
+
+@pytest.fixture
+def client(seeded):
+    from backend.app import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+def test_check_contract(seeded, db):
+    assert serialize.check_contract(db) is None
+
+
+@pytest.mark.parametrize("path", ["/api/clothes/", "/api/looks/", "/api/clothes/?limit=2", "/api/looks/?limit=2"])
+@pytest.mark.parametrize("headers", [{}, {config.USER_HEADER: str(USER)}])
+def test_fast_json_matches_schemas(client, monkeypatch, path, headers):
+    bodies = {}
+    for fast in (True, False):
+        monkeypatch.setattr(config, "FAST_JSON", fast)
+        bump_clothes()                  # ikke svar fra cachen bygget med den andre veien
+        r = client.get(path, headers=headers)
+        assert r.status_code == 200
+        bodies[fast] = (r.content, r.headers.get("X-Next-Cursor"))
+    assert bodies[True][0] != b"[]"
+    assert bodies[True] == bodies[False]
@@ -0,0 +1,48 @@
+# backend/wardrobe_archive.py
+"""
+Ta backup av garderoben, eller flytt den til en annen maskin, uten å
+stoppe appen (samme arkiv som GET /api/export og POST /api/import).
+
+    python -m backend.wardrobe_archive export backup.zip
+    python -m backend.wardrobe_archive export backup.tar --user 3
+    python -m backend.wardrobe_archive import backup.zip
+
+Importen kan kjøres flere ganger: bilder som finnes hoppes over og
+radene upsertes på id. Start appen på nytt (eller vent på synken) for
+at likhetsindeksen skal få med nye plagg.
+"""
+import argparse
+import os
+import time
+
+from .database import SessionLocal, engine, init_db
+from .services import archive
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Eksporter/importer garderoben som zip eller tar.")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("path", help="arkivfilen (.zip eller .tar)")
+    parser.add_argument("--user", type=int, default=None, help="bruker-id (standard: de delte radene)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    t0 = time.perf_counter()
+    if args.action == "export":
+        fmt = "tar" if args.path.endswith(".tar") else "zip"
+        tmp = args.path + ".part"
+        with open(tmp, "wb") as fh:
+            for chunk in archive.export_archive(engine, user_id=args.user, fmt=fmt):
+                fh.write(chunk)
+        os.replace(tmp, args.path)
+        print(f"Skrev {args.path} ({os.path.getsize(args.path) / 1e6:.1f} MB) på {time.perf_counter() - t0:.1f} s.")
+        return
+
+    with SessionLocal() as db, open(args.path, "rb") as fh:
+        result = archive.import_archive(db, fh, user_id=args.user)
+    result.pop("changed_clothes")
+    print(f"Importerte {args.path} på {time.perf_counter() - t0:.1f} s: {result}")
+
+
+if __name__ == "__main__":
+    main()
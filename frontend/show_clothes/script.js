@@ -5,7 +5,7 @@ const API        = `${location.origin}/api`;
 const filtersEl  = document.getElementById("category-filters");
 const gridEl     = document.getElementById("clothes-grid");
 const openMagBtn = document.getElementById("openMagazine");
-const state = { looks: [] };
+const state = { looks: [], clothes: [], category: "", cursor: null };
 
 // cleanup any stale overlays from hot reloads
 document.querySelectorAll(".mag-overlay, .edit-popup, .lookview-overlay, .confirm-popup")
@@ -33,6 +33,20 @@ function normalizeMediaPath(u = "") {
   return fname ? `/media/${fname}` : "";
 }
 
+/** Pick a server rendition (e.g. "384") and fall back to the original. */
+function thumbSrc(item, size = "384") {
+  const r = item && item.renditions;
+  return (r && r[size]) || normalizeMediaPath((item && item.image_url) || "");
+}
+
+/** CSS for one tile of a sprite atlas (/api/clothes/atlas), scaled to the element. */
+function spriteStyle(atlas, sprite) {
+  const pos = (off, total, size) => total > size ? (off / (total - size)) * 100 : 0;
+  return `background-image:url('${atlas.image}');` +
+         `background-size:${(atlas.width / sprite.w) * 100}% ${(atlas.height / sprite.h) * 100}%;` +
+         `background-position:${pos(sprite.x, atlas.width, sprite.w)}% ${pos(sprite.y, atlas.height, sprite.h)}%;`;
+}
+
 function attachImageFallback(img) {
   let triedBasename = false, triedAbsolute = false;
   img.addEventListener("error", () => {
@@ -80,12 +94,16 @@ function confirmPopup(message) {
 // --------------------------------------------------
 // Clothes grid
 // --------------------------------------------------
-async function fetchClothes(category = "") {
-  const url = category ? `${API}/clothes/?category=${encodeURIComponent(category)}`
-                       : `${API}/clothes/`;
-  const res = await fetch(url, { credentials: "same-origin" });
-  if (!res.ok) throw new Error(`Fetch clothes failed: ${res.status}`);
-  return res.json();
+/** One atlas page: the garments plus one sprite image for all their thumbnails. */
+async function fetchAtlasPage(category = "", page = 0) {
+  const qs = new URLSearchParams({ page: String(page) });
+  if (category) qs.set("category", category);
+  const res = await fetch(`${API}/clothes/atlas?${qs}`, { credentials: "same-origin" });
+  if (!res.ok) throw new Error(`Fetch atlas failed: ${res.status}`);
+  const atlas = await res.json();
+  // each item remembers its sheet so renderClothes can draw the tile
+  atlas.items.forEach(it => { if (it.sprite && atlas.image) it.atlas = atlas; });
+  return atlas;
 }
 
 function renderClothes(items = []) {
@@ -98,11 +116,15 @@ function renderClothes(items = []) {
   }
 
   gridEl.innerHTML = items.map(item => {
-    const src = normalizeMediaPath(item.image_url || "");
+    const src = thumbSrc(item, "384");
+    const thumb = item.atlas
+      ? `<div class="product-img product-sprite"><span role="img" aria-label="${escapeHtml(item.name || "")}"
+               style="${spriteStyle(item.atlas, item.sprite)}"></span></div>`
+      : `<img class="product-img" src="${src}" alt="${escapeHtml(item.name || "")}" />`;
     return `
-      <article class="product-card" tabindex="0"
+      <article class="product-card" tabindex="0" data-src="${src}"
                data-id="${item.id}" data-name="${escapeHtml(item.name || "")}" data-category="${escapeHtml(item.category || "")}">
-        <img class="product-img" src="${src}" alt="${escapeHtml(item.name || "")}" />
+        ${thumb}
         <div class="product-info">
           <div class="product-name">${escapeHtml(item.name || "")}</div>
           <div class="product-category">${escapeHtml(item.category || "")}</div>
@@ -113,10 +135,26 @@ function renderClothes(items = []) {
   gridEl.querySelectorAll("img.product-img").forEach(attachImageFallback);
 }
 
+let loadSeq = 0;
+
 async function loadClothes(category = "") {
+  const seq = ++loadSeq;
+  state.category = category;
   try {
-    const items = await fetchClothes(category);
-    renderClothes(items);
+    // cursor first: anything committed while the pages load arrives as a change afterwards
+    const head = await fetch(`${API}/changes`, { credentials: "same-origin" }).then(r => r.ok ? r.json() : null);
+    if (head) state.cursor = head.cursor;
+    // page through the atlas: one JSON + one sprite request per page instead of one image per garment
+    const items = [];
+    for (let page = 0; page !== null; ) {
+      const atlas = await fetchAtlasPage(category, page);
+      if (seq !== loadSeq) return;
+      items.push(...atlas.items);
+      state.clothes = items;
+      renderClothes(items);
+      page = atlas.next_page;
+    }
+    watchChanges();
   } catch (err) {
     console.error("[clothes] error:", err);
     gridEl.innerHTML = `<div class="card" style="padding:1rem;"><p class="muted">Klarte ikke å hente klær akkurat nå.</p></div>`;
@@ -129,10 +167,121 @@ if (filtersEl) {
     if (!btn) return;
     const category = btn.getAttribute("data-category") || "";
     filtersEl.querySelectorAll(".chip").forEach(b => b.classList.toggle("is-active", b === btn));
+    if (searchEl) searchEl.value = "";
     loadClothes(category);
   });
 }
 
+// --------------------------------------------------
+// Live updates (/api/changes + SSE): apply small diffs instead of refetching
+// --------------------------------------------------
+const newestFirst = (a, b) =>
+  (b.created_at || "").localeCompare(a.created_at || "") || b.id - a.id;
+
+function applyClothChanges({ upserted = [], deleted = [] }) {
+  const gone = new Set(deleted);
+  let items = state.clothes.filter(c => !gone.has(c.id));
+  for (const cloth of upserted) {
+    const old = items.find(c => c.id === cloth.id);
+    items = items.filter(c => c.id !== cloth.id);
+    if (state.category && cloth.category !== state.category) continue;
+    // same image: keep drawing it from the atlas we already have
+    if (old && old.atlas && old.image_url === cloth.image_url) {
+      cloth.atlas = old.atlas; cloth.sprite = old.sprite;
+    }
+    items.push(cloth);
+  }
+  state.clothes = items.sort(newestFirst);
+  if (!searchEl || !searchEl.value.trim()) renderClothes(state.clothes);
+}
+
+function applyLookChanges({ upserted = [], deleted = [] }) {
+  if (!upserted.length && !deleted.length) return;
+  const gone = new Set(deleted);
+  let looks = state.looks.filter(l => !gone.has(l.id));
+  for (const look of upserted) {
+    const clothes = look.clothes || [];
+    const summary = {
+      ...look,
+      cloth_ids: clothes.map(c => c.id),
+      thumbnails: clothes.map(c => thumbSrc(c, "128")),
+    };
+    delete summary.clothes;
+    looks = looks.filter(l => l.id !== look.id);
+    looks.push(summary);
+  }
+  state.looks = looks.sort(newestFirst);
+  if (document.getElementById("magGrid") && state.looks.length) renderLooksGrid(state.looks);
+}
+
+function applyChanges(delta) {
+  if (state.cursor !== null && Number(delta.cursor) <= Number(state.cursor)) return;
+  state.cursor = delta.cursor;
+  applyClothChanges(delta.clothes);
+  applyLookChanges(delta.looks);
+}
+
+/** Pull what changed since our cursor (e.g. right after our own PUT/DELETE). */
+async function syncChanges() {
+  if (state.cursor === null) return loadClothes(state.category);
+  try {
+    for (let more = true; more; ) {
+      const res = await fetch(`${API}/changes?since=${encodeURIComponent(state.cursor)}`, { credentials: "same-origin" });
+      if (res.status === 410) return loadClothes(state.category);   // cursor too old: start over
+      if (!res.ok) throw new Error(`Fetch changes failed: ${res.status}`);
+      const delta = await res.json();
+      applyChanges(delta);
+      more = delta.has_more;
+    }
+  } catch (err) {
+    console.error("[changes] error:", err);
+    loadClothes(state.category);
+  }
+}
+
+// Other tabs and background jobs: the server pushes each committed change
+let changeStream = null;
+function watchChanges() {
+  if (changeStream || !("EventSource" in window) || state.cursor === null) return;
+  changeStream = new EventSource(`${API}/changes/stream?since=${encodeURIComponent(state.cursor)}`);
+  changeStream.addEventListener("changes", e => applyChanges(JSON.parse(e.data)));
+  changeStream.addEventListener("reset", () => loadClothes(state.category));
+}
+
+// --------------------------------------------------
+// Search (server-side, /api/search)
+// --------------------------------------------------
+const searchEl = document.getElementById("clothes-search");
+let searchTimer = null;
+let searchSeq = 0;
+
+async function searchClothes(q) {
+  const seq = ++searchSeq;
+  loadSeq++;   // stop a category load that is still paging
+  try {
+    const res = await fetch(`${API}/search?kind=clothes&limit=100&q=${encodeURIComponent(q)}`,
+                            { credentials: "same-origin" });
+    if (!res.ok) throw new Error(`Search failed: ${res.status}`);
+    const items = await res.json();
+    if (seq === searchSeq) renderClothes(items);   // ignore answers to older keystrokes
+  } catch (err) {
+    console.error("[clothes] search error:", err);
+  }
+}
+
+if (searchEl) {
+  searchEl.addEventListener("input", () => {
+    clearTimeout(searchTimer);
+    const q = searchEl.value.trim();
+    searchTimer = setTimeout(() => {
+      if (q) return searchClothes(q);
+      searchSeq++;
+      const activeBtn = filtersEl?.querySelector(".chip.is-active");
+      loadClothes(activeBtn?.getAttribute("data-category") || "");
+    }, 150);
+  });
+}
+
 // --------------------------------------------------
 // Edit popup for clothes (rename / category / delete)
 // --------------------------------------------------
@@ -184,9 +333,7 @@ function openEditPopup({ id, name, category, imgSrc }) {
       const res = await fetch(`${API}/clothes/${id}`, { method: "PUT", body: fd, credentials: "same-origin" });
       if (!res.ok) throw new Error(await res.text());
       close();
-      const activeBtn = filtersEl?.querySelector(".chip.is-active");
-      const cat = activeBtn ? activeBtn.getAttribute("data-category") || "" : "";
-      loadClothes(cat);
+      syncChanges();
     } catch {
       alert("Kunne ikke lagre endringer.");
     }
@@ -201,9 +348,7 @@ function openEditPopup({ id, name, category, imgSrc }) {
       const res = await fetch(`${API}/clothes/${id}`, { method: "DELETE", credentials: "same-origin" });
       if (!res.ok && res.status !== 204) throw new Error(await res.text());
       close();
-      const activeBtn = filtersEl?.querySelector(".chip.is-active");
-      const cat = activeBtn ? activeBtn.getAttribute("data-category") || "" : "";
-      loadClothes(cat);
+      syncChanges();
     } catch {
       alert("Kunne ikke slette plagget.");
     }
@@ -216,7 +361,7 @@ gridEl.addEventListener("click", (e) => {
   const id   = card.getAttribute("data-id");
   const name = card.getAttribute("data-name") || "";
   const cat  = card.getAttribute("data-category") || "topp";
-  const img  = card.querySelector("img")?.getAttribute("src") || "";
+  const img  = card.getAttribute("data-src") || "";
   openEditPopup({ id, name, category: cat, imgSrc: img });
 });
 
@@ -232,13 +377,8 @@ async function fetchLooks() {
     }
     return res.json();
   }
-  // try without trailing slash, then with
-  try {
-    return await getJson(`${API}/looks`);
-  } catch (e1) {
-    console.warn("[looks] retry with trailing slash:", e1);
-    return await getJson(`${API}/looks/`);
-  }
+  // compact list: cloth ids + thumbnails instead of full nested clothes
+  return await getJson(`${API}/looks/summary`);
 }
 
 function renderLooksGrid(looks) {
@@ -246,7 +386,7 @@ function renderLooksGrid(looks) {
   if (!grid) return;
 
   grid.innerHTML = looks.map(l => {
-    const src = normalizeMediaPath(l.image_url || "");
+    const src = thumbSrc(l, "384");
     const title = l.title || `Look #${l.id}`;
     const date  = l.created_at ? new Date(l.created_at).toLocaleDateString() : "";
     return `
@@ -284,7 +424,7 @@ function openLookEditor(look) {
   wrap.className = "edit-popup show";
   wrap.innerHTML = `
     <div class="edit-popup__content" role="dialog" aria-modal="true" aria-label="Rediger look">
-      <img class="edit-popup__img" src="${normalizeMediaPath(look.image_url || '')}" alt="" />
+      <img class="edit-popup__img" src="${thumbSrc(look, '1024')}" alt="" />
       <label class="muted" for="look-title">Tittel</label>
       <input id="look-title" class="modal__input" type="text" value="${escapeHtml(look.title || '')}" placeholder="Gi looken et navn" />
       <div class="edit-popup__actions">
@@ -45,6 +45,20 @@ function render() {
     }
   });
 }
+// Server-side renditions (WebP when supported) – fall back to the original
+function thumbSrc(cloth, size) {
+  return (cloth.renditions && cloth.renditions[size]) || cloth.image_url;
+}
+// CSS for one tile of a sprite atlas (/api/clothes/atlas), scaled to the element
+function spriteStyle(atlas, sprite) {
+  const pos = (off, total, size) => total > size ? (off / (total - size)) * 100 : 0;
+  return {
+    backgroundImage: `url('${atlas.image}')`,
+    backgroundSize: `${(atlas.width / sprite.w) * 100}% ${(atlas.height / sprite.h) * 100}%`,
+    backgroundPosition: `${pos(sprite.x, atlas.width, sprite.w)}% ${pos(sprite.y, atlas.height, sprite.h)}%`,
+    backgroundRepeat: 'no-repeat',
+  };
+}
 function pick(x,y){ for(let i=sprites.length-1;i>=0;i--){const s=sprites[i];if(x>=s.x&&x<=s.x+s.w&&y>=s.y&&y<=s.y+s.h)return i;} return -1; }
 function toLocal(e){ const r=canvas.getBoundingClientRect(); return {x:e.clientX-r.left,y:e.clientY-r.top}; }
 
@@ -62,16 +76,24 @@ function addSpriteFromCloth(cloth) {
     hintEl.style.display = 'none';
     render();
   };
-  img.src = cloth.image_url;
+  img.src = thumbSrc(cloth, '1024');
 }
 
 function makeClothCard(cloth) {
   const wrap = document.createElement('div');
   wrap.className = 'looks__card';
-  const img = document.createElement('img');
+  let img;
+  if (cloth.atlas) {
+    img = document.createElement('div');
+    img.setAttribute('role', 'img');
+    img.setAttribute('aria-label', cloth.name || `Plagg #${cloth.id}`);
+    Object.assign(img.style, spriteStyle(cloth.atlas, cloth.sprite));
+  } else {
+    img = document.createElement('img');
+    img.src = thumbSrc(cloth, '384');
+    img.alt = cloth.name || `Plagg #${cloth.id}`;
+  }
   img.className = 'looks__thumb';
-  img.src = cloth.image_url;
-  img.alt = cloth.name || `Plagg #${cloth.id}`;
   const title = document.createElement('div');
   title.className = 'looks__cardTitle';
   title.textContent = cloth.name || `Plagg #${cloth.id}`;
@@ -84,19 +106,29 @@ function makeClothCard(cloth) {
 }
 
 // ---------- Data ----------
-async function fetchClothes(category='') {
-  const url = category ? `${CLOTHES_EP}/?category=${encodeURIComponent(category)}` : CLOTHES_EP;
-  const res = await fetch(url);
+// One atlas page: the garments + one sprite sheet (small tiles) for all thumbnails
+async function fetchAtlasPage(category='', page=0) {
+  const qs = new URLSearchParams({ page: String(page), tile: '128' });
+  if (category) qs.set('category', category);
+  const res = await fetch(`${CLOTHES_EP}/atlas?${qs}`);
   if (!res.ok) throw new Error(await res.text());
-  return await res.json();
+  const atlas = await res.json();
+  atlas.items.forEach(it => { if (it.sprite && atlas.image) it.atlas = atlas; });
+  return atlas;
 }
 
+let loadSeq = 0;
+
 async function loadClothes(category='') {
+  const seq = ++loadSeq;
   try {
-    const items = await fetchClothes(category);
-    console.log('Fetched clothes:', items);
     listEl.innerHTML = '';
-    items.forEach(it => listEl.appendChild(makeClothCard(it)));
+    for (let page = 0; page !== null; ) {
+      const atlas = await fetchAtlasPage(category, page);
+      if (seq !== loadSeq) return;
+      atlas.items.forEach(it => listEl.appendChild(makeClothCard(it)));
+      page = atlas.next_page;
+    }
   } catch (err) {
     console.error('loadClothes() error:', err);
     listEl.innerHTML = '<p class="muted" style="padding:12px;">Kunne ikke hente plagg.</p>';
@@ -162,9 +194,20 @@ btnSave.addEventListener('click', async () => {
   const title = (titleEl.value || '').trim() || null;
   const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.92));
   const ids = [...new Set(sprites.map(s => s.id))];
+  // Plasseringen som andeler av lerretet, så serveren kan tegne looken på nytt
+  const rect = canvas.getBoundingClientRect();
+  const layout = {
+    width: Math.round(rect.width),
+    height: Math.round(rect.height),
+    background: '#ffffff',
+    items: sprites.map((s, z) => ({
+      cloth_id: s.id, x: s.x / rect.width, y: s.y / rect.height, scale: s.w / rect.width, z,
+    })),
+  };
   const fd = new FormData();
   fd.append('file', blob, 'look.jpg');
   fd.append('cloth_ids', JSON.stringify(ids));
+  fd.append('layout', JSON.stringify(layout));
   if (title) fd.append('title', title);
   try {
     const r = await fetch(LOOKS_EP, { method: 'POST', body: fd });
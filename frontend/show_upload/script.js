@@ -143,6 +143,20 @@ const UTIL   = ORIGIN;
     }
   });
 
+  // --- Vent på jobbkøen (GET /api/jobs/{id}?wait=) ---
+  async function waitForJob(jobId, maxTries = 10) {
+    for (let i = 0; i < maxTries; i++) {
+      const res = await fetch(`${API}/jobs/${jobId}?wait=10`);
+      if (!res.ok) return null;
+      const job = await res.json();
+      if (job.pipeline.status === 'done' || job.pipeline.status === 'failed') return job;
+      if (job.progress.total) {
+        statusP.textContent = `Lagret – behandler bildet (${job.progress.done}/${job.progress.total})…`;
+      }
+    }
+    return null;
+  }
+
   // --- Save (POST /api/clothes/) ---
   saveBtn.addEventListener('click', async () => {
     if (!processedBlob) { alert('Kjør bakgrunnsfjerner først.'); return; }
@@ -176,6 +190,15 @@ const UTIL   = ORIGIN;
       }
 
       const data = await res.json();
+      if (data.status === 'processing' && data.job_id) {
+        statusP.textContent = 'Lagret – behandler bildet…';
+        const job = await waitForJob(data.job_id);
+        if (job && job.pipeline.status === 'failed') {
+          alert(`Bildet kunne ikke behandles.\n${job.pipeline.error || ''}`);
+          statusP.textContent = '';
+          return;
+        }
+      }
       statusP.textContent = `✅ Lagret! ID: ${data.id}. Går til «Se klær»…`;
       setTimeout(() => { window.location.href = '/clothes'; }, 1200);
     } catch (err) {